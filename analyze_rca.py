@@ -1,71 +1,606 @@
 import cv2
 import base64
 import os
-from groq import Groq
+import numpy as np
 from PIL import Image
 import io
 from dotenv import load_dotenv
-import requests
 import json
+import time
+import itertools
+import tempfile
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from rca_cache import cache_key, get_cache
+from rca_clients import get_groq_client
+from plantuml_render import get_backends
+from rca_schema import RootCauseAnalysis, DIAGRAM_BUILDERS
+import rca_metrics as metrics
+import rca_routing as routing
+import rca_trace as trace
+from resilience import (call_with_retry, call_with_timeout, hedged_call, hedge_threshold, is_timeout, remaining,
+                        DeadlineExceeded, HEDGE_REQUESTS)
+from quality_gate import ImageRejected
+from video_keyframes import select_keyframes, format_timestamp, MAX_KEYFRAMES, VIDEO_EXTENSIONS
 
 # Load environment variables
 load_dotenv()
 
-# Note: Client will be initialized with API key in each function call
-
-def process_image(image_path):
-    """Simple image processing"""
-    img = cv2.imread(image_path)
-
-    # Check if image loaded correctly
-    if img is None:
-        print(f"Error: Could not open or find the image: {image_path}")
-        exit(1)
+# Note: Clients are pooled per API key in rca_clients and reused across calls
+# Models are chosen per stage by rca_routing
+
+ANALYSIS_PROMPT = "Analyze this workplace image for Root Cause Analysis. Identify problems, assess their severity (Critical/High/Medium/Low), determine immediate causes and potential root causes. Focus on safety hazards, operational inefficiencies, quality issues, and maintenance problems. Provide a detailed analysis with severity classifications."
+
+# Payload budget for the vision request: pixel count of the sent image and size of the
+# encoded bytes before base64. 800x600 keeps the previous default resolution
+MAX_PIXELS = 800 * 600
+MAX_IMAGE_BYTES = 200 * 1024
+IMAGE_FORMAT = "jpeg"
+MIN_QUALITY = 40
+MAX_QUALITY = 90
+
+# Tiled mode: overlapping tiles of about the request's pixel budget, so they are sent at native resolution
+TILE_PIXELS = MAX_PIXELS
+TILE_OVERLAP = 0.15
+MAX_TILES = 12
+
+IMAGE_ENCODERS = {
+    "jpeg": (".jpg", cv2.IMWRITE_JPEG_QUALITY, "image/jpeg"),
+    "webp": (".webp", cv2.IMWRITE_WEBP_QUALITY, "image/webp"),
+}
+
+# Browser previews of uploads and diagrams: longest side, format and quality. Full resolution
+# is only sent when asked for or downloaded
+PREVIEW_SIZE = int(os.getenv("RCA_PREVIEW_SIZE", "1280"))
+PREVIEW_FORMAT = os.getenv("RCA_PREVIEW_FORMAT", "webp")
+PREVIEW_QUALITY = 80
+
+REDUCED_DECODE_FLAGS = [
+    (8, cv2.IMREAD_REDUCED_COLOR_8),
+    (4, cv2.IMREAD_REDUCED_COLOR_4),
+    (2, cv2.IMREAD_REDUCED_COLOR_2),
+]
+
+def read_image_bytes(image):
+    """Return the encoded bytes of an image given as bytes, a buffer or a file path"""
+    if isinstance(image, (bytes, bytearray, memoryview)):
+        return bytes(image)
+    if hasattr(image, 'getvalue'):
+        return image.getvalue()
+    if hasattr(image, 'read'):
+        return image.read()
+    with open(image, 'rb') as f:
+        return f.read()
+
+def fit_size(width, height, max_pixels=MAX_PIXELS):
+    """Largest size within max_pixels that keeps the aspect ratio, never upscaling"""
+    scale = min(1.0, (max_pixels / float(width * height)) ** 0.5)
+    return max(1, int(width * scale)), max(1, int(height * scale))
+
+def reduced_decode_flag(image_bytes, max_pixels=MAX_PIXELS):
+    """Pick the strongest IMREAD_REDUCED_* flag that still covers the pixel budget"""
+    try:
+        # PIL only parses the header here, the pixels are not decoded
+        width, height = Image.open(io.BytesIO(image_bytes)).size
+    except Exception:
+        return cv2.IMREAD_COLOR
+
+    target_width, target_height = fit_size(width, height, max_pixels)
+    for factor, flag in REDUCED_DECODE_FLAGS:
+        if width // factor >= target_width and height // factor >= target_height:
+            return flag
+    return cv2.IMREAD_COLOR
+
+def decode_image(image, max_pixels=MAX_PIXELS):
+    """Decode an in-memory image at the smallest resolution that covers max_pixels.
+    An already decoded BGR array (e.g. a tile) is returned as is"""
+    if isinstance(image, np.ndarray):
+        return image
+    image_bytes = read_image_bytes(image)
+    with trace.span("decode", bytes=len(image_bytes)) as span:
+        flag = reduced_decode_flag(image_bytes, max_pixels)
+        img = cv2.imdecode(np.frombuffer(image_bytes, dtype=np.uint8), flag)
+
+        # Check if image decoded correctly
+        if img is None:
+            raise ValueError("Could not decode the uploaded image. Please provide a valid image file.")
+        span.set(width=img.shape[1], height=img.shape[0], reduced=flag != cv2.IMREAD_COLOR)
+
+    return img
+
+def encode_image(img, max_bytes=MAX_IMAGE_BYTES, image_format=IMAGE_FORMAT,
+                 min_quality=MIN_QUALITY, max_quality=MAX_QUALITY):
+    """Encode at the highest quality that fits max_bytes, shrinking the image if even
+    min_quality does not fit. Returns the encoded buffer and the chosen settings"""
+    if image_format not in IMAGE_ENCODERS:
+        raise ValueError(f"Unsupported image format: {image_format}")
+    extension, quality_flag, mime_type = IMAGE_ENCODERS[image_format]
+    span = trace.start_span("encode", format=image_format, max_bytes=max_bytes)
+    attempts = 0
+
+    while True:
+        # Binary search the quality, encoded size grows with quality
+        best = None
+        low, high = min_quality, max_quality
+        while low <= high:
+            quality = (low + high) // 2
+            attempts += 1
+            _, buffer = cv2.imencode(extension, img, [quality_flag, quality])
+            if len(buffer) <= max_bytes:
+                best = (quality, buffer)
+                low = quality + 1
+            else:
+                high = quality - 1
+
+        if best is not None or min(img.shape[:2]) <= 64:
+            break
+        img = cv2.resize(img, None, fx=0.75, fy=0.75, interpolation=cv2.INTER_AREA)
+
+    if best is None:
+        # Smallest sensible image still does not fit, send it at the lowest quality
+        _, buffer = cv2.imencode(extension, img, [quality_flag, min_quality])
+        best = (min_quality, buffer)
+
+    quality, buffer = best
+    settings = {
+        "format": image_format,
+        "mime_type": mime_type,
+        "quality": quality,
+        "width": img.shape[1],
+        "height": img.shape[0],
+        "bytes": len(buffer),
+        "max_bytes": max_bytes,
+        "fits_budget": len(buffer) <= max_bytes,
+    }
+    span.end(quality=quality, width=settings["width"], height=settings["height"], bytes=len(buffer), attempts=attempts)
+    return buffer, settings
+
+def prepare_image(image, max_bytes=MAX_IMAGE_BYTES, max_pixels=MAX_PIXELS, image_format=IMAGE_FORMAT):
+    """Decode, resize to the pixel budget and encode to the byte budget.
+    Returns the base64 payload and the chosen encoder settings"""
+    img = decode_image(image, max_pixels)
+    width, height = fit_size(img.shape[1], img.shape[0], max_pixels)
+    if (width, height) != (img.shape[1], img.shape[0]):
+        with trace.span("resize", from_width=img.shape[1], from_height=img.shape[0], width=width, height=height):
+            img = cv2.resize(img, (width, height), interpolation=cv2.INTER_AREA)
+
+    buffer, settings = encode_image(img, max_bytes, image_format)
+    with trace.span("base64", bytes=len(buffer)) as span:
+        payload = base64.b64encode(buffer).decode()
+        span.set(base64_bytes=len(payload))
+    return payload, settings
+
+def process_image(image, max_bytes=MAX_IMAGE_BYTES, max_pixels=MAX_PIXELS, image_format=IMAGE_FORMAT):
+    """Simple image processing from bytes, a buffer or a file path"""
+    base64_image, _ = prepare_image(image, max_bytes, max_pixels, image_format)
+    return base64_image
+
+def get_analysis_cache():
+    """On-disk cache of analyze_workplace results"""
+    return get_cache("analysis")
+
+def get_preview_cache():
+    """On-disk cache of downscaled previews, keyed on the original's content and the preview settings"""
+    return get_cache("previews", max_bytes=64 * 1024 * 1024)
+
+def make_preview(image, max_side=PREVIEW_SIZE, image_format=PREVIEW_FORMAT, quality=PREVIEW_QUALITY, use_cache=True):
+    """Downscaled copy of an encoded image (upload or rendered diagram) for display, as (bytes, mime type).
+    Each distinct image is decoded and resized once, repeats come from the preview cache"""
+    if image_format not in IMAGE_ENCODERS:
+        raise ValueError(f"Unsupported image format: {image_format}")
+    extension, quality_flag, mime_type = IMAGE_ENCODERS[image_format]
+    image_bytes = read_image_bytes(image)
+    key = cache_key("preview", image_bytes, str(max_side), image_format, str(quality))
+    cache = get_preview_cache() if use_cache else None
+    if cache is not None:
+        cached = cache.get(key)
+        if cached is not None:
+            return cached, mime_type
+
+    with trace.span("preview", bytes=len(image_bytes), format=image_format) as span:
+        # Large JPEGs are decoded at a reduced scale straight away
+        img = decode_image(image_bytes, max_pixels=max_side * max_side)
+        height, width = img.shape[:2]
+        scale = min(1.0, max_side / float(max(width, height)))
+        if scale < 1.0:
+            img = cv2.resize(img, (max(1, int(width * scale)), max(1, int(height * scale))),
+                             interpolation=cv2.INTER_AREA)
+        _, buffer = cv2.imencode(extension, img, [quality_flag, quality])
+        preview = buffer.tobytes()
+        span.set(width=img.shape[1], height=img.shape[0], preview_bytes=len(preview))
+
+    if cache is not None:
+        cache.put(key, preview)
+    return preview, mime_type
+
+def analysis_messages(base64_image, mime_type):
+    """Chat messages for the vision analysis request"""
+    return [{
+        "role": "user",
+        "content": [
+            {"type": "text", "text": ANALYSIS_PROMPT},
+            {"type": "image_url", "image_url": {"url": f"data:{mime_type};base64,{base64_image}"}}
+        ]
+    }]
+
+def stream_usage(chunk):
+    """Token usage carried by a streamed chunk (Groq sends it on the last one), if any"""
+    usage = getattr(chunk, "usage", None)
+    if usage is None and getattr(chunk, "x_groq", None) is not None:
+        usage = getattr(chunk.x_groq, "usage", None)
+    return usage
+
+def stream_chat(messages, api_key=None, rate_limiter=None, stage="chat", deadline=None, hedge=None, report=None,
+                **options):
+    """Stream a Groq chat completion, yielding text deltas as they arrive.
+    The model is picked for the stage by rca_routing; when the route has a fallback and the first
+    chunk does not arrive within its timeout, the request is sent to the fallback model once.
+    The routing decision is stored in report["routes"][stage] when a report dict is given.
+    Opening the stream is retried with jittered backoff (honouring Retry-After) until the first
+    chunk arrives, within an optional deadline in seconds. With hedging on, a duplicate request
+    is started when the first chunk is slower than the stage's recent p95.
+    Every call is recorded in rca_metrics under `stage`. Extra options
+    (e.g. response_format) are passed through to the request"""
+    # Get the pooled Groq client for the provided API key
+    if not api_key:
+        raise ValueError("API key is required. Please provide a valid Groq API key.")
 
-    img = cv2.resize(img, (800, 600))
-    _, buffer = cv2.imencode('.jpg', img)
-    return base64.b64encode(buffer).decode()
+    client = get_groq_client(api_key)
+    deadline_at = time.monotonic() + deadline if deadline else None
+    payload_bytes = len(json.dumps(messages))
+    decision = routing.route(stage, payload_bytes)
+    if report is not None:
+        report.setdefault("routes", {})[stage] = decision
+
+    def open_stream(model):
+        if rate_limiter is not None:
+            rate_limiter.acquire()
+        request_options = dict(options)
+        if deadline_at is not None:
+            request_options["timeout"] = max(0.1, remaining(deadline_at))
+        stream = client.chat.completions.create(model=model, messages=messages, stream=True, **request_options)
+        chunks = iter(stream)
+        return stream, next(chunks, None), chunks
+
+    use_hedge = HEDGE_REQUESTS if hedge is None else hedge
+    hedge_after = hedge_threshold(stage) if use_hedge else None
+
+    def open_routed(model, timeout):
+        # With a timeout there is a fallback waiting, a timed out attempt is not retried on the same model.
+        # The timeout only bounds the wait for the first chunk, later reads keep the client's read timeout
+        close = lambda opened: opened[0].close()
+        return call_with_retry(
+            lambda: call_with_timeout(lambda: hedged_call(lambda: open_stream(model), hedge_after, discard=close),
+                                      timeout, discard=close),
+            deadline=deadline_at, stage=stage, give_up=is_timeout if timeout is not None else None
+        )
+
+    with metrics.measure(stage, model=decision["model"], route=decision["reason"], payload_bytes=payload_bytes) as call:
+        # Spans here are started and ended by hand because they stay open across yields
+        request_span = trace.start_span("request", stage=stage, model=decision["model"], route=decision["reason"],
+                                        payload_bytes=payload_bytes)
+        start = time.perf_counter()
+        try:
+            try:
+                stream, first, chunks = open_routed(decision["model"], decision["timeout"])
+            except Exception as e:
+                if not decision["fallback"] or not is_timeout(e):
+                    raise
+                metrics.record(stage, model=decision["model"], route=decision["reason"], outcome="timeout",
+                               error=str(e), wall_seconds=time.perf_counter() - start, payload_bytes=payload_bytes)
+                decision.update(model=decision["fallback"], fallback_from=decision["model"], reason="timeout fallback")
+                call.update(model=decision["model"], route=decision["reason"], fallback_from=decision["fallback_from"])
+                request_span.set(model=decision["model"], route=decision["reason"], fallback_from=decision["fallback_from"])
+                # Time to first byte is the fallback model's own, it feeds that model's timeout
+                start = time.perf_counter()
+                stream, first, chunks = open_routed(decision["model"], None)
+        except Exception as e:
+            request_span.end(error=str(e))
+            raise
+        call["ttfb_seconds"] = time.perf_counter() - start
+        request_span.end()
+
+        response_span = trace.start_span("response", stage=stage, model=decision["model"])
+        completion_chars = 0
+        try:
+            for chunk in itertools.chain([first] if first is not None else [], chunks):
+                if deadline_at is not None and remaining(deadline_at) <= 0:
+                    stream.close()
+                    raise DeadlineExceeded(f"{stage} call exceeded its {deadline}s deadline")
+                usage = stream_usage(chunk)
+                if usage is not None:
+                    call["prompt_tokens"] = usage.prompt_tokens
+                    call["completion_tokens"] = usage.completion_tokens
+                if chunk.choices and chunk.choices[0].delta.content:
+                    completion_chars += len(chunk.choices[0].delta.content)
+                    yield chunk.choices[0].delta.content
+        except BaseException as e:
+            response_span.end(error="cancelled" if isinstance(e, GeneratorExit) else str(e), response_bytes=completion_chars)
+            raise
+        call["response_bytes"] = completion_chars
+        response_span.end(response_bytes=completion_chars, prompt_tokens=call.get("prompt_tokens"),
+                          completion_tokens=call.get("completion_tokens"))
+
+def stream_prompt(prompt, api_key=None, rate_limiter=None, stage="chat", report=None):
+    """Stream the completion of a text-only prompt"""
+    return stream_chat([{"role": "user", "content": prompt}], api_key, rate_limiter, stage, report=report)
+
+def complete_prompt(prompt, api_key=None, rate_limiter=None, stage="chat", report=None):
+    """Complete a text-only prompt and return the full response text"""
+    return "".join(stream_prompt(prompt, api_key, rate_limiter, stage, report))
+
+def screen_image(img, quality_gate, report=None, label=None):
+    """Run the local quality gate on a decoded image, raising ImageRejected before any LLM call"""
+    result = quality_gate.check(img, label)
+    if report is not None:
+        report["quality"] = result
+    if result["status"] == "rejected":
+        raise ImageRejected(result)
+    return result
+
+def analyze_workplace_stream(image, api_key=None, max_bytes=MAX_IMAGE_BYTES, max_pixels=MAX_PIXELS,
+                             image_format=IMAGE_FORMAT, report=None, use_cache=True, rate_limiter=None,
+                             quality_gate=None):
+    """Stream the workplace analysis as events as the work actually happens:
+    {"type": "stage", "stage": ...} when a stage starts, {"type": "token", "text": ...} per text delta
+    and a final {"type": "done", "text": ...} with the complete report.
+    With a quality_gate, unusable images raise ImageRejected before the request is made"""
+    timings = {}
+    if report is not None:
+        report["timings"] = timings
 
-def analyze_workplace(image_path, api_key=None):
-    """Analyze workplace image for Root Cause Analysis"""
     # Process image
-    base64_image = process_image(image_path)
+    yield {"type": "stage", "stage": "preprocess"}
+    start = time.perf_counter()
+    img = decode_image(image, max_pixels)
+    if quality_gate is not None:
+        with trace.span("quality") as span:
+            span.set(status=screen_image(img, quality_gate, report, image if isinstance(image, str) else None)["status"])
+        timings["quality"] = time.perf_counter() - start
+    base64_image, image_settings = prepare_image(img, max_bytes, max_pixels, image_format)
+    timings["preprocess"] = time.perf_counter() - start
+    if report is not None:
+        report["image"] = image_settings
+
+    # Identical normalized image, model and prompt give the same analysis, skip the paid call
+    model = routing.route("analysis")["model"]
+    key = cache_key(base64_image, model, ANALYSIS_PROMPT)
+    if use_cache:
+        with trace.span("cache", cache="analysis") as span:
+            cached = get_analysis_cache().get(key)
+            span.set(hit=cached is not None)
+        if report is not None:
+            report["cache"] = "hit" if cached is not None else "miss"
+        if cached is not None:
+            text = cached.decode("utf-8")
+            metrics.record("analysis", model=model, outcome="cache", wall_seconds=0.0, response_bytes=len(cached))
+            yield {"type": "token", "text": text}
+            yield {"type": "done", "text": text}
+            return
 
-    # Initialize Groq client with provided API key
+    # Send to Groq
+    yield {"type": "stage", "stage": "request"}
+    start = time.perf_counter()
+    chunks = []
+    messages = analysis_messages(base64_image, image_settings["mime_type"])
+    for delta in stream_chat(messages, api_key, rate_limiter, stage="analysis", report=report):
+        if not chunks:
+            timings["first_token"] = time.perf_counter() - start
+            yield {"type": "stage", "stage": "generating"}
+        chunks.append(delta)
+        yield {"type": "token", "text": delta}
+    timings["analysis"] = time.perf_counter() - start
+
+    analysis_text = "".join(chunks)
+    if use_cache and analysis_text:
+        get_analysis_cache().put(key, analysis_text)
+    yield {"type": "done", "text": analysis_text}
+
+def analyze_workplace(image, api_key=None, max_bytes=MAX_IMAGE_BYTES, max_pixels=MAX_PIXELS,
+                      image_format=IMAGE_FORMAT, report=None, use_cache=True, rate_limiter=None,
+                      quality_gate=None):
+    """Analyze workplace image (bytes, buffer or path) for Root Cause Analysis.
+    If a report dict is passed, the chosen image encoder settings, quality gate result,
+    cache outcome and stage timings are stored in it. rate_limiter.acquire() is called before a Groq request"""
+    for event in analyze_workplace_stream(image, api_key, max_bytes, max_pixels, image_format,
+                                          report, use_cache, rate_limiter, quality_gate):
+        if event["type"] == "done":
+            return event["text"]
+
+def merge_prompt(sections):
+    """Prompt combining several partial analyses of one workplace into a single report"""
+    parts = "\n\n".join(f"--- {label} ---\n{text}" for label, text in sections)
+    return f"""The following are Root Cause Analyses of different views of the same workplace. Views can overlap, so the same problem may appear in several of them.
+
+{parts}
+
+Combine them into ONE Root Cause Analysis report. Merge findings that describe the same problem into a single finding, keep every distinct problem, and order the findings by severity (Critical, High, Medium, Low). For each finding give the severity, immediate cause, potential root cause and recommended action, and mention which views it was seen in."""
+
+def merge_analyses(sections, api_key=None, rate_limiter=None, report=None):
+    """Stream one merged report from (label, analysis_text) sections as text deltas"""
+    if len(sections) == 1:
+        yield sections[0][1]
+        return
+    yield from stream_prompt(merge_prompt(sections), api_key, rate_limiter, stage="merge", report=report)
+
+@contextmanager
+def video_file(video, suffix=".mp4"):
+    """Path to the video for cv2.VideoCapture, which cannot read from memory;
+    uploaded bytes or buffers are spilled to a temporary file for the duration"""
+    if isinstance(video, (str, os.PathLike)):
+        yield os.fspath(video)
+        return
+    data = video.getvalue() if hasattr(video, "getvalue") else video.read() if hasattr(video, "read") else video
+    handle = tempfile.NamedTemporaryFile(suffix=suffix, delete=False)
+    try:
+        with handle:
+            handle.write(data)
+        yield handle.name
+    finally:
+        os.remove(handle.name)
+
+def analyze_video_stream(video, api_key=None, max_keyframes=MAX_KEYFRAMES, max_workers=4, suffix=".mp4",
+                         max_bytes=MAX_IMAGE_BYTES, max_pixels=MAX_PIXELS, image_format=IMAGE_FORMAT,
+                         report=None, use_cache=True, rate_limiter=None):
+    """Analyze a walk-through video as events: keyframes are selected by scene change, each one is
+    analyzed concurrently like a still image, and the findings are merged into one report.
+    Yields stage events ("keyframes", "request", "merging"), {"type": "keyframe", ...} as each
+    keyframe analysis finishes, token events for the merged report and a final done event"""
     if not api_key:
         raise ValueError("API key is required. Please provide a valid Groq API key.")
-
-    client = Groq(api_key=api_key)
-
-    # Send to Groq
-    response = client.chat.completions.create(
-        model="meta-llama/llama-4-scout-17b-16e-instruct",
-        messages=[{
-            "role": "user",
-            "content": [
-                {"type": "text", "text": "Analyze this workplace image for Root Cause Analysis. Identify problems, assess their severity (Critical/High/Medium/Low), determine immediate causes and potential root causes. Focus on safety hazards, operational inefficiencies, quality issues, and maintenance problems. Provide a detailed analysis with severity classifications."},
-                {"type": "image_url", "image_url": {"url": f"data:image/jpeg;base64,{base64_image}"}}
-            ]
-        }]
-    )
-
-    return response.choices[0].message.content
-
-def generate_analysis_mindmap(analysis_text, api_key=None):
-    """Generate PlantUML mind map documenting Root Cause Analysis findings"""
-
-    # Initialize Groq client with provided API key
+    timings = {}
+    if report is not None:
+        report["timings"] = timings
+
+    yield {"type": "stage", "stage": "keyframes"}
+    start = time.perf_counter()
+    video_stats = {}
+    with video_file(video, suffix) as path, trace.span("keyframes") as span:
+        keyframes = select_keyframes(path, max_keyframes, stats=video_stats)
+        span.set(**video_stats)
+    timings["keyframes"] = time.perf_counter() - start
+    if not keyframes:
+        raise ValueError("No frames could be decoded from the video.")
+    if report is not None:
+        report["video"] = video_stats
+        report["keyframes"] = [{key: value for key, value in keyframe.items() if key != "image"}
+                               for keyframe in keyframes]
+        # Keyframes are analyzed without a report of their own, they all take the analysis route
+        report.setdefault("routes", {})["analysis"] = routing.route("analysis")
+
+    yield {"type": "stage", "stage": "request"}
+    start = time.perf_counter()
+    analyses = {}
+    with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(keyframes)))) as executor:
+        futures = {
+            executor.submit(trace.wrap(analyze_workplace), keyframe["image"], api_key, max_bytes, max_pixels,
+                            image_format, None, use_cache, rate_limiter): number
+            for number, keyframe in enumerate(keyframes)
+        }
+        for future in as_completed(futures):
+            number = futures[future]
+            analyses[number] = future.result()
+            yield {"type": "keyframe", "timestamp": keyframes[number]["timestamp"],
+                   "completed": len(analyses), "total": len(keyframes)}
+    timings["analysis"] = time.perf_counter() - start
+
+    yield {"type": "stage", "stage": "merging"}
+    start = time.perf_counter()
+    sections = [(f"Keyframe at {format_timestamp(keyframe['timestamp'])}", analyses[number])
+                for number, keyframe in enumerate(keyframes)]
+    chunks = []
+    for delta in merge_analyses(sections, api_key, rate_limiter, report):
+        chunks.append(delta)
+        yield {"type": "token", "text": delta}
+    timings["merge"] = time.perf_counter() - start
+    yield {"type": "done", "text": "".join(chunks)}
+
+def analyze_video(video, api_key=None, max_keyframes=MAX_KEYFRAMES, max_workers=4, suffix=".mp4",
+                  report=None, use_cache=True, rate_limiter=None):
+    """Analyze a video (path, bytes or buffer) and return the merged Root Cause Analysis"""
+    for event in analyze_video_stream(video, api_key, max_keyframes, max_workers, suffix,
+                                      report=report, use_cache=use_cache, rate_limiter=rate_limiter):
+        if event["type"] == "done":
+            return event["text"]
+
+def tile_count(total, size, overlap):
+    if size >= total:
+        return 1
+    return int(np.ceil((total - size) / (size * (1 - overlap)))) + 1
+
+def tile_grid(width, height, tile_pixels=TILE_PIXELS, overlap=TILE_OVERLAP, max_tiles=MAX_TILES):
+    """Overlapping (x, y, w, h) tiles covering the image, each about tile_pixels in 4:3.
+    Tiles grow (and get downscaled when sent) when covering the image would take more than max_tiles"""
+    scale = 1.0
+    while True:
+        tile_width = min(width, int((tile_pixels * 4 / 3) ** 0.5 * scale))
+        tile_height = min(height, int((tile_pixels * 3 / 4) ** 0.5 * scale))
+        columns = tile_count(width, tile_width, overlap)
+        rows = tile_count(height, tile_height, overlap)
+        if columns * rows <= max_tiles:
+            break
+        scale *= 1.1
+
+    # Spread the tiles evenly, the last one ends exactly at the image edge
+    xs = [round(i * (width - tile_width) / (columns - 1)) if columns > 1 else 0 for i in range(columns)]
+    ys = [round(i * (height - tile_height) / (rows - 1)) if rows > 1 else 0 for i in range(rows)]
+    return [(x, y, tile_width, tile_height) for y in ys for x in xs]
+
+def analyze_tiled_stream(image, api_key=None, max_tiles=MAX_TILES, max_workers=4, overview=True,
+                         max_bytes=MAX_IMAGE_BYTES, max_pixels=MAX_PIXELS, image_format=IMAGE_FORMAT,
+                         report=None, use_cache=True, rate_limiter=None, quality_gate=None):
+    """Analyze a large image as overlapping full-resolution tiles, at most max_workers requests at a
+    time, and merge the tile findings into one severity-ordered report. With overview on, a
+    downscaled copy of the whole scene is analyzed alongside for context.
+    Images that fit in a single tile are analyzed normally. Yields the same events as
+    analyze_workplace_stream plus {"type": "tile", ...} as each tile analysis finishes"""
     if not api_key:
         raise ValueError("API key is required. Please provide a valid Groq API key.")
-
-    client = Groq(api_key=api_key)
-
-    # Ask Groq to generate PlantUML code based on the analysis
-    response = client.chat.completions.create(
-        model="meta-llama/llama-4-scout-17b-16e-instruct",
-        messages=[{
-            "role": "user",
-            "content": f"""Based on this workplace Root Cause Analysis, generate a PlantUML mind map organized by severity levels.
+    timings = {}
+
+    yield {"type": "stage", "stage": "tiling"}
+    start = time.perf_counter()
+    image_bytes = read_image_bytes(image)
+    with trace.span("decode", bytes=len(image_bytes), reduced=False) as span:
+        img = cv2.imdecode(np.frombuffer(image_bytes, dtype=np.uint8), cv2.IMREAD_COLOR)
+        if img is None:
+            raise ValueError("Could not decode the uploaded image. Please provide a valid image file.")
+        span.set(width=img.shape[1], height=img.shape[0])
+    if quality_gate is not None:
+        # Gate the whole image once, individual tiles may legitimately be dark or plain
+        screen_image(img, quality_gate, report, image if isinstance(image, str) else None)
+    height, width = img.shape[:2]
+    boxes = tile_grid(width, height, max_pixels, max_tiles=max_tiles)
+    if len(boxes) == 1:
+        yield from analyze_workplace_stream(img, api_key, max_bytes, max_pixels, image_format,
+                                            report, use_cache, rate_limiter)
+        return
+
+    parts = [("Whole scene overview", img)] if overview else []
+    parts += [(f"Tile at x={x}, y={y} ({w}x{h}px of {width}x{height}px)", img[y:y + h, x:x + w])
+              for x, y, w, h in boxes]
+    timings["tiling"] = time.perf_counter() - start
+    if report is not None:
+        report["timings"] = timings
+        report["tiles"] = [{"x": x, "y": y, "width": w, "height": h} for x, y, w, h in boxes]
+        report.setdefault("routes", {})["analysis"] = routing.route("analysis")
+
+    yield {"type": "stage", "stage": "request"}
+    start = time.perf_counter()
+    analyses = {}
+    with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(parts)))) as executor:
+        futures = {
+            executor.submit(trace.wrap(analyze_workplace), part, api_key, max_bytes, max_pixels,
+                            image_format, None, use_cache, rate_limiter): number
+            for number, (_, part) in enumerate(parts)
+        }
+        for future in as_completed(futures):
+            analyses[futures[future]] = future.result()
+            yield {"type": "tile", "label": parts[futures[future]][0],
+                   "completed": len(analyses), "total": len(parts)}
+    timings["analysis"] = time.perf_counter() - start
+
+    yield {"type": "stage", "stage": "merging"}
+    start = time.perf_counter()
+    chunks = []
+    for delta in merge_analyses([(label, analyses[number]) for number, (label, _) in enumerate(parts)],
+                                api_key, rate_limiter, report):
+        chunks.append(delta)
+        yield {"type": "token", "text": delta}
+    timings["merge"] = time.perf_counter() - start
+    yield {"type": "done", "text": "".join(chunks)}
+
+def analyze_tiled(image, api_key=None, max_tiles=MAX_TILES, max_workers=4, overview=True,
+                  report=None, use_cache=True, rate_limiter=None, quality_gate=None):
+    """Tiled analysis of an image (bytes, buffer or path), returning the merged report"""
+    for event in analyze_tiled_stream(image, api_key, max_tiles, max_workers, overview, report=report,
+                                      use_cache=use_cache, rate_limiter=rate_limiter, quality_gate=quality_gate):
+        if event["type"] == "done":
+            return event["text"]
+
+def mindmap_prompt(analysis_text):
+    """Prompt asking for the severity-coded PlantUML mind map"""
+    return f"""Based on this workplace Root Cause Analysis, generate a PlantUML mind map organized by severity levels.
 
 Analysis: {analysis_text}
 
@@ -99,26 +634,14 @@ Use this EXACT format with severity-based color coding:
 @endmindmap
 
 Replace placeholders with actual findings from the analysis. Use the color codes for severity: Red=Critical, Orange=High, Yellow=Medium, Green=Low, Blue=Monitoring. Return ONLY the PlantUML code, no markdown."""
-        }]
-    )
-
-    return response.choices[0].message.content
 
-def generate_improvement_wbs(analysis_text, api_key=None):
-    """Generate PlantUML WBS diagram for Root Cause resolution project breakdown"""
-
-    # Initialize Groq client with provided API key
-    if not api_key:
-        raise ValueError("API key is required. Please provide a valid Groq API key.")
-
-    client = Groq(api_key=api_key)
+def generate_analysis_mindmap(analysis_text, api_key=None, rate_limiter=None, report=None):
+    """Generate PlantUML mind map documenting Root Cause Analysis findings"""
+    return complete_prompt(mindmap_prompt(analysis_text), api_key, rate_limiter, stage="mindmap", report=report)
 
-    # Ask Groq to generate WBS diagram based on the analysis
-    response = client.chat.completions.create(
-        model="meta-llama/llama-4-scout-17b-16e-instruct",
-        messages=[{
-            "role": "user",
-            "content": f"""Based on this workplace Root Cause Analysis, create a PlantUML WBS (Work Breakdown Structure) for the resolution project organized by severity phases.
+def wbs_prompt(analysis_text):
+    """Prompt asking for the PlantUML WBS of the resolution project"""
+    return f"""Based on this workplace Root Cause Analysis, create a PlantUML WBS (Work Breakdown Structure) for the resolution project organized by severity phases.
 
 Analysis: {analysis_text}
 
@@ -155,26 +678,14 @@ Use this EXACT format and create specific tasks based on the issues identified:
 Adjust the tasks based on the specific problems and root causes found in the analysis. Focus more detailed tasks on the higher severity issues. If critical safety issues were found, expand the emergency response section.
 
 Return ONLY the PlantUML WBS code, no markdown, no explanation, no code blocks."""
-        }]
-    )
-
-    return response.choices[0].message.content
-
-def generate_analysis_json(analysis_text, api_key=None):
-    """Generate PlantUML JSON diagram for structured Root Cause Analysis data"""
 
-    # Initialize Groq client with provided API key
-    if not api_key:
-        raise ValueError("API key is required. Please provide a valid Groq API key.")
-
-    client = Groq(api_key=api_key)
+def generate_improvement_wbs(analysis_text, api_key=None, rate_limiter=None, report=None):
+    """Generate PlantUML WBS diagram for Root Cause resolution project breakdown"""
+    return complete_prompt(wbs_prompt(analysis_text), api_key, rate_limiter, stage="wbs", report=report)
 
-    # Ask Groq to generate JSON diagram based on the analysis
-    response = client.chat.completions.create(
-        model="meta-llama/llama-4-scout-17b-16e-instruct",
-        messages=[{
-            "role": "user",
-            "content": f"""Based on this workplace Root Cause Analysis, create a structured PlantUML JSON diagram that organizes all findings into machine-readable format.
+def json_prompt(analysis_text):
+    """Prompt asking for the PlantUML JSON diagram of the findings"""
+    return f"""Based on this workplace Root Cause Analysis, create a structured PlantUML JSON diagram that organizes all findings into machine-readable format.
 
 Analysis: {analysis_text}
 
@@ -266,80 +777,226 @@ Use this EXACT format and structure the data based on the analysis findings:
 Replace all placeholder values with actual findings from the analysis. Populate each severity category with the specific issues found. If no issues exist for a category, use an empty array. Update the summary counts to match the actual findings. Focus on creating actionable, structured data that can be used for tracking and reporting.
 
 Return ONLY the PlantUML JSON code, no markdown, no explanation, no code blocks."""
-        }]
-    )
 
-    return response.choices[0].message.content
+def generate_analysis_json(analysis_text, api_key=None, rate_limiter=None, report=None):
+    """Generate PlantUML JSON diagram for structured Root Cause Analysis data"""
+    return complete_prompt(json_prompt(analysis_text), api_key, rate_limiter, stage="json", report=report)
+
+DIAGRAM_FORMATS = {
+    "png": "image/png",
+    "svg": "image/svg+xml",
+}
+
+def get_diagram_cache():
+    """On-disk cache of rendered diagrams, keyed on PlantUML source, output format and backends"""
+    return get_cache("diagrams", max_bytes=64 * 1024 * 1024, max_age=90 * 24 * 3600)
+
+def render_plantuml(plantuml_code, output_format="png", use_cache=True, backends=None):
+    """Render PlantUML code to PNG/SVG bytes, from the cache when possible, else through the
+    render backends in order (local renderer first, kroki.io as fallback by default)"""
+    if output_format not in DIAGRAM_FORMATS:
+        raise ValueError(f"Unsupported diagram format: {output_format}")
+
+    with trace.span("render", format=output_format, code_bytes=len(plantuml_code)) as span:
+        backends = backends if backends is not None else get_backends()
+        key = cache_key(plantuml_code, output_format, ",".join(backend.name for backend in backends))
+        if use_cache:
+            cached = get_diagram_cache().get(key)
+            if cached is not None:
+                metrics.record("render", backend="cache", outcome="cache", wall_seconds=0.0,
+                               payload_bytes=len(plantuml_code), response_bytes=len(cached))
+                span.set(backend="cache", bytes=len(cached))
+                return cached
+
+        for backend in backends:
+            if not backend.supports(plantuml_code, output_format):
+                continue
+            start = time.perf_counter()
+            try:
+                diagram = backend.render(plantuml_code, output_format)
+            except Exception as e:
+                print(f"Error generating PlantUML diagram with {backend.name}: {e}")
+                diagram, error = None, str(e)
+            else:
+                error = None if diagram else "no output"
+
+            metrics.record("render", backend=backend.name, outcome="error" if error else "ok", error=error,
+                           wall_seconds=time.perf_counter() - start, payload_bytes=len(plantuml_code),
+                           response_bytes=len(diagram) if diagram else 0)
+            if diagram:
+                if use_cache:
+                    get_diagram_cache().put(key, diagram)
+                span.set(backend=backend.name, bytes=len(diagram))
+                return diagram
+
+        span.end(error="no backend rendered the diagram")
+        return None
 
-def create_plantuml_diagram(plantuml_code, filename="5s_analysis_mindmap"):
-    """Send PlantUML code to kroki.io server and save diagram image"""
+def create_plantuml_diagram(plantuml_code, filename="5s_analysis_mindmap", output_format="png"):
+    """Render PlantUML code and save the diagram image as <filename>.<format>"""
+    diagram = render_plantuml(plantuml_code, output_format)
+    if diagram is None:
+        return None
 
+    # Save the diagram image
+    output_path = f"{filename}.{output_format}"
+    with open(output_path, 'wb') as f:
+        f.write(diagram)
+
+    print(f"Diagram saved as: {output_path}")
+    return output_path
+
+# Artifacts built from an analysis: generator function, session/file name and prompt builder
+ARTIFACTS = {
+    "mindmap": (generate_analysis_mindmap, "analysis_mindmap", mindmap_prompt),
+    "wbs": (generate_improvement_wbs, "improvement_wbs", wbs_prompt),
+    "json": (generate_analysis_json, "analysis_json", json_prompt),
+}
+
+def stream_artifact(name, analysis_text, api_key=None, rate_limiter=None, report=None):
+    """Stream one artifact's PlantUML code as text deltas"""
+    prompt_builder = ARTIFACTS[name][2]
+    return stream_prompt(prompt_builder(analysis_text), api_key, rate_limiter, stage=name, report=report)
+
+def build_artifact(name, analysis_text, api_key=None, output_format="png", rate_limiter=None):
+    """Generate one artifact's PlantUML code and render it straight away.
+    The model routing decision is kept in result["routes"]"""
+    generator = ARTIFACTS[name][0]
+    start = time.perf_counter()
+    result = {"code": None, "image": None, "error": None, "generate_seconds": None, "render_seconds": None,
+              "routes": {}}
     try:
-        # Use kroki.io - a reliable PlantUML service
-        url = "https://kroki.io/plantuml/png"
-
-        # Send POST request with PlantUML code
-        headers = {'Content-Type': 'text/plain'}
-        response = requests.post(url, data=plantuml_code, headers=headers)
+        result["code"] = generator(analysis_text, api_key, rate_limiter, report=result)
+        result["generate_seconds"] = time.perf_counter() - start
+
+        render_start = time.perf_counter()
+        result["image"] = render_plantuml(result["code"], output_format)
+        result["render_seconds"] = time.perf_counter() - render_start
+        if result["image"] is None:
+            result["error"] = "Diagram rendering failed"
+    except Exception as e:
+        result["error"] = str(e)
+    result["seconds"] = time.perf_counter() - start
+    return result
 
-        if response.status_code == 200:
-            # Save the diagram image
-            output_path = f"{filename}.png"
-            with open(output_path, 'wb') as f:
-                f.write(response.content)
+def structure_prompt(analysis_text):
+    """Prompt asking for the findings as root_cause_analysis JSON, used with JSON mode"""
+    schema = RootCauseAnalysis.template().to_json()
+    return f"""Based on this workplace Root Cause Analysis, extract every finding into structured JSON.
 
-            print(f"5S analysis mind map saved as: {output_path}")
-            return output_path
-        else:
-            print(f"Failed to generate diagram. Status code: {response.status_code}")
-            return None
+Analysis: {analysis_text}
 
+Respond with a single JSON object using exactly this schema:
+{schema}
+
+Put each issue in the list for its severity (critical, high, medium, low), numbering issue_id per severity (CRIT-001, HIGH-001, MED-001, LOW-001, ...). Use an empty list for a severity with no issues. Fill every field from the analysis, use short phrases, and do not invent findings that are not in the analysis."""
+
+def stream_analysis_structure(analysis_text, api_key=None, rate_limiter=None, report=None):
+    """Stream the JSON-mode structured extraction as text deltas"""
+    messages = [{"role": "user", "content": structure_prompt(analysis_text)}]
+    return stream_chat(messages, api_key, rate_limiter, stage="extract", report=report,
+                       response_format={"type": "json_object"})
+
+def extract_analysis_structure(analysis_text, api_key=None, rate_limiter=None, report=None):
+    """Extract the findings with one JSON-mode call, validated into a RootCauseAnalysis"""
+    text = "".join(stream_analysis_structure(analysis_text, api_key, rate_limiter, report))
+    with trace.span("parse", bytes=len(text)) as span:
+        structure = RootCauseAnalysis.from_json(text)
+        span.set(issues=len(structure.issues))
+    return structure
+
+def structure_diagrams(structure, names=None):
+    """PlantUML code for each artifact, generated deterministically from the structure"""
+    return {name: DIAGRAM_BUILDERS[name](structure) for name in (names or ARTIFACTS)}
+
+def render_artifact(code, output_format="png"):
+    """Render already generated PlantUML code into an artifact result"""
+    start = time.perf_counter()
+    result = {"code": code, "image": None, "error": None}
+    try:
+        result["image"] = render_plantuml(code, output_format)
+        if result["image"] is None:
+            result["error"] = "Diagram rendering failed"
     except Exception as e:
-        print(f"Error generating PlantUML diagram: {e}")
-        return None
+        result["error"] = str(e)
+    result["render_seconds"] = result["seconds"] = time.perf_counter() - start
+    return result
+
+def iter_artifacts(analysis_text, api_key=None, names=None, output_format="png", structured=True,
+                   rate_limiter=None, structure=None):
+    """Build the artifacts and yield (name, result) as each one finishes.
+    Structured mode makes one JSON-mode extraction call (skipped when an already extracted
+    structure is passed) and generates every diagram from it;
+    otherwise each artifact runs its own generate+render chain concurrently"""
+    names = list(names or ARTIFACTS)
+    if not api_key and structure is None:
+        raise ValueError("API key is required. Please provide a valid Groq API key.")
+
+    if structured:
+        start = time.perf_counter()
+        # Routing decision of the extraction call, shared by every artifact built from it
+        report = {"routes": {}}
+        if structure is None:
+            structure = extract_analysis_structure(analysis_text, api_key, rate_limiter, report)
+        generate_seconds = time.perf_counter() - start
+
+        with ThreadPoolExecutor(max_workers=len(names)) as executor:
+            futures = {
+                executor.submit(trace.wrap(render_artifact), code, output_format): name
+                for name, code in structure_diagrams(structure, names).items()
+            }
+            for future in as_completed(futures):
+                result = future.result()
+                result["structure"] = structure
+                result["routes"] = report["routes"]
+                result["generate_seconds"] = generate_seconds
+                result["seconds"] += generate_seconds
+                yield futures[future], result
+        return
+
+    with ThreadPoolExecutor(max_workers=len(names)) as executor:
+        futures = {
+            executor.submit(trace.wrap(build_artifact), name, analysis_text, api_key, output_format, rate_limiter): name
+            for name in names
+        }
+        for future in as_completed(futures):
+            yield futures[future], future.result()
+
+def generate_all_artifacts(analysis_text, api_key=None, names=None, output_format="png", structured=True):
+    """Generate and render every artifact, returning {name: result}"""
+    return dict(iter_artifacts(analysis_text, api_key, names, output_format, structured))
 
 if __name__ == "__main__":
     import sys
     if len(sys.argv) != 2:
-        print("Usage: python analyze_5s.py <image_path>")
+        print("Usage: python analyze_rca.py <image_or_video_path>")
+        print("For directories of images use: python batch_rca.py <dir_or_glob> ...")
         exit(1)
 
-    result = analyze_5s(sys.argv[1])
-    print("=== 5S Analysis Results ===")
+    api_key = os.getenv("GROQ_API_KEY")
+    if not api_key:
+        print("Error: set GROQ_API_KEY in the environment or a .env file")
+        exit(1)
+
+    if os.path.splitext(sys.argv[1])[1].lower() in VIDEO_EXTENSIONS:
+        result = analyze_video(sys.argv[1], api_key)
+    else:
+        result = analyze_workplace(sys.argv[1], api_key)
+    print("=== Root Cause Analysis Results ===")
     print(result)
     print("\n" + "="*50)
 
-    # Generate analysis mind map diagram
-    print("Generating 5S analysis mind map...")
-    mindmap_code = generate_analysis_mindmap(result)
-
-    if mindmap_code:
-        print("PlantUML mind map code generated, creating diagram...")
-        mindmap_path = create_plantuml_diagram(mindmap_code, "5s_analysis_mindmap")
-
-        if mindmap_path:
-            print(f"Mind map saved: {mindmap_path}")
-        else:
-            print("Mind map generation failed")
-
-        # Generate improvement WBS chart
-        print("Generating improvement project breakdown (WBS)...")
-        wbs_code = generate_improvement_wbs(result)
-
-        if wbs_code:
-            print("PlantUML WBS code generated, creating diagram...")
-            wbs_path = create_plantuml_diagram(wbs_code, "5s_improvement_wbs")
-
-            if wbs_path:
-                print(f"WBS chart saved: {wbs_path}")
-                print(f"\nComplete! You now have:")
-                print(f"1. Analysis mind map: {mindmap_path}")
-                print(f"2. Implementation breakdown: {wbs_path}")
-            else:
-                print("WBS chart generation failed, but code was created:")
-                print("\n--- WBS Code ---")
-                print(wbs_code)
-        else:
-            print("Failed to generate WBS chart code")
-    else:
-        print("Failed to generate mind map code")
\ No newline at end of file
+    # Generate and render every artifact concurrently
+    print("Generating root cause map, resolution plan and JSON data...")
+    for name, artifact in iter_artifacts(result, api_key):
+        if artifact["error"]:
+            print(f"{name} failed: {artifact['error']}")
+            if artifact["code"]:
+                print(f"\n--- {name} PlantUML code ---")
+                print(artifact["code"])
+            continue
+
+        output_path = f"{ARTIFACTS[name][1]}.png"
+        with open(output_path, 'wb') as f:
+            f.write(artifact["image"])
+        print(f"{name} saved: {output_path} ({artifact['seconds']:.1f}s)")
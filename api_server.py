@@ -0,0 +1,413 @@
+import argparse
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from contextlib import aclosing
+
+from starlette.applications import Starlette
+from starlette.concurrency import run_in_threadpool
+from starlette.formparsers import MultiPartException, MultiPartParser
+from starlette.responses import JSONResponse, Response
+from starlette.routing import Route
+
+from analyze_rca import (analyze_workplace_stream, analyze_tiled_stream, analyze_video_stream, iter_artifacts,
+                         render_plantuml, make_preview, ARTIFACTS, DIAGRAM_FORMATS)
+from quality_gate import QualityGate, ImageRejected
+from rca_cache import CACHE_DIR, cache_key, get_cache
+from rca_jobs import get_job_queue
+from rca_store import get_results_store
+from video_keyframes import VIDEO_EXTENSIONS
+
+# Shared by every worker process, so any of them can answer status and artifact requests
+API_DB = os.getenv("RCA_API_DB", os.path.join(CACHE_DIR, "api_jobs.sqlite"))
+MAX_UPLOAD_BYTES = int(os.getenv("RCA_MAX_UPLOAD_MB", "50")) * 1024 * 1024
+# Room for multipart boundaries and part headers on top of the file itself
+MULTIPART_OVERHEAD = 64 * 1024
+MODES = ("image", "tiled", "video")
+# Requests without their own key only fall back to the server's GROQ_API_KEY when this is on,
+# otherwise anyone who can reach the port would spend it
+USE_SERVER_KEY = os.getenv("RCA_API_USE_SERVER_KEY", "0") == "1"
+
+class JobStore:
+    """Job records and rendered artifacts in SQLite. The process that runs a job writes to it,
+    any API worker process reads from it"""
+
+    def __init__(self, path=API_DB):
+        self.path = path
+        self._lock = threading.Lock()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("""CREATE TABLE IF NOT EXISTS jobs (
+                id TEXT PRIMARY KEY,
+                status TEXT NOT NULL,
+                stage TEXT,
+                progress REAL NOT NULL DEFAULT 0,
+                request TEXT NOT NULL,
+                analysis TEXT,
+                structure TEXT,
+                quality TEXT,
+                error TEXT,
+                created REAL NOT NULL,
+                updated REAL NOT NULL)""")
+            conn.execute("""CREATE TABLE IF NOT EXISTS artifacts (
+                job_id TEXT NOT NULL,
+                name TEXT NOT NULL,
+                code TEXT,
+                format TEXT,
+                image BLOB,
+                error TEXT,
+                PRIMARY KEY (job_id, name))""")
+            # Databases created by earlier versions lack the result link and model routing columns
+            columns = [row[1] for row in conn.execute("PRAGMA table_info(jobs)")]
+            if "result_id" not in columns:
+                conn.execute("ALTER TABLE jobs ADD COLUMN result_id INTEGER")
+            if "routes" not in columns:
+                conn.execute("ALTER TABLE jobs ADD COLUMN routes TEXT")
+
+    def _connect(self):
+        return sqlite3.connect(self.path, timeout=30)
+
+    def create(self, request):
+        job_id = uuid.uuid4().hex
+        now = time.time()
+        with self._lock, self._connect() as conn:
+            conn.execute("INSERT INTO jobs (id, status, request, created, updated) VALUES (?, 'queued', ?, ?, ?)",
+                         (job_id, json.dumps(request), now, now))
+        return job_id
+
+    def update(self, job_id, **fields):
+        fields["updated"] = time.time()
+        columns = ", ".join(f"{name} = ?" for name in fields)
+        with self._lock, self._connect() as conn:
+            conn.execute(f"UPDATE jobs SET {columns} WHERE id = ?", (*fields.values(), job_id))
+
+    def put_artifact(self, job_id, name, code, output_format, image, error):
+        with self._lock, self._connect() as conn:
+            conn.execute("INSERT OR REPLACE INTO artifacts (job_id, name, code, format, image, error) "
+                         "VALUES (?, ?, ?, ?, ?, ?)", (job_id, name, code, output_format, image, error))
+
+    def get(self, job_id):
+        with self._lock, self._connect() as conn:
+            conn.row_factory = sqlite3.Row
+            row = conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+            if row is None:
+                return None
+            artifacts = conn.execute("SELECT name, format, error, image IS NOT NULL AS rendered FROM artifacts "
+                                     "WHERE job_id = ? ORDER BY name", (job_id,)).fetchall()
+        job = dict(row)
+        for name in ("request", "structure", "quality", "routes"):
+            job[name] = json.loads(job[name]) if job[name] else None
+        job["artifacts"] = [dict(artifact) for artifact in artifacts]
+        return job
+
+    def artifact(self, job_id, name):
+        with self._lock, self._connect() as conn:
+            row = conn.execute("SELECT code, format, image, error FROM artifacts WHERE job_id = ? AND name = ?",
+                               (job_id, name)).fetchone()
+        if row is None:
+            return None
+        return {"code": row[0], "format": row[1], "image": bytes(row[2]) if row[2] is not None else None, "error": row[3]}
+
+store = JobStore()
+quality_gate = QualityGate()
+
+def upload_cache():
+    """Uploaded images by content hash, so a separate job request can reach any worker"""
+    return get_cache("api_uploads", max_bytes=512 * 1024 * 1024, max_age=24 * 3600)
+
+def api_error(status_code, message):
+    return JSONResponse({"error": message}, status_code=status_code)
+
+def request_api_key(request):
+    authorization = request.headers.get("authorization", "")
+    if authorization.lower().startswith("bearer "):
+        return authorization[7:].strip()
+    return request.headers.get("x-groq-api-key") or (os.getenv("GROQ_API_KEY") if USE_SERVER_KEY else None)
+
+def job_options(values, filename=None, content_type=None):
+    """Validated job options from query parameters or a JSON body"""
+    for name in ("mode", "format", "site", "area"):
+        if values.get(name) is not None and not isinstance(values[name], str):
+            raise ValueError(f"{name} must be a string")
+    if filename is not None and not isinstance(filename, str):
+        raise ValueError("filename must be a string")
+    if not isinstance(values.get("quality_gate", "1"), (str, bool, int)):
+        raise ValueError("quality_gate must be a boolean")
+    extension = os.path.splitext(filename or "")[1].lower()
+    default_mode = "video" if extension in VIDEO_EXTENSIONS or (content_type or "").startswith("video/") else "image"
+    mode = values.get("mode") or default_mode
+    if mode not in MODES:
+        raise ValueError(f"mode must be one of {', '.join(MODES)}")
+
+    artifacts = values.get("artifacts", "all")
+    if isinstance(artifacts, str):
+        artifacts = [] if artifacts in ("", "none", "0", "false") else list(ARTIFACTS) if artifacts == "all" else artifacts.split(",")
+    if not isinstance(artifacts, list) or not all(isinstance(name, str) for name in artifacts):
+        raise ValueError("artifacts must be a comma separated string or a list of names")
+    unknown = set(artifacts) - set(ARTIFACTS)
+    if unknown:
+        raise ValueError(f"unknown artifacts: {', '.join(sorted(unknown))}")
+
+    output_format = values.get("format", "png")
+    if output_format not in DIAGRAM_FORMATS:
+        raise ValueError(f"format must be one of {', '.join(DIAGRAM_FORMATS)}")
+
+    quality_check = str(values.get("quality_gate", "1")).lower() not in ("0", "false")
+    return {"mode": mode, "artifacts": artifacts, "format": output_format, "quality_gate": quality_check,
+            "site": values.get("site") or None, "area": values.get("area") or None,
+            "source": filename, "suffix": extension or (".mp4" if mode == "video" else ".jpg")}
+
+def run_pipeline(job_id, image_bytes, api_key, options):
+    """Job function: analysis, then the requested artifacts, with progress written to the store"""
+    def run(job):
+        store.update(job_id, status="running")
+        gate = quality_gate if options["quality_gate"] else None
+        report = {}
+        if options["mode"] == "video":
+            events = analyze_video_stream(image_bytes, api_key, suffix=options["suffix"], report=report)
+        elif options["mode"] == "tiled":
+            events = analyze_tiled_stream(image_bytes, api_key, report=report, quality_gate=gate)
+        else:
+            events = analyze_workplace_stream(image_bytes, api_key, report=report, quality_gate=gate)
+
+        try:
+            analysis_text = None
+            for event in events:
+                if event["type"] == "stage":
+                    store.update(job_id, stage=event["stage"])
+                elif event["type"] in ("keyframe", "tile"):
+                    store.update(job_id, progress=0.5 * event["completed"] / event["total"])
+                elif event["type"] == "done":
+                    analysis_text = event["text"]
+            # Which model answered each stage, kept with the job
+            routes = report.get("routes", {})
+            store.update(job_id, analysis=analysis_text, progress=0.5, quality=json.dumps(report.get("quality")),
+                         routes=json.dumps(routes), stage="artifacts" if options["artifacts"] else None)
+
+            completed, structure, artifacts = 0, None, {}
+            if options["artifacts"]:
+                for name, result in iter_artifacts(analysis_text, api_key, options["artifacts"], options["format"]):
+                    completed += 1
+                    structure = result["structure"]
+                    store.put_artifact(job_id, name, result["code"], options["format"], result["image"], result["error"])
+                    routes.update(result.get("routes", {}))
+                    store.update(job_id, structure=structure.to_json(), routes=json.dumps(routes),
+                                 progress=0.5 + 0.5 * completed / len(options["artifacts"]))
+                    if not result["error"]:
+                        artifacts[name] = {"code": result["code"], "image": result["image"], "format": options["format"]}
+            result_id = get_results_store().save_analysis(
+                analysis_text, structure, image_hash=cache_key(image_bytes), site=options["site"], area=options["area"],
+                source=options["source"], mode=options["mode"], artifacts=artifacts
+            )
+            store.update(job_id, status="done", stage=None, progress=1.0, result_id=result_id)
+        except ImageRejected as e:
+            store.update(job_id, status="rejected", error=str(e), quality=json.dumps(e.result))
+            raise
+        except Exception as e:
+            store.update(job_id, status="error", error=str(e))
+            raise
+        return job_id
+    return run
+
+def job_urls(request, job_id):
+    return {"status_url": str(request.url_for("job_status", job_id=job_id))}
+
+async def submit(request, image_bytes, options, api_key):
+    job_id = await run_in_threadpool(store.create, {key: value for key, value in options.items() if key != "suffix"})
+    get_job_queue().submit("api", run_pipeline(job_id, image_bytes, api_key, options), api_key)
+    return JSONResponse({"job_id": job_id, "status": "queued", **job_urls(request, job_id)}, status_code=202)
+
+class UploadTooLarge(Exception):
+    """The request body is larger than MAX_UPLOAD_BYTES"""
+
+async def limited_stream(request, limit):
+    """request.stream() that raises UploadTooLarge as soon as more than limit bytes have arrived"""
+    received = 0
+    async for chunk in request.stream():
+        received += len(chunk)
+        if received > limit:
+            raise UploadTooLarge()
+        yield chunk
+
+async def read_upload(request):
+    """Image bytes from a multipart 'file' field or the raw request body, kept in memory.
+    Bodies over MAX_UPLOAD_BYTES raise UploadTooLarge without being buffered: a larger
+    Content-Length is refused before reading, and the stream is counted as it is read"""
+    content_type = request.headers.get("content-type", "")
+    multipart = content_type.startswith("multipart/form-data")
+    limit = MAX_UPLOAD_BYTES + (MULTIPART_OVERHEAD if multipart else 0)
+    declared = request.headers.get("content-length", "")
+    if declared.isdigit() and int(declared) > limit:
+        raise UploadTooLarge()
+
+    if multipart:
+        try:
+            async with aclosing(limited_stream(request, limit)) as stream:
+                form = await MultiPartParser(request.headers, stream).parse()
+        except MultiPartException as e:
+            raise ValueError(e.message)
+        upload = form.get("file")
+        if upload is None or isinstance(upload, str):
+            raise ValueError("multipart uploads need a 'file' field")
+        return await upload.read(), upload.filename, upload.content_type
+
+    chunks = []
+    async with aclosing(limited_stream(request, limit)) as stream:
+        async for chunk in stream:
+            chunks.append(chunk)
+    return b"".join(chunks), request.query_params.get("filename"), content_type
+
+async def upload_image(request):
+    """POST /v1/images: store an upload and return its id for later job requests"""
+    try:
+        data, filename, content_type = await read_upload(request)
+    except UploadTooLarge:
+        return api_error(413, f"upload exceeds {MAX_UPLOAD_BYTES // (1024 * 1024)} MB")
+    except ValueError as e:
+        return api_error(400, str(e))
+    if not data:
+        return api_error(400, "empty upload")
+    if len(data) > MAX_UPLOAD_BYTES:
+        return api_error(413, f"upload exceeds {MAX_UPLOAD_BYTES // (1024 * 1024)} MB")
+    image_id = cache_key(data)
+    await run_in_threadpool(upload_cache().put, image_id, data)
+    return JSONResponse({"image_id": image_id, "bytes": len(data), "filename": filename,
+                         "content_type": content_type}, status_code=201)
+
+async def create_job(request):
+    """POST /v1/jobs with {"image_id", "mode", "artifacts", "format", "filename"}"""
+    api_key = request_api_key(request)
+    if not api_key:
+        return api_error(401, "a Groq API key is required (Authorization: Bearer ... or X-Groq-Api-Key)")
+    try:
+        body = await request.json()
+        if not isinstance(body, dict):
+            raise ValueError("the body must be a JSON object")
+        options = job_options(body, body.get("filename"))
+        if not isinstance(body.get("image_id") or "", str):
+            raise ValueError("image_id must be a string")
+    except (ValueError, AttributeError) as e:
+        return api_error(422, f"invalid job request: {e}")
+    image_bytes = await run_in_threadpool(upload_cache().get, body.get("image_id") or "")
+    if image_bytes is None:
+        return api_error(404, "unknown or expired image_id, upload it again")
+    return await submit(request, image_bytes, options, api_key)
+
+async def create_analysis(request):
+    """POST /v1/analyses: upload and submit in one request, options as query parameters"""
+    api_key = request_api_key(request)
+    if not api_key:
+        return api_error(401, "a Groq API key is required (Authorization: Bearer ... or X-Groq-Api-Key)")
+    try:
+        data, filename, content_type = await read_upload(request)
+        options = job_options(request.query_params, filename, content_type)
+    except UploadTooLarge:
+        return api_error(413, f"upload exceeds {MAX_UPLOAD_BYTES // (1024 * 1024)} MB")
+    except ValueError as e:
+        return api_error(422, str(e))
+    if not data:
+        return api_error(400, "empty upload")
+    if len(data) > MAX_UPLOAD_BYTES:
+        return api_error(413, f"upload exceeds {MAX_UPLOAD_BYTES // (1024 * 1024)} MB")
+    return await submit(request, data, options, api_key)
+
+async def job_status(request):
+    """GET /v1/jobs/{job_id}"""
+    job = await run_in_threadpool(store.get, request.path_params["job_id"])
+    if job is None:
+        return api_error(404, "unknown job")
+    for artifact in job["artifacts"]:
+        artifact["url"] = str(request.url_for("job_artifact", job_id=job["id"], name=artifact["name"]))
+    return JSONResponse(job)
+
+async def job_artifact(request):
+    """GET /v1/jobs/{job_id}/artifacts/{name}?format=png|svg|puml|preview (downscaled WebP of the PNG)"""
+    job_id, name = request.path_params["job_id"], request.path_params["name"]
+    artifact = await run_in_threadpool(store.artifact, job_id, name)
+    if artifact is None:
+        job = await run_in_threadpool(store.get, job_id)
+        if job is None:
+            return api_error(404, "unknown job")
+        return api_error(409 if job["status"] in ("queued", "running") else 404, f"artifact {name} is not available")
+
+    output_format = request.query_params.get("format", artifact["format"])
+    if output_format == "puml":
+        return Response(artifact["code"] or "", media_type="text/plain; charset=utf-8")
+    preview = output_format == "preview"
+    if preview:
+        output_format = "png"
+    if output_format not in DIAGRAM_FORMATS:
+        return api_error(422, f"format must be puml, preview or one of {', '.join(DIAGRAM_FORMATS)}")
+
+    image = artifact["image"] if output_format == artifact["format"] else None
+    if image is None and artifact["code"]:
+        # Other formats, or a failed render retried, are rendered on demand from the stored code
+        image = await run_in_threadpool(render_plantuml, artifact["code"], output_format)
+    if image is None:
+        return api_error(502, artifact["error"] or "diagram rendering failed")
+    if preview:
+        image, mime_type = await run_in_threadpool(make_preview, image)
+        return Response(image, media_type=mime_type)
+    return Response(image, media_type=DIAGRAM_FORMATS[output_format])
+
+async def list_results(request):
+    """GET /v1/results?severity=high,critical&since=YYYY-MM-DD&until=YYYY-MM-DD&site=&area=&limit=&offset="""
+    params = request.query_params
+    try:
+        limit = min(int(params.get("limit", 25)), 200)
+        offset = max(int(params.get("offset", 0)), 0)
+        severity = params.get("severity")
+        page = await run_in_threadpool(
+            get_results_store().search, severity.split(",") if severity else None, params.get("since"),
+            params.get("until"), params.get("site"), params.get("area"), limit, offset
+        )
+    except ValueError as e:
+        return api_error(422, str(e))
+    for item in page["items"]:
+        item["url"] = str(request.url_for("result_detail", result_id=item["id"]))
+    return JSONResponse(page)
+
+async def result_detail(request):
+    """GET /v1/results/{result_id}: stored analysis text, structure and artifact names"""
+    record = await run_in_threadpool(get_results_store().get, request.path_params["result_id"])
+    if record is None:
+        return api_error(404, "unknown result")
+    return JSONResponse(record)
+
+async def health(request):
+    return JSONResponse({"status": "ok", "pid": os.getpid(), "jobs": get_job_queue().stats()})
+
+app = Starlette(routes=[
+    Route("/healthz", health),
+    Route("/v1/images", upload_image, methods=["POST"]),
+    Route("/v1/analyses", create_analysis, methods=["POST"]),
+    Route("/v1/jobs", create_job, methods=["POST"]),
+    Route("/v1/jobs/{job_id}", job_status, name="job_status"),
+    Route("/v1/jobs/{job_id}/artifacts/{name}", job_artifact, name="job_artifact"),
+    Route("/v1/results", list_results),
+    Route("/v1/results/{result_id:int}", result_detail, name="result_detail"),
+])
+
+def main(argv=None):
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description="Headless HTTP API for the Root Cause Analysis pipeline")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("-w", "--workers", type=int, default=1, help="Worker processes, job state is shared through the SQLite store")
+    parser.add_argument("--use-server-key", action="store_true",
+                        help="Let requests without an API key use this server's GROQ_API_KEY (trusted networks only)")
+    args = parser.parse_args(argv)
+    if args.use_server_key:
+        # Read by every worker process when it imports the app
+        os.environ["RCA_API_USE_SERVER_KEY"] = "1"
+    uvicorn.run("api_server:app", host=args.host, port=args.port, workers=args.workers)
+
+if __name__ == "__main__":
+    main()
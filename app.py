@@ -1,13 +1,38 @@
-import streamlit as st
-import tempfile
+import time
+
+# Taken before anything else so the first run includes every import it pays for
+SCRIPT_START = time.perf_counter()
+
 import os
-from pathlib import Path
-from analyze_rca import analyze_workplace, generate_analysis_mindmap, generate_improvement_wbs, generate_analysis_json, create_plantuml_diagram
+import datetime
+import importlib
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+import streamlit as st
+from rca_jobs import get_job_queue, stream_job, collect_job
+from rca_store import get_results_store
+from rca_cache import cache_key
+from rca_schema import RootCauseAnalysis, SEVERITIES
+from rca_media import VIDEO_EXTENSIONS
+import rca_metrics
+import rca_routing
+import rca_trace
 from streamlit_option_menu import option_menu
 from dotenv import load_dotenv
 
-# Load environment variables
-load_dotenv()
+# The analysis pipeline (OpenCV, Groq, renderers) is imported in the background, never at the top,
+# so the first page renders before it is loaded
+PIPELINE_MODULE = "analyze_rca"
+# Script runs remembered for the App Performance view
+RUN_HISTORY = int(os.getenv("RCA_RUN_HISTORY", "500"))
+
+@st.cache_resource
+def load_environment():
+    """Read .env once per process instead of on every rerun"""
+    load_dotenv()
+    return True
+
+load_environment()
 
 st.set_page_config(
     page_title="Root Cause Analysis Platform",
@@ -16,7 +41,8 @@ st.set_page_config(
     initial_sidebar_state="collapsed"
 )
 
-# Custom CSS for modern styling
+# Custom CSS for modern styling. Streamlit drops every element a rerun does not emit again,
+# so the style block is re-sent each run; it is a few KB of static text and costs no work
 st.markdown("""
 <style>
     .main-header {
@@ -111,10 +137,319 @@ st.markdown("""
 </div>
 """, unsafe_allow_html=True)
 
+@st.cache_resource
+def app_timings():
+    """Startup and script run times of this server process: the first run pays for the imports,
+    later runs (widget changes, tab switches) should stay in the tens of milliseconds"""
+    return {"first_run": None, "pipeline_import": None, "runs": deque(maxlen=RUN_HISTORY)}
+
+@st.cache_resource
+def pipeline_loader():
+    """Future of the analyze_rca module, imported once per process on a background thread"""
+    timings = app_timings()
+
+    def load():
+        start = time.perf_counter()
+        module = importlib.import_module(PIPELINE_MODULE)
+        timings["pipeline_import"] = time.perf_counter() - start
+        return module
+
+    executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="pipeline-import")
+    future = executor.submit(load)
+    executor.shutdown(wait=False)
+    return future
+
+def pipeline():
+    """The analyze_rca module, waiting for the background import only if it is still running"""
+    return pipeline_loader().result()
+
+pipeline_loader()
+
+@st.cache_resource
+def shared_client_registry():
+    """Pooled Groq/renderer clients shared by every Streamlit session in this process"""
+    from rca_clients import get_registry
+    return get_registry()
+
+@st.cache_resource
+def shared_job_queue():
+    """Background job queue shared by every Streamlit session, so LLM work never runs in a script run"""
+    return get_job_queue()
+
+job_queue = shared_job_queue()
+
+@st.cache_resource
+def shared_results_store():
+    """Persistent history of analyses and artifacts, survives refreshes and restarts"""
+    return get_results_store()
+
+results_store = shared_results_store()
+
+@st.cache_resource(max_entries=8)
+def issue_table(version, since, until, site, area):
+    """Columnar issues for one filter, rebuilt only when the store changes (version)"""
+    from rca_trends import IssueTable
+    return IssueTable.load(results_store, since, until, site, area)
+
+# Trace spans of a running job mapped to progress: the furthest span started sets the bar
+SPAN_PROGRESS = {
+    "decode": (5, "Decoding image..."),
+    "keyframes": (5, "Selecting keyframes..."),
+    "quality": (8, "Checking image quality..."),
+    "resize": (12, "Resizing image..."),
+    "encode": (18, "Compressing image..."),
+    "base64": (24, "Encoding upload..."),
+    "cache": (27, "Checking earlier results..."),
+    "request": (30, "Waiting for the AI model..."),
+    "response": (50, "Receiving analysis..."),
+    "merge": (80, "Merging findings..."),
+}
+ARTIFACT_LABELS = {"mindmap": "Root cause map", "wbs": "Resolution plan", "json": "JSON data"}
+
+def submit_artifacts(names=None):
+    """Queue building the given artifacts, reusing the findings already extracted in this session"""
+    analyze_rca = pipeline()
+    names = list(names or analyze_rca.ARTIFACTS)
+    analysis_text = st.session_state.analysis_result
+    api_key = st.session_state.api_key
+    structure = st.session_state.get('analysis_structure')
+    st.session_state.artifacts_job = job_queue.submit(
+        "artifacts",
+        collect_job(lambda: analyze_rca.iter_artifacts(analysis_text, api_key, names, structure=structure), len(names)),
+        api_key
+    )
+
+def rerender_artifact(name):
+    """Queue rendering the PlantUML already generated for name again, without any model call"""
+    analyze_rca = pipeline()
+    code = st.session_state[f"{name}_plantuml"]
+    structure = st.session_state.get('analysis_structure')
+
+    def items():
+        result = analyze_rca.render_artifact(code)
+        result["structure"] = structure
+        yield name, result
+
+    st.session_state.artifacts_job = job_queue.submit("artifacts", collect_job(items, 1), st.session_state.api_key)
+
+def retry_artifact(name):
+    """Re-render the stored PlantUML when there is some, otherwise generate the artifact"""
+    if st.session_state.get(f"{name}_plantuml"):
+        rerender_artifact(name)
+    else:
+        submit_artifacts([name])
+
+def show_notices(key):
+    """Messages left by a finished job for the run after it"""
+    for level, message in st.session_state.pop(key, []):
+        getattr(st, level)(message)
+
+def finish_analysis_job(job):
+    st.session_state.pop('analysis_job', None)
+    if job.status == "error":
+        from quality_gate import ImageRejected
+        if isinstance(job.exception, ImageRejected):
+            st.session_state.analysis_notices = [
+                ("error", "Image rejected before analysis: " + "; ".join(job.exception.result["reasons"]) + "."),
+                ("info", "Upload a sharper, well-lit photo, or turn off the image quality gate in Settings."),
+            ]
+        else:
+            st.session_state.analysis_notices = [("error", f"Analysis failed: {job.error}")]
+        return
+    if job.status != "done":
+        return
+
+    # Artifacts of a previous analysis no longer apply
+    for key in ('analysis_structure', 'mindmap_image', 'wbs_image', 'json_image', 'json_code',
+                'mindmap_preview', 'wbs_preview', 'json_preview',
+                'mindmap_plantuml', 'wbs_plantuml', 'json_plantuml'):
+        st.session_state.pop(key, None)
+
+    st.session_state.analysis_result = job.result
+    st.session_state.analysis_complete = True
+    st.session_state.image_settings = job.report.get("image")
+    st.session_state.analysis_cache = job.report.get("cache")
+    st.session_state.video_keyframes = job.report.get("keyframes")
+    st.session_state.image_tiles = job.report.get("tiles")
+    st.session_state.image_quality = job.report.get("quality")
+    st.session_state.model_routes = job.report.get("routes")
+    st.session_state.analysis_notices = [("success", "Workplace analysis completed successfully!")]
+
+    meta = st.session_state.pop('analysis_meta', {})
+    st.session_state.result_id = results_store.save_analysis(job.result, **meta)
+
+def finish_artifacts_job(job):
+    st.session_state.pop('artifacts_job', None)
+    if job.status == "error":
+        st.session_state.artifact_notices = [("error", f"Artifact generation failed: {job.error}")]
+        return
+
+    notices = []
+    for name, result in (job.result or {}).items():
+        # Keep the PlantUML so a failed render can be retried without the LLM
+        st.session_state[f"{name}_plantuml"] = result["code"]
+        # The extracted findings stay usable even when their diagram failed to render
+        if result.get("structure") is not None:
+            st.session_state.analysis_structure = result["structure"]
+        if result["error"]:
+            notices.append(("error", f"{ARTIFACT_LABELS[name]} failed: {result['error']}"))
+            continue
+        st.session_state[f"{name}_image"] = result["image"]
+        st.session_state[f"{name}_preview"] = preview_image(result["image"])
+        if name == "json" and st.session_state.get('analysis_structure') is not None:
+            st.session_state.json_code = st.session_state.analysis_structure.to_json()
+        notices.append(("success", f"{ARTIFACT_LABELS[name]} ready ({result['seconds']:.1f}s"
+                                   + "".join(f", {route['stage']} on {route_label(route)}"
+                                             for route in result.get("routes", {}).values()) + ")"))
+    st.session_state.artifact_notices = notices
+
+    result_id = st.session_state.get('result_id')
+    if result_id is not None and st.session_state.get('analysis_structure') is not None:
+        results_store.set_structure(result_id, st.session_state.analysis_structure)
+        results_store.add_artifacts(result_id, {
+            name: {"code": result["code"], "image": result["image"], "format": "png"}
+            for name, result in (job.result or {}).items() if not result["error"]
+        })
+
+def load_result(result_id):
+    """Put a stored analysis and its artifacts back into the session, no model calls"""
+    record = results_store.get(result_id)
+    for key in ('analysis_structure', 'mindmap_image', 'wbs_image', 'json_image', 'json_code',
+                'mindmap_preview', 'wbs_preview', 'json_preview',
+                'mindmap_plantuml', 'wbs_plantuml', 'json_plantuml', 'image_settings', 'analysis_cache',
+                'video_keyframes', 'image_tiles', 'image_quality', 'model_routes'):
+        st.session_state.pop(key, None)
+
+    st.session_state.result_id = result_id
+    st.session_state.analysis_result = record["analysis"]
+    st.session_state.analysis_complete = True
+    if record["structure"]:
+        st.session_state.analysis_structure = RootCauseAnalysis.from_dict(record["structure"])
+        st.session_state.json_code = st.session_state.analysis_structure.to_json()
+    for name in record["artifacts"]:
+        artifact = results_store.artifact(result_id, name)
+        st.session_state[f"{name}_plantuml"] = artifact["code"]
+        if artifact["image"] is not None:
+            st.session_state[f"{name}_image"] = artifact["image"]
+            st.session_state[f"{name}_preview"] = preview_image(artifact["image"])
+
+def route_label(route):
+    """'model' or 'model (reason)' for a routing decision, reason being why the stage default was not used"""
+    if route.get("fallback_from"):
+        return f"{route['model']} (after {route['fallback_from']} timed out)"
+    return route["model"] if route["reason"] == "stage" else f"{route['model']} ({route['reason']})"
+
+def span_progress(spans, fraction=0.0):
+    """(percent, message) of a running analysis from its trace spans"""
+    percent, message = 2, "Starting analysis..."
+    for event in spans:
+        name = "merge" if event["attributes"].get("stage") == "merge" else event["name"]
+        if name in SPAN_PROGRESS and SPAN_PROGRESS[name][0] >= percent:
+            percent, message = SPAN_PROGRESS[name]
+    if fraction and percent < 80:
+        # Tiles and keyframes run concurrently, their completed share is the better measure
+        percent, message = max(percent, 30 + int(50 * fraction)), f"Analyzed {fraction:.0%} of the views..."
+    return percent, message
+
+def show_spans(spans, limit=8):
+    """Most recent finished spans with their timing and main attributes"""
+    lines = []
+    for event in [event for event in spans if event["duration"] is not None and event["depth"] > 0][-limit:]:
+        attributes = event["attributes"]
+        details = []
+        if attributes.get("width"):
+            details.append(f"{attributes['width']}x{attributes['height']}")
+        if attributes.get("bytes"):
+            details.append(f"{attributes['bytes'] / 1024:.0f} KB")
+        if attributes.get("stage"):
+            details.append(attributes["stage"])
+        lines.append(f"`{event['name']}` {event['duration'] * 1000:.0f} ms" + (f" ({', '.join(details)})" if details else ""))
+    if lines:
+        st.caption(" · ".join(lines))
+
+@st.fragment(run_every=1.0)
+def analysis_job_status():
+    """Progress and streamed text of the queued analysis, refreshed every second until it finishes"""
+    job = job_queue.get(st.session_state.get('analysis_job'))
+    if job is None:
+        st.session_state.pop('analysis_job', None)
+        return
+
+    state = job.snapshot()
+    if state["status"] == "queued":
+        st.info(f"Analysis queued, position {job_queue.position(job.id) or 1} in line...")
+    elif state["status"] == "running":
+        percent, message = span_progress(state["spans"], state["progress"])
+        st.progress(percent)
+        st.text(message)
+        show_spans(state["spans"])
+        if state["text"]:
+            st.markdown(state["text"])
+    else:
+        finish_analysis_job(job)
+        st.rerun()
+
+@st.fragment(run_every=1.0)
+def artifacts_job_status():
+    """Progress of the queued artifact build, refreshed every second until it finishes"""
+    job = job_queue.get(st.session_state.get('artifacts_job'))
+    if job is None:
+        st.session_state.pop('artifacts_job', None)
+        return
+
+    state = job.snapshot()
+    if state["status"] == "queued":
+        st.info(f"Artifacts queued, position {job_queue.position(job.id) or 1} in line...")
+    elif state["status"] == "running":
+        st.progress(state["progress"])
+        st.text("Extracting findings..." if not state["partial"] else
+                "Ready: " + ", ".join(ARTIFACT_LABELS[name] for name in state["partial"]))
+        show_spans(state["spans"])
+    else:
+        finish_artifacts_job(job)
+        st.rerun()
+
 # API Key Management
 if 'api_key' not in st.session_state:
     st.session_state.api_key = ""
 
+if 'tiled_analysis' not in st.session_state:
+    st.session_state.tiled_analysis = False
+if 'quality_gate_enabled' not in st.session_state:
+    st.session_state.quality_gate_enabled = True
+
+def init_pipeline_state():
+    """Session defaults taken from the analysis pipeline, set by the pages that need them"""
+    if 'quality_gate' in st.session_state:
+        return
+    analyze_rca = pipeline()
+    from quality_gate import QualityGate
+    # Image payload budget sent to the vision model (editable in Settings)
+    st.session_state.setdefault('image_max_kb', analyze_rca.MAX_IMAGE_BYTES // 1024)
+    st.session_state.setdefault('image_max_megapixels', analyze_rca.MAX_PIXELS / 1_000_000)
+    st.session_state.setdefault('image_format', analyze_rca.IMAGE_FORMAT)
+    # Per session, so near-duplicates are only flagged against this user's own uploads
+    st.session_state.quality_gate = QualityGate()
+
+def preview_image(data):
+    """Downscaled WebP/JPEG copy of an upload or diagram for the browser, cached by content hash.
+    Images OpenCV cannot decode are shown as they are"""
+    try:
+        preview, _ = pipeline().make_preview(data)
+    except ValueError:
+        return data
+    return preview
+
+@st.cache_data(max_entries=32, show_spinner=False)
+def upload_preview(file_id, _data):
+    """Preview of an upload, made once per file (file_id) so reruns neither hash nor resend the original"""
+    return preview_image(_data)
+
+def show_image(image, preview, key, caption=None):
+    """The preview, or the full resolution image once the user asks for it"""
+    full = st.toggle("Full resolution", key=key, help="Send the original image to the browser")
+    st.image(image if full else preview, caption=caption, use_container_width=True)
+
 # API Key Input Section
 with st.expander(" Groq API Key Configuration", expanded=not st.session_state.api_key):
     st.markdown('<div class="api-key-section">', unsafe_allow_html=True)
@@ -159,8 +494,8 @@ with st.expander(" Groq API Key Configuration", expanded=not st.session_state.ap
 # Navigation menu
 selected = option_menu(
     menu_title=None,
-    options=["Analysis", "Root Cause Map", "Resolution Plan", "JSON Data", "Settings"],
-    icons=["search", "diagram-2", "kanban", "file-earmark-code", "gear"],
+    options=["Analysis", "Root Cause Map", "Resolution Plan", "JSON Data", "History", "Trends", "Settings"],
+    icons=["search", "diagram-2", "kanban", "file-earmark-code", "clock-history", "graph-up", "gear"],
     menu_icon="cast",
     default_index=0,
     orientation="horizontal",
@@ -201,12 +536,12 @@ if selected == "Analysis":
         """, unsafe_allow_html=True)
 
     with col_status3:
-        diagrams_ready = (hasattr(st.session_state, 'mindmap_path') and
-                         hasattr(st.session_state, 'wbs_path') and
-                         hasattr(st.session_state, 'json_path'))
-        partial_diagrams = (hasattr(st.session_state, 'mindmap_path') or
-                           hasattr(st.session_state, 'wbs_path') or
-                           hasattr(st.session_state, 'json_path'))
+        diagrams_ready = (hasattr(st.session_state, 'mindmap_image') and
+                         hasattr(st.session_state, 'wbs_image') and
+                         hasattr(st.session_state, 'json_image'))
+        partial_diagrams = (hasattr(st.session_state, 'mindmap_image') or
+                           hasattr(st.session_state, 'wbs_image') or
+                           hasattr(st.session_state, 'json_image'))
         diagram_status = "success" if diagrams_ready else ("warning" if partial_diagrams else "error")
         diagram_text = "All Ready" if diagrams_ready else ("Partial" if partial_diagrams else "Not Generated")
         st.markdown(f"""
@@ -223,64 +558,82 @@ if selected == "Analysis":
         st.markdown("### Upload Workplace Image")
 
         st.markdown('<div class="upload-zone">', unsafe_allow_html=True)
+        # Header and navigation are already on screen, the background import has had a head start
         uploaded_file = st.file_uploader(
             "Drag and drop or browse files",
-            type=['png', 'jpg', 'jpeg', 'bmp', 'tiff'],
-            help="Upload a high-quality image of your workplace for comprehensive Root Cause Analysis",
+            type=['png', 'jpg', 'jpeg', 'bmp', 'tiff'] + [extension.lstrip('.') for extension in sorted(VIDEO_EXTENSIONS)],
+            help="Upload a high-quality image or a walk-through video of your workplace for comprehensive Root Cause Analysis",
             label_visibility="collapsed"
         )
         st.markdown('</div>', unsafe_allow_html=True)
 
+        # Tags stored with the result for history and trend lookups
+        tag_col1, tag_col2 = st.columns(2)
+        site_tag = tag_col1.text_input("Site", key="site_tag", placeholder="e.g. Plant 2")
+        area_tag = tag_col2.text_input("Area", key="area_tag", placeholder="e.g. Line 4 packing")
+
         if uploaded_file:
-            st.image(uploaded_file, caption="Uploaded Workplace Image", use_container_width=True)
+            upload_extension = os.path.splitext(uploaded_file.name)[1].lower()
+            is_video = upload_extension in VIDEO_EXTENSIONS
+            if is_video:
+                st.video(uploaded_file)
+            else:
+                show_image(uploaded_file, upload_preview(uploaded_file.file_id, uploaded_file.getvalue()),
+                           "upload_full_resolution", caption="Uploaded Workplace Image")
+
+            show_notices('analysis_notices')
 
             # Analysis button with modern styling
-            if st.button("Start AI Analysis", type="primary", use_container_width=True, disabled=not st.session_state.api_key):
+            analysis_running = st.session_state.get('analysis_job') is not None
+            if st.button("Start AI Analysis", type="primary", use_container_width=True,
+                         disabled=not st.session_state.api_key or analysis_running):
                 if not st.session_state.api_key:
                     st.error("API key not configured. Please check your .env file.")
                 else:
-                    progress_bar = st.progress(0)
-                    status_text = st.empty()
-
-                    try:
-                        # Save uploaded file temporarily
-                        with tempfile.NamedTemporaryFile(delete=False, suffix=Path(uploaded_file.name).suffix) as tmp_file:
-                            tmp_file.write(uploaded_file.getvalue())
-                            temp_path = tmp_file.name
-
-                        status_text.text("Preprocessing image...")
-                        progress_bar.progress(25)
-
-                        status_text.text("Running AI analysis...")
-                        progress_bar.progress(50)
-
-                        # Perform analysis
-                        analysis_result = analyze_workplace(temp_path, st.session_state.api_key)
-                        progress_bar.progress(75)
-
-                        status_text.text("Generating results...")
-
-                        # Store results in session state
-                        st.session_state.analysis_result = analysis_result
-                        st.session_state.analysis_complete = True
-
-                        progress_bar.progress(100)
-                        status_text.text("Analysis complete!")
-
-                        st.success("Workplace analysis completed successfully!")
-                        st.rerun()
-
-                    except Exception as e:
-                        st.error(f"Analysis failed: {str(e)}")
-                    finally:
-                        # Clean up temp file
-                        if os.path.exists(temp_path):
-                            os.unlink(temp_path)
+                    init_pipeline_state()
+                    analyze_rca = pipeline()
+                    # Everything the job needs is captured now, the worker never touches session state
+                    upload = uploaded_file.getvalue()
+                    api_key = st.session_state.api_key
+                    payload_settings = dict(
+                        max_bytes=int(st.session_state.image_max_kb * 1024),
+                        max_pixels=int(st.session_state.image_max_megapixels * 1_000_000),
+                        image_format=st.session_state.image_format
+                    )
+                    # Unusable images are rejected locally before they cost an API call
+                    quality_gate = st.session_state.quality_gate if st.session_state.quality_gate_enabled else None
+
+                    if is_video:
+                        # Only the selected keyframes are analyzed, then merged into one report
+                        def make_events(report):
+                            return analyze_rca.analyze_video_stream(upload, api_key, suffix=upload_extension,
+                                                                    report=report, **payload_settings)
+                    elif st.session_state.tiled_analysis:
+                        # Large images are analyzed as concurrent full-resolution tiles
+                        def make_events(report):
+                            return analyze_rca.analyze_tiled_stream(upload, api_key, report=report,
+                                                                    quality_gate=quality_gate, **payload_settings)
+                    else:
+                        def make_events(report):
+                            return analyze_rca.analyze_workplace_stream(upload, api_key, report=report,
+                                                                        quality_gate=quality_gate, **payload_settings)
+
+                    st.session_state.analysis_job = job_queue.submit("analysis", stream_job(make_events), api_key)
+                    st.session_state.analysis_meta = {
+                        "image_hash": cache_key(upload), "source": uploaded_file.name, "site": site_tag.strip(),
+                        "area": area_tag.strip(),
+                        "mode": "video" if is_video else "tiled" if st.session_state.tiled_analysis else "image",
+                    }
+                    st.rerun()
 
     with main_col2:
         st.markdown("### Analysis Results")
 
-        if hasattr(st.session_state, 'analysis_complete') and st.session_state.analysis_complete:
+        if st.session_state.get('analysis_job'):
+            # The report streams in here while the queued analysis runs
+            analysis_job_status()
+
+        elif hasattr(st.session_state, 'analysis_complete') and st.session_state.analysis_complete:
 
             # Results container with modern styling
             st.markdown('<div class="results-container">', unsafe_allow_html=True)
@@ -289,6 +642,45 @@ if selected == "Analysis":
             with st.expander("Detailed Root Cause Analysis Report", expanded=True):
                 st.markdown(st.session_state.analysis_result)
 
+            image_settings = st.session_state.get('image_settings')
+            if image_settings:
+                st.caption(
+                    f"Image sent: {image_settings['width']}x{image_settings['height']} "
+                    f"{image_settings['format'].upper()} at quality {image_settings['quality']}, "
+                    f"{image_settings['bytes'] / 1024:.0f} KB of {image_settings['max_bytes'] / 1024:.0f} KB budget"
+                    + (" (served from cache)" if st.session_state.get('analysis_cache') == "hit" else "")
+                )
+
+            model_routes = st.session_state.get('model_routes')
+            if model_routes:
+                st.caption("Models: " + ", ".join(f"{stage} on {route_label(route)}"
+                                                  for stage, route in model_routes.items()))
+
+            image_quality = st.session_state.get('image_quality')
+            if image_quality and image_quality["warnings"]:
+                st.warning("Borderline image quality, findings may be less reliable: "
+                           + "; ".join(image_quality["warnings"]) + ".")
+
+            video_keyframes = st.session_state.get('video_keyframes')
+            if video_keyframes:
+                from video_keyframes import format_timestamp
+                st.caption(
+                    f"Merged from {len(video_keyframes)} keyframes at "
+                    + ", ".join(format_timestamp(keyframe['timestamp']) for keyframe in video_keyframes)
+                )
+
+            image_tiles = st.session_state.get('image_tiles')
+            if image_tiles:
+                st.caption(f"Merged from {len(image_tiles)} full-resolution tiles of "
+                           f"{image_tiles[0]['width']}x{image_tiles[0]['height']} plus a whole-scene overview")
+
+            show_notices('artifact_notices')
+            if st.session_state.get('artifacts_job'):
+                artifacts_job_status()
+            elif st.button("Generate All Artifacts", use_container_width=True):
+                submit_artifacts()
+                st.rerun()
+
             st.markdown('</div>', unsafe_allow_html=True)
 
         else:
@@ -298,37 +690,25 @@ elif selected == "Root Cause Map":
     st.markdown("### Root Cause Analysis Map")
 
     if hasattr(st.session_state, 'analysis_complete') and st.session_state.analysis_complete:
-        if hasattr(st.session_state, 'mindmap_path') and os.path.exists(st.session_state.mindmap_path):
-            st.image(st.session_state.mindmap_path, use_container_width=True)
-
-            with open(st.session_state.mindmap_path, "rb") as file:
-                st.download_button(
-                    label="Download Root Cause Map",
-                    data=file.read(),
-                    file_name="root_cause_analysis_map.png",
-                    mime="image/png",
-                    use_container_width=True
-                )
+        show_notices('artifact_notices')
+        if hasattr(st.session_state, 'mindmap_image'):
+            show_image(st.session_state.mindmap_image, st.session_state.mindmap_preview, "mindmap_full_resolution")
+
+            st.download_button(
+                label="Download Root Cause Map",
+                data=st.session_state.mindmap_image,
+                file_name="root_cause_analysis_map.png",
+                mime="image/png",
+                use_container_width=True
+            )
         else:
             col1, col2 = st.columns([1, 1])
             with col1:
-                if st.button("Generate Root Cause Map", use_container_width=True, type="primary"):
-                    if hasattr(st.session_state, 'analysis_result'):
-                        with st.spinner("Creating root cause map visualization..."):
-                            try:
-                                mindmap_code = generate_analysis_mindmap(st.session_state.analysis_result, st.session_state.api_key)
-                                mindmap_path = create_plantuml_diagram(mindmap_code, "analysis_mindmap")
-
-                                if mindmap_path and os.path.exists(mindmap_path):
-                                    st.session_state.mindmap_path = mindmap_path
-                                    st.success("Root cause map generated!")
-                                    st.rerun()
-                                else:
-                                    st.error("Failed to generate root cause map")
-                            except Exception as e:
-                                st.error(f"Root cause map generation failed: {str(e)}")
-                    else:
-                        st.warning("Please complete an analysis first")
+                if st.session_state.get('artifacts_job'):
+                    artifacts_job_status()
+                elif st.button("Retry Rendering" if st.session_state.get('mindmap_plantuml') else "Generate Root Cause Map", use_container_width=True, type="primary"):
+                    retry_artifact("mindmap")
+                    st.rerun()
     else:
         st.info("Please complete an analysis first to generate root cause map")
 
@@ -336,37 +716,25 @@ elif selected == "Resolution Plan":
     st.markdown("### Root Cause Resolution Plan")
 
     if hasattr(st.session_state, 'analysis_complete') and st.session_state.analysis_complete:
-        if hasattr(st.session_state, 'wbs_path') and os.path.exists(st.session_state.wbs_path):
-            st.image(st.session_state.wbs_path, use_container_width=True)
-
-            with open(st.session_state.wbs_path, "rb") as file:
-                st.download_button(
-                    label="Download Resolution Plan",
-                    data=file.read(),
-                    file_name="root_cause_resolution_plan.png",
-                    mime="image/png",
-                    use_container_width=True
-                )
+        show_notices('artifact_notices')
+        if hasattr(st.session_state, 'wbs_image'):
+            show_image(st.session_state.wbs_image, st.session_state.wbs_preview, "wbs_full_resolution")
+
+            st.download_button(
+                label="Download Resolution Plan",
+                data=st.session_state.wbs_image,
+                file_name="root_cause_resolution_plan.png",
+                mime="image/png",
+                use_container_width=True
+            )
         else:
             col1, col2 = st.columns([1, 1])
             with col1:
-                if st.button("Generate Resolution Plan", use_container_width=True, type="primary"):
-                    if hasattr(st.session_state, 'analysis_result'):
-                        with st.spinner("Creating resolution plan..."):
-                            try:
-                                wbs_code = generate_improvement_wbs(st.session_state.analysis_result, st.session_state.api_key)
-                                wbs_path = create_plantuml_diagram(wbs_code, "improvement_wbs")
-
-                                if wbs_path and os.path.exists(wbs_path):
-                                    st.session_state.wbs_path = wbs_path
-                                    st.success("Resolution plan generated!")
-                                    st.rerun()
-                                else:
-                                    st.error("Failed to generate resolution plan")
-                            except Exception as e:
-                                st.error(f"Resolution plan generation failed: {str(e)}")
-                    else:
-                        st.warning("Please complete an analysis first")
+                if st.session_state.get('artifacts_job'):
+                    artifacts_job_status()
+                elif st.button("Retry Rendering" if st.session_state.get('wbs_plantuml') else "Generate Resolution Plan", use_container_width=True, type="primary"):
+                    retry_artifact("wbs")
+                    st.rerun()
     else:
         st.info("Please complete an analysis first to generate resolution plan")
 
@@ -374,19 +742,19 @@ elif selected == "JSON Data":
     st.markdown("### Structured Root Cause Analysis Data")
 
     if hasattr(st.session_state, 'analysis_complete') and st.session_state.analysis_complete:
-        if hasattr(st.session_state, 'json_path') and os.path.exists(st.session_state.json_path):
-            st.image(st.session_state.json_path, use_container_width=True)
+        show_notices('artifact_notices')
+        if hasattr(st.session_state, 'json_image'):
+            show_image(st.session_state.json_image, st.session_state.json_preview, "json_full_resolution")
 
             col1, col2 = st.columns(2)
             with col1:
-                with open(st.session_state.json_path, "rb") as file:
-                    st.download_button(
-                        label="Download JSON Diagram",
-                        data=file.read(),
-                        file_name="root_cause_analysis_data.png",
-                        mime="image/png",
-                        use_container_width=True
-                    )
+                st.download_button(
+                    label="Download JSON Diagram",
+                    data=st.session_state.json_image,
+                    file_name="root_cause_analysis_data.png",
+                    mime="image/png",
+                    use_container_width=True
+                )
 
             with col2:
                 if hasattr(st.session_state, 'json_code'):
@@ -400,24 +768,11 @@ elif selected == "JSON Data":
         else:
             col1, col2 = st.columns([1, 1])
             with col1:
-                if st.button("Generate JSON Data", use_container_width=True, type="primary"):
-                    if hasattr(st.session_state, 'analysis_result'):
-                        with st.spinner("Creating structured JSON data visualization..."):
-                            try:
-                                json_code = generate_analysis_json(st.session_state.analysis_result, st.session_state.api_key)
-                                json_path = create_plantuml_diagram(json_code, "analysis_json")
-
-                                if json_path and os.path.exists(json_path):
-                                    st.session_state.json_path = json_path
-                                    st.session_state.json_code = json_code
-                                    st.success("JSON data diagram generated!")
-                                    st.rerun()
-                                else:
-                                    st.error("Failed to generate JSON data diagram")
-                            except Exception as e:
-                                st.error(f"JSON data generation failed: {str(e)}")
-                    else:
-                        st.warning("Please complete an analysis first")
+                if st.session_state.get('artifacts_job'):
+                    artifacts_job_status()
+                elif st.button("Retry Rendering" if st.session_state.get('json_plantuml') else "Generate JSON Data", use_container_width=True, type="primary"):
+                    retry_artifact("json")
+                    st.rerun()
 
             with col2:
                 st.info("""
@@ -430,8 +785,128 @@ elif selected == "JSON Data":
     else:
         st.info("Please complete an analysis first to generate JSON data")
 
+elif selected == "History":
+    st.markdown("### Analysis History")
+    st.caption("Every completed analysis is kept locally with its findings and diagrams. Opening one makes no model calls.")
+
+    locations = results_store.locations()
+    sites = sorted({location["site"] for location in locations if location["site"]})
+    areas = sorted({location["area"] for location in locations if location["area"]})
+
+    filter_col1, filter_col2, filter_col3, filter_col4 = st.columns(4)
+    with filter_col1:
+        severity_filter = st.multiselect("Severity", SEVERITIES, format_func=str.title)
+    with filter_col2:
+        date_filter = st.date_input("Date range", value=(), help="Leave empty for all dates")
+    with filter_col3:
+        site_filter = st.selectbox("Site", ["All sites"] + sites)
+    with filter_col4:
+        area_filter = st.selectbox("Area", ["All areas"] + areas)
+
+    filters = {
+        "severity": severity_filter or None,
+        "since": date_filter[0] if len(date_filter) > 0 else None,
+        "until": date_filter[1] if len(date_filter) > 1 else (date_filter[0] if len(date_filter) == 1 else None),
+        "site": None if site_filter == "All sites" else site_filter,
+        "area": None if area_filter == "All areas" else area_filter,
+    }
+    page_size = 25
+    total = results_store.search(limit=0, **filters)["total"]
+    pages = max(1, -(-total // page_size))
+    page = st.number_input(f"Page (of {pages})", min_value=1, max_value=pages, value=1, step=1)
+    results = results_store.search(limit=page_size, offset=(page - 1) * page_size, **filters)
+
+    if not results["items"]:
+        st.info("No stored analyses match these filters")
+    else:
+        columns = ["id", "created", "site", "area", "source", "critical", "high", "medium", "low", "preview"]
+        history = [
+            {**{name: item[name] for name in columns}, "created": time.strftime("%Y-%m-%d %H:%M", time.localtime(item["created"]))}
+            for item in results["items"]
+        ]
+        st.caption(f"{total} analyses")
+        st.dataframe(history, hide_index=True, use_container_width=True)
+
+        open_col1, open_col2 = st.columns([1, 3])
+        with open_col1:
+            open_id = st.selectbox("Analysis", [item["id"] for item in results["items"]])
+        with open_col2:
+            st.write("")
+            if st.button("Open in Analysis", type="primary"):
+                load_result(open_id)
+                st.success(f"Analysis {open_id} loaded, see the Analysis and diagram pages")
+
+elif selected == "Trends":
+    st.markdown("### Plant-wide Trends")
+    st.caption("Issue counts, recurring root causes and moving averages across every stored analysis")
+
+    locations = results_store.locations()
+    sites = sorted({location["site"] for location in locations if location["site"]})
+    areas = sorted({location["area"] for location in locations if location["area"]})
+
+    filter_col1, filter_col2, filter_col3, filter_col4 = st.columns(4)
+    with filter_col1:
+        trend_since = st.date_input("From", value=datetime.date.today() - datetime.timedelta(days=365))
+    with filter_col2:
+        trend_until = st.date_input("To", value=datetime.date.today())
+    with filter_col3:
+        trend_site = st.selectbox("Site", ["All sites"] + sites, key="trend_site")
+    with filter_col4:
+        trend_area = st.selectbox("Area", ["All areas"] + areas, key="trend_area")
+    window = st.slider("Moving average (weeks)", min_value=1, max_value=12, value=4)
+
+    load_start = time.perf_counter()
+    table = issue_table(results_store.version(), trend_since, trend_until,
+                        None if trend_site == "All sites" else trend_site,
+                        None if trend_area == "All areas" else trend_area)
+    load_seconds = time.perf_counter() - load_start
+    from rca_trends import trend_report
+    trends = trend_report(table, window=window)
+
+    if not trends["analyses"]:
+        st.info("No stored analyses in this range yet")
+    else:
+        metric_cols = st.columns(5)
+        metric_cols[0].metric("Analyses", trends["analyses"])
+        for col, severity in zip(metric_cols[1:], SEVERITIES):
+            col.metric(severity.title(), trends["severity"][severity])
+
+        weekly = trends["weekly"]
+        st.markdown("#### Issues per week")
+        st.line_chart(
+            {"week": weekly["weeks"],
+             **{severity.title(): weekly["counts"][:, index] for index, severity in enumerate(SEVERITIES)},
+             f"Total ({window}-week average)": trends["weekly_total_average"]},
+            x="week"
+        )
+
+        st.markdown("#### Issues per analysis")
+        st.line_chart(
+            {"week": weekly["weeks"], f"{window}-week average": trends["issues_per_analysis_average"]}, x="week"
+        )
+
+        st.markdown("#### Issues by area")
+        by_area = trends["areas"]
+        st.bar_chart(
+            {"area": [area or "Untagged" for area in by_area["areas"]],
+             **{severity.title(): by_area["counts"][:, index] for index, severity in enumerate(SEVERITIES)}},
+            x="area", y=[severity.title() for severity in SEVERITIES], horizontal=True
+        )
+
+        st.markdown("#### Top recurring root causes")
+        if trends["root_causes"]:
+            st.dataframe(trends["root_causes"], hide_index=True, use_container_width=True)
+        else:
+            st.caption("No root causes recorded yet, they are filled in when artifacts are generated")
+
+        st.caption(f"{trends['issues']} issues loaded in {load_seconds * 1000:.0f} ms, "
+                   f"aggregated in {trends['seconds'] * 1000:.0f} ms")
+
 elif selected == "Settings":
     st.markdown("### Configuration")
+    init_pipeline_state()
+    analyze_rca = pipeline()
+    from plantuml_render import KROKI_BREAKER
 
     if st.session_state.api_key:
         st.success(f"Groq API Key: Configured (ends with ...{st.session_state.api_key[-4:]})")
@@ -439,10 +914,149 @@ elif selected == "Settings":
         st.info("💡 You can now enter your API key using the configuration section above instead of using a .env file.")
         st.code('GROQ_API_KEY=your_api_key_here')
 
+    st.markdown("#### Image Payload Budget")
+    st.caption("Controls how large the image sent to the vision model is. Smaller payloads upload faster on slow networks.")
+
+    budget_col1, budget_col2, budget_col3 = st.columns(3)
+    with budget_col1:
+        st.session_state.image_max_kb = st.number_input(
+            "Max encoded size (KB)", min_value=16, max_value=3072,
+            value=int(st.session_state.image_max_kb), step=16
+        )
+    with budget_col2:
+        st.session_state.image_max_megapixels = st.number_input(
+            "Max resolution (megapixels)", min_value=0.1, max_value=8.0,
+            value=float(st.session_state.image_max_megapixels), step=0.1
+        )
+    with budget_col3:
+        formats = list(analyze_rca.IMAGE_ENCODERS)
+        st.session_state.image_format = st.selectbox(
+            "Encoding format", formats,
+            index=formats.index(st.session_state.image_format)
+        )
+
+    st.session_state.quality_gate_enabled = st.checkbox(
+        "Image quality gate",
+        value=st.session_state.quality_gate_enabled,
+        help="Check blur, exposure and contrast locally and reject unusable images before they use an API call. "
+             "Borderline images are analyzed with a warning."
+    )
+    st.session_state.tiled_analysis = st.checkbox(
+        "Tiled high-resolution analysis",
+        value=st.session_state.tiled_analysis,
+        help="Split large images into overlapping tiles at the resolution above and analyze them concurrently, "
+             "keeping small details such as labels, cables and spills. Costs one request per tile plus a merge."
+    )
+
+    st.markdown("#### Analysis Cache")
+    st.caption("Repeat analyses of the same image are served from a local cache instead of a new Groq call.")
+
+    analysis_cache = analyze_rca.get_analysis_cache()
+    cache_stats = analysis_cache.stats()
+    cache_col1, cache_col2, cache_col3, cache_col4 = st.columns(4)
+    cache_col1.metric("Cached analyses", cache_stats["entries"])
+    cache_col2.metric("Cache size", f"{cache_stats['bytes'] / 1024:.0f} KB")
+    cache_col3.metric("Hits / Misses", f"{cache_stats['hits']} / {cache_stats['misses']}")
+    cache_col4.metric("Hit rate", f"{cache_stats['hit_rate']:.0%}")
+
+    if st.button("Clear analysis cache"):
+        analysis_cache.clear()
+        st.rerun()
+
+    st.markdown("#### Performance Metrics")
+    st.caption("Latency, tokens and estimated cost per stage for recent Groq and render calls in this server process.")
+
+    metric_rows = rca_metrics.summarize()
+    if metric_rows:
+        totals_col1, totals_col2, totals_col3 = st.columns(3)
+        totals_col1.metric("Calls", sum(row["calls"] for row in metric_rows))
+        totals_col2.metric("Tokens (prompt / completion)",
+                           f"{sum(row['prompt_tokens'] for row in metric_rows):,} / {sum(row['completion_tokens'] for row in metric_rows):,}")
+        totals_col3.metric("Estimated cost", f"${sum(row['cost_usd'] for row in metric_rows):.4f}")
+        st.dataframe(metric_rows, use_container_width=True, hide_index=True)
+    else:
+        st.info("No calls recorded yet. Run an analysis to collect metrics.")
+    st.caption(f"Full call log: {rca_metrics.METRICS_LOG} | kroki.io circuit: {KROKI_BREAKER.state}")
+
+    st.markdown("#### Model Routing")
+    st.caption("Model per stage. Formatting stages use the fast text model, move to the large model for prompts over "
+               f"{rca_routing.LARGE_PROMPT_BYTES // 1000} KB and switch to the fallback when the first chunk is late. "
+               "Override with RCA_MODEL_ROUTES (JSON or a JSON file path).")
+    st.dataframe([
+        {"Stage": row["stage"], "Model": row["model"], "Large prompts": row["large_model"] or "-",
+         "Fallback": row["fallback"] or "-",
+         "First chunk timeout": f"{row['timeout']:.0f}s" if row["timeout"] else
+                                "auto" if row["fallback"] else "-"}
+        for row in rca_routing.routing_table()
+    ], hide_index=True, use_container_width=True)
+
+    st.markdown("#### Connection Pools")
+    client_stats = shared_client_registry().stats()
+    pool_col1, pool_col2, pool_col3 = st.columns(3)
+    pool_col1.metric("Pooled Groq clients", client_stats["groq_clients"])
+    pool_col2.metric("Connections per pool", client_stats["pool_size"])
+    pool_col3.metric("Timeouts (Groq / render)", f"{client_stats['groq_timeout']:.0f}s / {client_stats['render_timeout']:.0f}s")
+
+    st.markdown("#### Background Jobs")
+    st.caption("Analyses and artifacts run on a worker pool shared by every session, capped globally and per API key.")
+    job_stats = job_queue.stats()
+    job_col1, job_col2, job_col3, job_col4 = st.columns(4)
+    job_col1.metric("Running", f"{job_stats['running']} / {job_stats['workers']}")
+    job_col2.metric("Queued", job_stats["queued"])
+    job_col3.metric("Per API key limit", job_stats["per_key"])
+    job_col4.metric("Finished / Failed", f"{job_stats['done']} / {job_stats['errors']}")
+
+    st.markdown("#### Trace Hot Spots")
+    st.caption("Time per pipeline step (decode, resize, encode, base64, request, response, parse, render) across recent runs. "
+               "Set RCA_TRACE_FILE to also append every span to a Chrome trace file.")
+    trace_rows = rca_trace.summary()
+    if trace_rows:
+        st.dataframe([
+            {"Span": row["span"], "Calls": row["count"], "Total (s)": round(row["total_seconds"], 2),
+             "Mean (ms)": round(row["mean_seconds"] * 1000, 1), "p50 (ms)": round(row["p50_seconds"] * 1000, 1),
+             "p95 (ms)": round(row["p95_seconds"] * 1000, 1)}
+            for row in trace_rows
+        ], hide_index=True, use_container_width=True)
+        st.download_button("Download trace (chrome://tracing, Perfetto)", rca_trace.export_chrome_trace(),
+                           file_name="rca_trace.json", mime="application/json")
+    else:
+        st.info("No spans recorded yet in this server process")
+
+    st.markdown("#### App Performance")
+    st.caption("Script run times of this server process. The first run pays for the imports, reruns from widget "
+               "changes and tab switches reuse cached resources and the background-loaded pipeline.")
+    timings = app_timings()
+    runs = list(timings["runs"])
+    rerun_seconds = [seconds for _, seconds in runs]
+    perf_col1, perf_col2, perf_col3, perf_col4 = st.columns(4)
+    perf_col1.metric("Cold start", f"{timings['first_run'] * 1000:.0f} ms" if timings["first_run"] else "-")
+    perf_col2.metric("Pipeline import", f"{timings['pipeline_import'] * 1000:.0f} ms"
+                     if timings["pipeline_import"] else "loading...")
+    perf_col3.metric("Rerun p50", f"{rca_metrics.percentile(rerun_seconds, 50) * 1000:.0f} ms" if runs else "-")
+    perf_col4.metric("Rerun p95", f"{rca_metrics.percentile(rerun_seconds, 95) * 1000:.0f} ms" if runs else "-")
+    by_page = {}
+    for page, seconds in runs:
+        by_page.setdefault(page, []).append(seconds)
+    if by_page:
+        st.dataframe([
+            {"Page": page, "Runs": len(values), "p50 (ms)": round(rca_metrics.percentile(values, 50) * 1000, 1),
+             "p95 (ms)": round(rca_metrics.percentile(values, 95) * 1000, 1)}
+            for page, values in by_page.items()
+        ], hide_index=True, use_container_width=True)
+
 # Footer
 st.markdown("---")
 st.markdown("""
 <div style='text-align: center; color: #666; padding: 1rem;'>
     <strong>Root Cause Analysis Platform</strong> | Powered by OpenCV, Groq AI & PlantUML | Built with Streamlit
 </div>
-""", unsafe_allow_html=True)
\ No newline at end of file
+""", unsafe_allow_html=True)
+
+# Run time of this script run; runs cut short by st.rerun() are not counted
+run_seconds = time.perf_counter() - SCRIPT_START
+timings = app_timings()
+if timings["first_run"] is None:
+    timings["first_run"] = run_seconds
+else:
+    timings["runs"].append((selected, run_seconds))
+st.caption(f"Rendered in {run_seconds * 1000:.0f} ms | cold start {timings['first_run'] * 1000:.0f} ms")
@@ -0,0 +1,271 @@
+import argparse
+import glob
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime, timezone
+
+from analyze_rca import analyze_workplace, analyze_video, analyze_tiled, iter_artifacts, render_artifact, ARTIFACTS
+from rca_cache import cache_key, file_cache_key
+from video_keyframes import VIDEO_EXTENSIONS
+from quality_gate import QualityGate, ImageRejected
+from rca_schema import RootCauseAnalysis
+from rca_store import get_results_store
+from rca_metrics import percentile
+import rca_trace
+
+IMAGE_EXTENSIONS = {".png", ".jpg", ".jpeg", ".bmp", ".tiff", ".tif", ".webp"}
+
+STAGES = ["quality", "preprocess", "keyframes", "tiling", "analysis", "merge", "extract"] + [f"{name}_render" for name in ARTIFACTS]
+
+class RateLimiter:
+    """Spaces calls evenly so that at most `rpm` requests start per minute"""
+
+    def __init__(self, rpm):
+        self.interval = 60.0 / rpm if rpm else 0.0
+        self._next_slot = 0.0
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        if not self.interval:
+            return
+        with self._lock:
+            now = time.monotonic()
+            wait = self._next_slot - now
+            self._next_slot = max(now, self._next_slot) + self.interval
+        if wait > 0:
+            time.sleep(wait)
+
+def collect_images(inputs, recursive=False):
+    """Expand directories and glob patterns into a sorted, de-duplicated list of image and video paths"""
+    paths = set()
+    for item in inputs:
+        if os.path.isdir(item):
+            pattern = os.path.join(item, "**", "*") if recursive else os.path.join(item, "*")
+            candidates = glob.glob(pattern, recursive=recursive)
+        else:
+            candidates = glob.glob(item, recursive=True)
+        for path in candidates:
+            if os.path.isfile(path) and os.path.splitext(path)[1].lower() in IMAGE_EXTENSIONS | VIDEO_EXTENSIONS:
+                paths.add(os.path.abspath(path))
+    return sorted(paths)
+
+def load_checkpoint(output_path):
+    """Images already analysed successfully according to an existing results file, and the
+    latest partial records (analysis done, some render failed) keyed by image"""
+    done = set()
+    partial = {}
+    if not os.path.exists(output_path):
+        return done, partial
+    with open(output_path, encoding="utf-8") as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                # A run killed mid-write leaves a partial last line
+                continue
+            # Rejected images would be rejected again, only errors are retried
+            if record.get("status") in ("ok", "rejected"):
+                done.add(record["image"])
+                partial.pop(record["image"], None)
+            elif record.get("status") == "partial":
+                partial[record["image"]] = record
+    return done, partial
+
+def diagram_path(diagram_dir, image_path, name):
+    # Path hash keeps same-named images from different folders apart
+    stem = f"{os.path.splitext(os.path.basename(image_path))[0]}_{cache_key(image_path)[:8]}"
+    return os.path.join(diagram_dir, f"{stem}_{ARTIFACTS[name][1]}.png")
+
+def save_artifact(record, name, artifact, diagram_dir):
+    entry = {"code": artifact["code"], "path": None, "error": artifact["error"]}
+    if artifact["image"] is not None and diagram_dir:
+        entry["path"] = diagram_path(diagram_dir, record["image"], name)
+        with open(entry["path"], "wb") as f:
+            f.write(artifact["image"])
+    record["artifacts"][name] = entry
+
+def finish_record(record, start):
+    failed = [name for name, entry in record["artifacts"].items() if entry["error"]]
+    if failed and record["status"] not in ("error", "rejected"):
+        record["status"] = "partial"
+        record["error"] = f"Artifacts failed: {', '.join(failed)}"
+    elif record["status"] not in ("error", "rejected"):
+        record["status"] = "ok"
+        record["error"] = None
+    record["timings"]["total"] = time.perf_counter() - start
+    record["finished_at"] = datetime.now(timezone.utc).isoformat()
+    return record
+
+def rerender_one(record, diagram_dir=None):
+    """Retry only the failed renders of a partial record from its saved PlantUML, no LLM calls"""
+    start = time.perf_counter()
+    record["timings"] = {}
+    try:
+        for name, entry in record["artifacts"].items():
+            if entry["error"] and entry["code"]:
+                artifact = render_artifact(entry["code"])
+                record["timings"][f"{name}_render"] = artifact["render_seconds"]
+                try:
+                    save_artifact(record, name, artifact, diagram_dir)
+                except OSError as e:
+                    # The record stays partial, so the next run retries this render without LLM calls
+                    entry["error"] = f"Could not save diagram: {e}"
+    except Exception as e:
+        record["status"] = "error"
+        record["error"] = str(e)
+    return finish_record(record, start)
+
+def process_one(image_path, api_key, limiter, diagram_dir=None, diagrams=True, tiled=False, quality_gate=None):
+    """Analyse one image or video, build its artifacts and return the JSONL record"""
+    record = {"image": image_path, "status": "ok", "error": None, "artifacts": {}, "timings": {}}
+    start = time.perf_counter()
+    try:
+        report = {}
+        if os.path.splitext(image_path)[1].lower() in VIDEO_EXTENSIONS:
+            record["analysis"] = analyze_video(image_path, api_key, report=report, rate_limiter=limiter)
+            record["keyframes"] = report.get("keyframes")
+        elif tiled:
+            record["analysis"] = analyze_tiled(image_path, api_key, report=report, rate_limiter=limiter,
+                                               quality_gate=quality_gate)
+            record["tiles"] = report.get("tiles")
+        else:
+            record["analysis"] = analyze_workplace(image_path, api_key, report=report, rate_limiter=limiter,
+                                                   quality_gate=quality_gate)
+        record["quality"] = report.get("quality")
+        record["cache"] = report.get("cache")
+        record["routes"] = report.get("routes", {})
+        record["timings"].update(report.get("timings", {}))
+
+        # One structured extraction call, diagrams are then generated and rendered locally
+        artifacts = iter_artifacts(record["analysis"], api_key, rate_limiter=limiter) if diagrams else []
+        for name, artifact in artifacts:
+            record["structure"] = artifact["structure"].to_dict()
+            record["timings"]["extract"] = artifact["generate_seconds"]
+            record["timings"][f"{name}_render"] = artifact["render_seconds"]
+            record["routes"].update(artifact["routes"])
+            save_artifact(record, name, artifact, diagram_dir)
+    except ImageRejected as e:
+        # Rejected locally in milliseconds, no rate-limited request was used
+        record["status"] = "rejected"
+        record["error"] = str(e)
+        record["quality"] = e.result
+    except Exception as e:
+        record["status"] = "error"
+        record["error"] = str(e)
+
+    return finish_record(record, start)
+
+def store_record(store, record, site=None, area=None):
+    """Add a finished record to the results store, or its re-rendered diagrams to the stored entry"""
+    artifacts = {name: {"code": entry["code"], "path": entry["path"], "format": "png"}
+                 for name, entry in record["artifacts"].items() if not entry["error"]}
+    if record.get("result_id") is not None:
+        store.add_artifacts(record["result_id"], artifacts)
+        return
+    if record["status"] not in ("ok", "partial") or not record.get("analysis"):
+        return
+    image_hash = file_cache_key(record["image"])
+    structure = RootCauseAnalysis.from_dict(record["structure"]) if record.get("structure") else None
+    mode = "video" if os.path.splitext(record["image"])[1].lower() in VIDEO_EXTENSIONS else "tiled" if record.get("tiles") else "image"
+    record["result_id"] = store.save_analysis(record["analysis"], structure, image_hash=image_hash, site=site, area=area,
+                                              source=record["image"], mode=mode, artifacts=artifacts)
+
+def print_summary(records, elapsed):
+    """Throughput and per-stage latency of the records processed in this run"""
+    ok = sum(1 for r in records if r["status"] == "ok")
+    rejected = sum(1 for r in records if r["status"] == "rejected")
+    print("\n" + "=" * 50)
+    print(f"Processed {len(records)} images in {elapsed:.1f}s ({ok} ok, {rejected} rejected by the quality gate, {len(records) - ok - rejected} with errors)")
+    if elapsed > 0:
+        print(f"Throughput: {len(records) / elapsed * 60:.1f} images/min")
+
+    print(f"\n{'stage':<18}{'count':>7}{'mean':>9}{'p50':>9}{'p95':>9}")
+    for stage in STAGES + ["total"]:
+        values = [r["timings"][stage] for r in records if r["timings"].get(stage) is not None]
+        if values:
+            print(f"{stage:<18}{len(values):>7}{sum(values) / len(values):>8.2f}s"
+                  f"{percentile(values, 50):>8.2f}s{percentile(values, 95):>8.2f}s")
+
+def run_batch(inputs, output_path, api_key, workers=4, rpm=30, diagram_dir=None,
+              diagrams=True, recursive=False, tiled=False, quality_check=True, site=None, area=None, store=True):
+    """Analyse every image on a bounded worker pool, appending results to a JSONL file.
+    Images already recorded as ok in output_path are skipped, so a rerun resumes.
+    Successful analyses are also added to the results store, tagged with site and area"""
+    images = collect_images(inputs, recursive)
+    done, partial = load_checkpoint(output_path)
+    pending = [path for path in images if path not in done]
+    print(f"Found {len(images)} images, {len(images) - len(pending)} already done, {len(pending)} to process"
+          + (f" ({sum(1 for path in pending if path in partial)} only need diagrams re-rendered)" if partial else ""))
+
+    if diagram_dir:
+        os.makedirs(diagram_dir, exist_ok=True)
+
+    limiter = RateLimiter(rpm)
+    # Shared by all workers so near-duplicate images in the run are rejected too
+    quality_gate = QualityGate(reject_duplicates=True) if quality_check else None
+    results_store = get_results_store() if store else None
+    write_lock = threading.Lock()
+    records = []
+    start = time.perf_counter()
+
+    with open(output_path, "a", encoding="utf-8") as out, ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = [
+            executor.submit(rerender_one, partial[path], diagram_dir) if path in partial
+            else executor.submit(process_one, path, api_key, limiter, diagram_dir, diagrams, tiled, quality_gate)
+            for path in pending
+        ]
+        try:
+            for future in as_completed(futures):
+                record = future.result()
+                if results_store is not None:
+                    try:
+                        store_record(results_store, record, site, area)
+                    except Exception as e:
+                        print(f"Could not store {record['image']} in the results store: {e}")
+                with write_lock:
+                    # One line per finished image, flushed so an interrupted run loses nothing
+                    out.write(json.dumps(record) + "\n")
+                    out.flush()
+                records.append(record)
+                print(f"[{len(records)}/{len(pending)}] {record['status']}: {record['image']}"
+                      + (f" ({record['error']})" if record["error"] else ""))
+        except KeyboardInterrupt:
+            print("\nInterrupted, cancelling pending images. Rerun the same command to resume.")
+            for future in futures:
+                future.cancel()
+
+    print_summary(records, time.perf_counter() - start)
+    return records
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Batch Root Cause Analysis over directories of workplace images")
+    parser.add_argument("inputs", nargs="+", help="Image directories or glob patterns")
+    parser.add_argument("-o", "--output", default="rca_results.jsonl", help="JSONL results file, also used as the resume checkpoint")
+    parser.add_argument("-w", "--workers", type=int, default=4, help="Number of images processed concurrently")
+    parser.add_argument("--rpm", type=float, default=30, help="Maximum Groq requests per minute (0 disables the limit)")
+    parser.add_argument("--diagram-dir", default="rca_diagrams", help="Directory for rendered diagrams")
+    parser.add_argument("--no-diagrams", action="store_true", help="Only run the image analysis")
+    parser.add_argument("--tiled", action="store_true", help="Analyze large images as overlapping full-resolution tiles")
+    parser.add_argument("--no-quality-gate", action="store_true", help="Send every image to the model without the local blur/exposure/duplicate check")
+    parser.add_argument("--site", help="Site tag stored with every result")
+    parser.add_argument("--area", help="Area tag stored with every result")
+    parser.add_argument("--no-store", action="store_true", help="Do not add results to the persistent results store")
+    parser.add_argument("--trace", help="Append every pipeline span to this Chrome trace file (chrome://tracing, Perfetto)")
+    parser.add_argument("-r", "--recursive", action="store_true", help="Search input directories recursively")
+    parser.add_argument("--api-key", default=os.getenv("GROQ_API_KEY"), help="Groq API key (default: GROQ_API_KEY)")
+    args = parser.parse_args(argv)
+
+    if not args.api_key:
+        parser.error("a Groq API key is required, pass --api-key or set GROQ_API_KEY")
+    if args.trace:
+        rca_trace.set_trace_file(args.trace)
+
+    run_batch(args.inputs, args.output, args.api_key, workers=args.workers, rpm=args.rpm,
+              diagram_dir=args.diagram_dir, diagrams=not args.no_diagrams, recursive=args.recursive, tiled=args.tiled,
+              quality_check=not args.no_quality_gate, site=args.site, area=args.area, store=not args.no_store)
+
+if __name__ == "__main__":
+    main()
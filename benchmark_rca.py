@@ -0,0 +1,281 @@
+import argparse
+import itertools
+import json
+import os
+import platform
+import resource
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import redirect_stdout
+
+import cv2
+import numpy as np
+
+IMAGE_SIZES = [(640, 480), (1920, 1080), (4032, 3024)]
+CONCURRENCY = [1, 4, 8]
+ITERATIONS = 16
+# Relative change against the baseline that counts as a regression
+TOLERANCE = 0.2
+RSS_SAMPLE_SECONDS = 0.01
+BENCH_API_KEY = "benchmark"
+
+def synthetic_image(width, height, seed=0):
+    """JPEG of a cluttered scene: noise, shapes and lines, so it compresses like a real photo"""
+    rng = np.random.default_rng(seed)
+    img = rng.integers(60, 200, (height, width, 3), dtype=np.uint8)
+    img = cv2.GaussianBlur(img, (0, 0), 3)
+    for _ in range(40):
+        x, y = int(rng.integers(0, width)), int(rng.integers(0, height))
+        color = tuple(int(c) for c in rng.integers(0, 255, 3))
+        cv2.rectangle(img, (x, y), (x + width // 10, y + height // 12), color, -1)
+        cv2.line(img, (x, y), (int(rng.integers(0, width)), int(rng.integers(0, height))), color, 3)
+    return cv2.imencode(".jpg", img, [cv2.IMWRITE_JPEG_QUALITY, 90])[1].tobytes()
+
+def current_rss():
+    """Resident set size of this process in bytes"""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError):
+        # No /proc (macOS): fall back to the lifetime peak, reported in bytes there
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+class RssSampler:
+    """Peak RSS while a block runs, sampled from a background thread"""
+
+    def __init__(self, interval=RSS_SAMPLE_SECONDS):
+        self.interval = interval
+        self.start = self.peak = current_rss()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._sample, daemon=True)
+
+    def _sample(self):
+        while not self._stop.wait(self.interval):
+            self.peak = max(self.peak, current_rss())
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+        self.peak = max(self.peak, current_rss())
+
+def run_case(name, fn, iterations, concurrency):
+    """Call fn(i) iterations times on concurrency threads; latency, throughput and RSS of the case"""
+    # rca_metrics reads RCA_CACHE_DIR and RCA_METRICS_LOG on import, main sets them first
+    from rca_metrics import percentile
+    latencies, errors = [], []
+    lock = threading.Lock()
+
+    def call(i):
+        start = time.perf_counter()
+        try:
+            fn(i)
+        except Exception as e:
+            with lock:
+                errors.append(str(e))
+            return
+        with lock:
+            latencies.append(time.perf_counter() - start)
+
+    with RssSampler() as rss, ThreadPoolExecutor(max_workers=concurrency) as executor:
+        start = time.perf_counter()
+        list(executor.map(call, range(iterations)))
+        elapsed = time.perf_counter() - start
+
+    result = {
+        "case": name, "concurrency": concurrency, "ops": iterations, "errors": len(errors),
+        "seconds": elapsed, "throughput": len(latencies) / elapsed if elapsed else 0.0,
+        "peak_rss_mb": rss.peak / 2 ** 20, "rss_growth_mb": (rss.peak - rss.start) / 2 ** 20,
+    }
+    for q in (50, 95, 99):
+        result[f"p{q}"] = percentile(latencies, q) if latencies else None
+    if errors:
+        result["first_error"] = errors[0]
+    return result
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+def start_stub(port, latency, token_rate, error_rate, error_status, render_latency, timeout=30.0):
+    """Run groq_stub.py in its own process so its CPU and memory stay out of the measurements"""
+    stub = os.path.join(os.path.dirname(os.path.abspath(__file__)), "groq_stub.py")
+    process = subprocess.Popen([
+        sys.executable, stub, "--port", str(port), "--latency", str(latency), "--token-rate", str(token_rate),
+        "--error-rate", str(error_rate), "--error-status", str(error_status), "--render-latency", str(render_latency),
+    ])
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"Stub server exited with code {process.returncode}")
+        try:
+            with socket.create_connection(("127.0.0.1", port), timeout=0.5):
+                return process
+        except OSError:
+            time.sleep(0.1)
+    process.terminate()
+    raise RuntimeError(f"Stub server did not start on port {port}")
+
+def run_benchmark(sizes=IMAGE_SIZES, concurrency=CONCURRENCY, iterations=ITERATIONS, stages=None):
+    """Benchmark the pipeline stages against whatever GROQ_BASE_URL / RCA_KROKI_URL point at.
+    Imports happen here because the pipeline modules read their endpoints from the environment"""
+    from analyze_rca import (process_image, analyze_workplace, generate_analysis_mindmap, generate_improvement_wbs,
+                             generate_analysis_json, create_plantuml_diagram, structure_diagrams)
+    from groq_stub import STUB_ANALYSIS, STUB_STRUCTURE
+    from rca_schema import RootCauseAnalysis
+
+    images = {size: synthetic_image(*size) for size in sizes}
+    diagrams = structure_diagrams(RootCauseAnalysis.from_dict(STUB_STRUCTURE))
+    output_dir = tempfile.mkdtemp(prefix="rca_bench_")
+    renders = itertools.count()
+
+    def render(i):
+        # A unique trailing comment defeats the diagram cache without changing the diagram
+        number = next(renders)
+        name = list(diagrams)[number % len(diagrams)]
+        if create_plantuml_diagram(f"{diagrams[name]}\n' {number}", os.path.join(output_dir, f"{name}_{number}")) is None:
+            raise RuntimeError("render failed")
+
+    cases = []
+    for size, data in images.items():
+        label = f"{size[0]}x{size[1]}"
+        cases.append((f"process_image {label}", lambda i, data=data: process_image(data)))
+        cases.append((f"analyze_workplace {label}",
+                      lambda i, data=data: analyze_workplace(data, BENCH_API_KEY, use_cache=False)))
+    cases += [
+        ("generate_analysis_mindmap", lambda i: generate_analysis_mindmap(STUB_ANALYSIS, BENCH_API_KEY)),
+        ("generate_improvement_wbs", lambda i: generate_improvement_wbs(STUB_ANALYSIS, BENCH_API_KEY)),
+        ("generate_analysis_json", lambda i: generate_analysis_json(STUB_ANALYSIS, BENCH_API_KEY)),
+        ("create_plantuml_diagram", render),
+    ]
+
+    results = []
+    for name, fn in cases:
+        if stages and name.split()[0] not in stages:
+            continue
+        for level in concurrency:
+            # Pipeline progress prints would drown the table
+            with open(os.devnull, "w") as devnull, redirect_stdout(devnull):
+                if level == concurrency[0]:
+                    fn(-1)  # warm up clients, connection pools and lazy imports
+                result = run_case(name, fn, max(iterations, level), level)
+            results.append(result)
+            print_result(result)
+    return results
+
+def case_key(result):
+    return f"{result['case']} c{result['concurrency']}"
+
+def print_result(result):
+    latency = "".join(f"{result[f'p{q}'] * 1000:>9.1f}" if result[f"p{q}"] is not None else f"{'-':>9}"
+                      for q in (50, 95, 99))
+    print(f"{case_key(result):<36}{result['throughput']:>9.2f}{latency}{result['peak_rss_mb']:>10.1f}"
+          f"{result['errors']:>7}")
+
+def compare(results, baseline, tolerance=TOLERANCE):
+    """Regressions against a baseline run: slower p95, lower throughput or higher peak RSS"""
+    previous = {case_key(result): result for result in baseline["results"]}
+    regressions = []
+    for result in results:
+        before = previous.get(case_key(result))
+        if before is None:
+            continue
+        checks = [
+            ("p95", result["p95"], before["p95"], 1),
+            ("throughput", result["throughput"], before["throughput"], -1),
+            ("peak_rss_mb", result["peak_rss_mb"], before["peak_rss_mb"], 1),
+        ]
+        for metric, now, then, direction in checks:
+            if now is None or not then:
+                continue
+            change = (now - then) / then
+            if change * direction > tolerance:
+                regressions.append({"case": case_key(result), "metric": metric, "baseline": then, "current": now,
+                                    "change": change})
+    return regressions
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Offline pipeline benchmark against local Groq and PlantUML stand-ins")
+    parser.add_argument("--sizes", default=",".join(f"{w}x{h}" for w, h in IMAGE_SIZES), help="Image sizes, e.g. 640x480,1920x1080")
+    parser.add_argument("--concurrency", default=",".join(map(str, CONCURRENCY)), help="Concurrency levels, e.g. 1,4,8")
+    parser.add_argument("-n", "--iterations", type=int, default=ITERATIONS, help="Calls per case and concurrency level")
+    parser.add_argument("--stages", help="Only these cases, e.g. process_image,analyze_workplace")
+    parser.add_argument("--latency", type=float, default=0.2, help="Stub seconds before each chat response starts")
+    parser.add_argument("--token-rate", type=float, default=400, help="Stub streamed tokens per second (0 = unthrottled)")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Share of stub chat requests that fail")
+    parser.add_argument("--error-status", type=int, default=503, help="HTTP status of injected errors")
+    parser.add_argument("--render-latency", type=float, default=0.05, help="Seconds per fake PlantUML render")
+    parser.add_argument("--render-backends", default="local",
+                        help="Render backends to benchmark: local is the real pure-Python renderer, "
+                             "kroki is the stub's fake renderer (a fixed PNG after --render-latency)")
+    parser.add_argument("-o", "--output", default="benchmark_results.json", help="JSON file for this run's results")
+    parser.add_argument("--baseline", help="Earlier results file to compare against")
+    parser.add_argument("--save-baseline", help="Also write this run's results as the new baseline file")
+    parser.add_argument("--tolerance", type=float, default=TOLERANCE, help="Relative change that counts as a regression")
+    args = parser.parse_args(argv)
+
+    stub_settings = {"latency": args.latency, "token_rate": args.token_rate, "error_rate": args.error_rate,
+                     "error_status": args.error_status, "render_latency": args.render_latency}
+    port = free_port()
+    # Every endpoint and cache points at local, throwaway stand-ins before the pipeline is imported
+    os.environ["GROQ_BASE_URL"] = f"http://127.0.0.1:{port}"
+    os.environ["RCA_KROKI_URL"] = f"http://127.0.0.1:{port}/plantuml"
+    os.environ["RCA_RENDER_BACKENDS"] = args.render_backends
+    os.environ["RCA_CACHE_DIR"] = tempfile.mkdtemp(prefix="rca_bench_cache_")
+    os.environ["RCA_METRICS_LOG"] = ""
+
+    stub = start_stub(port, **stub_settings)
+    try:
+        fake = " (kroki is the stub's fake renderer)" if "kroki" in args.render_backends else ""
+        print(f"Render backends: {args.render_backends}{fake}")
+        print(f"{'case':<36}{'ops/s':>9}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'RSS MB':>10}{'errors':>7}")
+        results = run_benchmark(
+            sizes=[tuple(int(part) for part in size.split("x")) for size in args.sizes.split(",")],
+            concurrency=[int(level) for level in args.concurrency.split(",")],
+            iterations=args.iterations,
+            stages=args.stages.split(",") if args.stages else None,
+        )
+    finally:
+        stub.terminate()
+        stub.wait()
+
+    run = {
+        "created": time.time(), "python": platform.python_version(), "machine": platform.machine(),
+        "cpus": os.cpu_count(), "stub": stub_settings, "render_backends": args.render_backends, "results": results,
+    }
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(run, f, indent=2)
+    if args.save_baseline:
+        with open(args.save_baseline, "w", encoding="utf-8") as f:
+            json.dump(run, f, indent=2)
+    print(f"\nResults written to {args.output}")
+
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)
+        if baseline.get("stub") != stub_settings:
+            print("Warning: the baseline used different stub settings, comparisons may not be meaningful")
+        if baseline.get("render_backends") != args.render_backends:
+            print("Warning: the baseline used different render backends, render timings are not comparable")
+        regressions = compare(results, baseline, args.tolerance)
+        if not regressions:
+            print(f"No regressions against {args.baseline} (tolerance {args.tolerance:.0%})")
+            return 0
+        print(f"{len(regressions)} regressions against {args.baseline} (tolerance {args.tolerance:.0%}):")
+        for regression in regressions:
+            print(f"  {regression['case']}: {regression['metric']} {regression['baseline']:.3f} -> "
+                  f"{regression['current']:.3f} ({regression['change']:+.0%})")
+        return 1
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
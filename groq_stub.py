@@ -0,0 +1,161 @@
+import argparse
+import asyncio
+import io
+import json
+import random
+import time
+import uuid
+
+from starlette.applications import Starlette
+from starlette.responses import JSONResponse, Response, StreamingResponse
+from starlette.routing import Route
+
+from PIL import Image
+
+from rca_schema import RootCauseAnalysis
+
+# Simulated service behaviour, changed with configure() or the command line:
+# latency before the response headers (s), stall between the headers and the first streamed chunk (s),
+# as Groq does when a model is slow to start, the only model latency and stall apply to ("" = every model),
+# streaming speed (tokens/s, 0 = as fast as possible), share of chat requests failing with error_status,
+# and latency of the fake PlantUML renderer (s)
+SETTINGS = {"latency": 0.0, "stall": 0.0, "slow_model": "", "token_rate": 0.0, "error_rate": 0.0, "error_status": 503,
+            "render_latency": 0.0}
+CHUNK_CHARS = 32
+
+# Canned responses of the local Groq stand-in: a plain-text analysis for chat requests and
+# a valid root_cause_analysis document for JSON-mode requests
+STUB_ANALYSIS = """**Root Cause Analysis**
+
+1. **High**: Power cable run across the walkway.
+   - Immediate cause: extension lead used for a temporary machine.
+   - Root cause: no fixed power outlet near the workstation.
+   - Action: install an outlet and route the cable overhead.
+
+2. **Low**: Unlabelled storage bins.
+   - Immediate cause: labels missing after re-layout.
+   - Root cause: no 5S audit after layout changes.
+   - Action: relabel and add the check to the audit."""
+
+STUB_STRUCTURE = {"root_cause_analysis": {
+    "summary": {"estimated_resolution_timeframe": "2 weeks"},
+    "issues": {
+        "high": [{"problem_description": "Power cable across the walkway", "immediate_cause": "Temporary extension lead",
+                  "root_cause": "No fixed outlet near the workstation", "recommended_action": "Install outlet, route cable overhead",
+                  "timeline": "1 week", "responsible_party": "Maintenance"}],
+        "low": [{"problem_description": "Unlabelled storage bins", "immediate_cause": "Labels missing after re-layout",
+                 "root_cause": "No 5S audit after layout changes", "recommended_action": "Relabel bins, add audit step",
+                 "timeline": "1 month", "responsible_party": "Area lead"}],
+    },
+    "monitoring_areas": [{"area": "Walkways", "observation": "Temporary cabling", "potential_risk": "Trips",
+                          "prevention_measure": "Weekly walkway check"}],
+    "recommendations": {"immediate_actions": ["Remove the cable from the walkway"]},
+}}
+
+def configure(**settings):
+    unknown = set(settings) - set(SETTINGS)
+    if unknown:
+        raise ValueError(f"Unknown stub settings: {', '.join(sorted(unknown))}")
+    SETTINGS.update(settings)
+
+def stub_reply(payload):
+    if (payload.get("response_format") or {}).get("type") == "json_object":
+        return RootCauseAnalysis.from_dict(STUB_STRUCTURE).to_json()
+    return STUB_ANALYSIS
+
+def usage_for(payload, text):
+    # Rough token counts, enough for the metrics and cost paths
+    prompt_tokens = len(json.dumps(payload.get("messages", []))) // 4
+    return {"prompt_tokens": prompt_tokens, "completion_tokens": len(text) // 4,
+            "total_tokens": prompt_tokens + len(text) // 4}
+
+def chunk(completion_id, model, delta, finish_reason=None, usage=None):
+    data = {"id": completion_id, "object": "chat.completion.chunk", "created": int(time.time()), "model": model,
+            "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}]}
+    if usage is not None:
+        data["x_groq"] = {"id": completion_id, "usage": usage}
+    return f"data: {json.dumps(data)}\n\n"
+
+async def chat_completions(request):
+    payload = await request.json()
+    model = payload.get("model", "stub")
+    slow = not SETTINGS["slow_model"] or SETTINGS["slow_model"] == model
+    if slow and SETTINGS["latency"]:
+        await asyncio.sleep(SETTINGS["latency"])
+    if random.random() < SETTINGS["error_rate"]:
+        return JSONResponse({"error": {"message": "Injected stub error", "type": "stub_error"}},
+                            status_code=SETTINGS["error_status"])
+    text = stub_reply(payload)
+    completion_id = f"chatcmpl-{uuid.uuid4().hex[:12]}"
+    usage = usage_for(payload, text)
+
+    if not payload.get("stream"):
+        return JSONResponse({
+            "id": completion_id, "object": "chat.completion", "created": int(time.time()), "model": model,
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": text}, "finish_reason": "stop"}],
+            "usage": usage,
+        })
+
+    # Roughly 4 characters per token, as in usage_for
+    chunk_delay = CHUNK_CHARS / 4 / SETTINGS["token_rate"] if SETTINGS["token_rate"] else 0.0
+
+    async def events():
+        if slow and SETTINGS["stall"]:
+            await asyncio.sleep(SETTINGS["stall"])
+        yield chunk(completion_id, model, {"role": "assistant", "content": ""})
+        for start in range(0, len(text), CHUNK_CHARS):
+            if chunk_delay:
+                await asyncio.sleep(chunk_delay)
+            yield chunk(completion_id, model, {"content": text[start:start + CHUNK_CHARS]})
+        yield chunk(completion_id, model, {}, "stop", usage)
+        yield "data: [DONE]\n\n"
+
+    return StreamingResponse(events(), media_type="text/event-stream")
+
+def stub_png():
+    buffer = io.BytesIO()
+    Image.new("RGB", (64, 32), "white").save(buffer, format="PNG")
+    return buffer.getvalue()
+
+STUB_PNG = stub_png()
+
+async def render_diagram(request):
+    """Kroki-compatible POST /plantuml/{format}, use with RCA_KROKI_URL=http://HOST:PORT/plantuml"""
+    code = (await request.body()).decode("utf-8")
+    if SETTINGS["render_latency"]:
+        await asyncio.sleep(SETTINGS["render_latency"])
+    if request.path_params["format"] == "svg":
+        return Response(f'<svg xmlns="http://www.w3.org/2000/svg" width="64" height="32"><!-- {len(code)} --></svg>',
+                        media_type="image/svg+xml")
+    return Response(STUB_PNG, media_type="image/png")
+
+async def health(request):
+    return JSONResponse({"status": "ok", "settings": SETTINGS})
+
+app = Starlette(routes=[
+    Route("/healthz", health),
+    Route("/openai/v1/chat/completions", chat_completions, methods=["POST"]),
+    Route("/plantuml/{format}", render_diagram, methods=["POST"]),
+])
+
+def main(argv=None):
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description="Local stand-in for the Groq chat API, use with GROQ_BASE_URL=http://HOST:PORT")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8001)
+    parser.add_argument("--latency", type=float, default=0.0, help="Seconds before each chat response starts")
+    parser.add_argument("--stall", type=float, default=0.0,
+                        help="Seconds between the response headers and the first streamed chunk")
+    parser.add_argument("--slow-model", default="", help="Apply --latency and --stall only to requests for this model")
+    parser.add_argument("--token-rate", type=float, default=0.0, help="Streamed tokens per second (0 = unthrottled)")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Share of chat requests answered with --error-status")
+    parser.add_argument("--error-status", type=int, default=503, help="HTTP status of injected errors, e.g. 429, 500, 503")
+    parser.add_argument("--render-latency", type=float, default=0.0, help="Seconds per fake PlantUML render")
+    args = parser.parse_args(argv)
+    configure(latency=args.latency, stall=args.stall, slow_model=args.slow_model, token_rate=args.token_rate, error_rate=args.error_rate,
+              error_status=args.error_status, render_latency=args.render_latency)
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
+
+if __name__ == "__main__":
+    main()
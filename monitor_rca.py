@@ -0,0 +1,262 @@
+import argparse
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+
+import cv2
+import numpy as np
+
+from analyze_rca import analyze_workplace, merge_analyses
+from batch_rca import IMAGE_EXTENSIONS, RateLimiter
+from rca_cache import CACHE_DIR
+from rca_store import get_results_store
+
+STATE_DIR = os.path.join(CACHE_DIR, "monitor")
+
+# Share of the (downscaled) frame that must change before the vision model is called
+CHANGE_THRESHOLD = 0.02
+PIXEL_DELTA = 30
+COMPARE_WIDTH = 640
+MIN_REGION_AREA = 0.002
+MAX_REGIONS = 4
+REGION_PADDING = 0.1
+
+def compare_gray(frame):
+    """Small blurred grayscale copy of a frame, so sensor noise and JPEG artifacts don't count as change"""
+    height, width = frame.shape[:2]
+    scale = min(1.0, COMPARE_WIDTH / float(width))
+    small = cv2.resize(frame, (int(width * scale), int(height * scale)), interpolation=cv2.INTER_AREA)
+    return cv2.GaussianBlur(cv2.cvtColor(small, cv2.COLOR_BGR2GRAY), (5, 5), 0), scale
+
+def changed_regions(reference, frame, pixel_delta=PIXEL_DELTA, min_area=MIN_REGION_AREA, max_regions=MAX_REGIONS):
+    """Compare a frame with the camera's reference frame.
+    Returns the changed share of the frame and the largest changed regions as
+    full-resolution (x, y, w, h) boxes, biggest first"""
+    reference_gray, scale = compare_gray(reference)
+    gray, _ = compare_gray(frame)
+    if gray.shape != reference_gray.shape:
+        # Camera resolution changed, treat the whole frame as new
+        height, width = frame.shape[:2]
+        return 1.0, [(0, 0, width, height)]
+
+    _, mask = cv2.threshold(cv2.absdiff(reference_gray, gray), pixel_delta, 255, cv2.THRESH_BINARY)
+    # Join nearby blobs so one moved object gives one region
+    mask = cv2.dilate(mask, np.ones((5, 5), np.uint8), iterations=2)
+    change = np.count_nonzero(mask) / float(mask.size)
+
+    contours, _ = cv2.findContours(mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+    boxes = [cv2.boundingRect(contour) for contour in contours]
+    boxes = [box for box in boxes if box[2] * box[3] >= min_area * mask.size]
+    boxes.sort(key=lambda box: box[2] * box[3], reverse=True)
+    return change, [tuple(int(round(value / scale)) for value in box) for box in boxes[:max_regions]]
+
+def crop_region(frame, box, padding=REGION_PADDING):
+    """JPEG bytes of a padded crop, keeping some context around the change"""
+    x, y, w, h = box
+    height, width = frame.shape[:2]
+    pad_x, pad_y = int(w * padding), int(h * padding)
+    x0, y0 = max(0, x - pad_x), max(0, y - pad_y)
+    x1, y1 = min(width, x + w + pad_x), min(height, y + h + pad_y)
+    _, buffer = cv2.imencode(".jpg", frame[y0:y1, x0:x1], [cv2.IMWRITE_JPEG_QUALITY, 95])
+    return buffer.tobytes()
+
+class CameraState:
+    """Reference frame, last findings and counters of one camera, persisted in the state directory"""
+
+    def __init__(self, name, state_dir=STATE_DIR):
+        self.name = name
+        self.state_path = os.path.join(state_dir, f"{name}.json")
+        self.reference_path = os.path.join(state_dir, f"{name}.reference.png")
+        self.data = {"checks": 0, "llm_calls": 0, "last_findings": None, "last_analyzed_at": None,
+                     "last_change": None, "last_snapshot": None}
+        os.makedirs(state_dir, exist_ok=True)
+        if os.path.exists(self.state_path):
+            with open(self.state_path, encoding="utf-8") as f:
+                self.data.update(json.load(f))
+        self.reference = cv2.imread(self.reference_path) if os.path.exists(self.reference_path) else None
+
+    def save(self, reference=None):
+        if reference is not None:
+            self.reference = reference
+            cv2.imwrite(self.reference_path, reference)
+        # Write then rename so a crash never leaves a truncated state file
+        temp_path = self.state_path + ".tmp"
+        with open(temp_path, "w", encoding="utf-8") as f:
+            json.dump(self.data, f, indent=2)
+        os.replace(temp_path, self.state_path)
+
+class SnapshotFolder:
+    """Camera that drops periodic snapshots into a folder; only the newest unseen one is checked"""
+
+    def __init__(self, path):
+        self.path = path
+
+    def read(self, state):
+        snapshots = [os.path.join(self.path, name) for name in os.listdir(self.path)
+                     if os.path.splitext(name)[1].lower() in IMAGE_EXTENSIONS]
+        if not snapshots:
+            return None, None
+        latest = max(snapshots, key=lambda path: (os.path.getmtime(path), path))
+        seen = state.data.get("last_snapshot")
+        if seen and seen["path"] == latest and seen["mtime"] == os.path.getmtime(latest):
+            return None, None
+        state.data["last_snapshot"] = {"path": latest, "mtime": os.path.getmtime(latest)}
+        return cv2.imread(latest), latest
+
+    def close(self):
+        pass
+
+class StreamCamera:
+    """RTSP/HTTP stream (or anything cv2.VideoCapture opens), reconnecting when a read fails"""
+
+    def __init__(self, url, flush_frames=5):
+        self.url = url
+        self.flush_frames = flush_frames
+        self.capture = None
+
+    def read(self, state):
+        if self.capture is None or not self.capture.isOpened():
+            self.capture = cv2.VideoCapture(self.url)
+        # Drop frames buffered since the last poll so the check sees the current scene
+        for _ in range(self.flush_frames):
+            self.capture.grab()
+        ok, frame = self.capture.read()
+        if not ok:
+            self.close()
+            return None, None
+        return frame, self.url
+
+    def close(self):
+        if self.capture is not None:
+            self.capture.release()
+            self.capture = None
+
+def open_camera(source):
+    return SnapshotFolder(source) if os.path.isdir(source) else StreamCamera(source)
+
+def check_camera(name, camera, state, api_key, limiter=None, threshold=CHANGE_THRESHOLD):
+    """Check one camera once. The vision model is only called on the changed regions when the
+    change against the reference frame exceeds threshold; otherwise the last findings stand"""
+    frame, source = camera.read(state)
+    if frame is None:
+        return None
+
+    record = {"camera": name, "source": source, "checked_at": datetime.now(timezone.utc).isoformat(),
+              "change": None, "regions": [], "analyzed": False, "error": None}
+    state.data["checks"] += 1
+    start = time.perf_counter()
+    try:
+        if state.reference is None:
+            # First frame of a camera is analyzed whole and becomes its reference
+            record["change"] = 1.0
+            sections = [("Full scene", analyze_workplace(cv2.imencode(".jpg", frame)[1].tobytes(), api_key,
+                                                         rate_limiter=limiter))]
+            analyzed = 1
+        else:
+            record["change"], boxes = changed_regions(state.reference, frame)
+            record["regions"] = boxes
+            if record["change"] < threshold or not boxes:
+                state.save()
+                record["findings"] = state.data["last_findings"]
+                return finish_check(record, start)
+
+            with ThreadPoolExecutor(max_workers=len(boxes)) as executor:
+                analyses = list(executor.map(
+                    lambda box: analyze_workplace(crop_region(frame, box), api_key, rate_limiter=limiter), boxes
+                ))
+            sections = [(f"Changed region at x={x}, y={y}, {w}x{h}px", text)
+                        for (x, y, w, h), text in zip(boxes, analyses)]
+            analyzed = len(sections)
+            # The report is updated, not replaced: findings in areas that did not change still stand
+            if state.data["last_findings"]:
+                sections.insert(0, ("Previous findings (unchanged areas; where a changed region shows "
+                                    "otherwise, the changed region is current)", state.data["last_findings"]))
+
+        record["findings"] = "".join(merge_analyses(sections, api_key, limiter))
+        record["analyzed"] = True
+        state.data["llm_calls"] += analyzed + (1 if len(sections) > 1 else 0)
+        state.data["last_findings"] = record["findings"]
+        state.data["last_analyzed_at"] = record["checked_at"]
+        state.data["last_change"] = record["change"]
+        # The analyzed scene is the new baseline, later checks only pay for new changes
+        state.save(reference=frame)
+    except Exception as e:
+        record["error"] = str(e)
+        state.save()
+    return finish_check(record, start)
+
+def finish_check(record, start):
+    record["seconds"] = time.perf_counter() - start
+    return record
+
+def run_monitor(cameras, output_path, api_key, interval=60.0, threshold=CHANGE_THRESHOLD, rpm=30,
+                state_dir=STATE_DIR, once=False, site=None, store=True):
+    """Poll every camera each interval seconds, appending one JSONL record per new frame checked.
+    Analyzed checks are also added to the results store, with the camera name as area"""
+    results_store = get_results_store() if store else None
+    states = {name: CameraState(name, state_dir) for name in cameras}
+    sources = {name: open_camera(source) for name, source in cameras.items()}
+    limiter = RateLimiter(rpm)
+    print(f"Monitoring {len(cameras)} cameras every {interval:.0f}s (change threshold {threshold:.1%})")
+
+    try:
+        with open(output_path, "a", encoding="utf-8") as out:
+            while True:
+                started = time.monotonic()
+                for name, camera in sources.items():
+                    record = check_camera(name, camera, states[name], api_key, limiter, threshold)
+                    if record is None:
+                        continue
+                    if results_store is not None and record["analyzed"]:
+                        record["result_id"] = results_store.save_analysis(record["findings"], site=site, area=name,
+                                                                          source=record["source"], mode="monitor")
+                    out.write(json.dumps(record) + "\n")
+                    out.flush()
+                    status = "error" if record["error"] else "analyzed" if record["analyzed"] else "unchanged"
+                    print(f"{record['checked_at']} {name}: {status}, change {record['change']:.1%}"
+                          + (f", {len(record['regions'])} regions" if record["analyzed"] and record["regions"] else "")
+                          + (f" ({record['error']})" if record["error"] else ""))
+                if once:
+                    break
+                time.sleep(max(0.0, interval - (time.monotonic() - started)))
+    except KeyboardInterrupt:
+        print("\nStopped. Camera state is kept, the next run continues from the last reference frames.")
+    finally:
+        for camera in sources.values():
+            camera.close()
+
+    for name, state in states.items():
+        print(f"{name}: {state.data['checks']} checks, {state.data['llm_calls']} LLM calls")
+    return states
+
+def parse_camera(value):
+    name, separator, source = value.partition("=")
+    if not separator or not name or not source:
+        raise argparse.ArgumentTypeError("cameras are given as name=source")
+    return name, source
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Continuous Root Cause Analysis of fixed cameras, re-analyzing only changed regions")
+    parser.add_argument("cameras", nargs="+", type=parse_camera, help="name=source pairs, source is a snapshot folder or an RTSP/HTTP stream URL")
+    parser.add_argument("-o", "--output", default="rca_monitor.jsonl", help="JSONL file receiving one record per checked frame")
+    parser.add_argument("-i", "--interval", type=float, default=60, help="Seconds between checks of each camera")
+    parser.add_argument("-t", "--threshold", type=float, default=CHANGE_THRESHOLD, help="Changed share of the frame that triggers analysis")
+    parser.add_argument("--rpm", type=float, default=30, help="Maximum Groq requests per minute (0 disables the limit)")
+    parser.add_argument("--state-dir", default=STATE_DIR, help="Directory holding reference frames and per-camera state")
+    parser.add_argument("--site", help="Site tag stored with every analyzed check")
+    parser.add_argument("--no-store", action="store_true", help="Do not add analyzed checks to the persistent results store")
+    parser.add_argument("--once", action="store_true", help="Check every camera once and exit")
+    parser.add_argument("--api-key", default=os.getenv("GROQ_API_KEY"), help="Groq API key (default: GROQ_API_KEY)")
+    args = parser.parse_args(argv)
+
+    if not args.api_key:
+        parser.error("a Groq API key is required, pass --api-key or set GROQ_API_KEY")
+
+    run_monitor(dict(args.cameras), args.output, args.api_key, interval=args.interval, threshold=args.threshold,
+                rpm=args.rpm, state_dir=args.state_dir, once=args.once,
+                site=args.site, store=not args.no_store)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,414 @@
+import json
+import os
+import re
+import textwrap
+import time
+from functools import lru_cache
+from io import BytesIO
+from xml.sax.saxutils import escape
+
+from PIL import Image, ImageColor, ImageDraw, ImageFont
+
+from rca_clients import get_http_session, get_registry
+from resilience import CircuitBreaker, CircuitOpen, RetryableStatus, RETRYABLE_STATUS, call_with_retry
+
+KROKI_URL = os.getenv("RCA_KROKI_URL", "https://kroki.io/plantuml")
+
+# Shared by every KrokiBackend so an outage is detected across requests
+KROKI_BREAKER = CircuitBreaker("kroki", failure_threshold=3, reset_timeout=60.0)
+
+# Backends tried in order by render_plantuml, override with RCA_RENDER_BACKENDS=kroki,local
+DEFAULT_BACKENDS = os.getenv("RCA_RENDER_BACKENDS", "local,kroki")
+
+FONT_SIZE = 13
+FONT_FAMILY = "Helvetica, Arial, sans-serif"
+LINE_HEIGHT = 17
+PAD_X, PAD_Y = 10, 6
+H_GAP, V_GAP = 40, 12
+INDENT = 20
+MARGIN = 20
+WRAP_WIDTH = 40
+
+LINE_COLOR = "#181818"
+NODE_FILL = "#F1F1F1"
+TABLE_FILL = "#FFFFFF"
+TABLE_KEY_FILL = "#E2E2F0"
+
+BLOCK = re.compile(r"@start(mindmap|wbs|json)\b(.*?)@end\1", re.S)
+NODE_LINE = re.compile(r"^(\*+|\++|-+)(?:\[(#[0-9A-Za-z]+)\])?_?[<>]?\s*(.*)$")
+
+class DiagramNode:
+    """Box in a rendered tree. Plain nodes hold text lines, JSON tables hold (key, value lines, links_child) rows"""
+
+    def __init__(self, lines=None, fill=NODE_FILL, rows=None):
+        self.lines = lines or []
+        self.fill = fill
+        self.rows = rows
+        self.children = []
+        # Vertical offset inside the box where each child's edge starts (tables only)
+        self.link_offsets = []
+        self.x = self.y = self.w = self.h = 0
+
+@lru_cache(maxsize=None)
+def _font(size=FONT_SIZE):
+    try:
+        return ImageFont.load_default(size=size)
+    except TypeError:
+        # Pillow < 10.1 only ships the fixed bitmap font
+        return ImageFont.load_default()
+
+def text_width(text):
+    return _font().getlength(text)
+
+def wrap(text):
+    return textwrap.wrap(text, WRAP_WIDTH) or [""]
+
+def text_color(fill):
+    """Black or white text, whichever reads better on fill"""
+    try:
+        r, g, b = ImageColor.getrgb(fill)[:3]
+    except ValueError:
+        return "#000000"
+    return "#000000" if 0.299 * r + 0.587 * g + 0.114 * b >= 140 else "#FFFFFF"
+
+def extract_block(plantuml_code):
+    """Return (kind, body) of the first @startmindmap/@startwbs/@startjson block, or None"""
+    match = BLOCK.search(plantuml_code)
+    if match is None:
+        return None
+    return match.group(1), match.group(2)
+
+# Parsing
+
+def parse_tree(body):
+    """Parse '*'-depth node lines with optional [#color] into a DiagramNode tree"""
+    root = None
+    stack = []
+    lines = iter(body.splitlines())
+    for line in lines:
+        line = line.strip()
+        match = NODE_LINE.match(line)
+        if not match:
+            # Titles, skinparams and blank lines are outside the supported subset and skipped
+            continue
+        markers, color, text = match.groups()
+        depth = len(markers)
+
+        # Multi-line ':text;' labels
+        if text.startswith(":"):
+            parts = [text[1:]]
+            while not parts[-1].rstrip().endswith(";"):
+                parts.append(next(lines, ";").strip())
+            text = " ".join(parts).rstrip().rstrip(";")
+
+        node = DiagramNode(sum((wrap(part) for part in text.split("\\n")), []), color or NODE_FILL)
+        if depth == 1:
+            if root is not None:
+                raise ValueError("Diagram has more than one root node")
+            root = node
+            stack = [node]
+            continue
+        if root is None:
+            raise ValueError("Diagram does not start with a root node")
+
+        del stack[min(depth - 1, len(stack)):]
+        stack[-1].children.append(node)
+        stack.append(node)
+
+    if root is None:
+        raise ValueError("No diagram nodes found")
+    return root
+
+def _json_scalar(value):
+    if isinstance(value, str):
+        return value
+    if isinstance(value, (list, dict)):
+        return "[]" if isinstance(value, list) else "{}"
+    return json.dumps(value)
+
+def parse_json(body):
+    """Build a table tree from a JSON document, nested objects and arrays become child tables"""
+    return _json_node(json.loads(body))
+
+def _json_node(value):
+    node = DiagramNode(fill=TABLE_FILL, rows=[])
+    items = value.items() if isinstance(value, dict) else ((None, item) for item in value)
+    for key, item in items:
+        if isinstance(item, (dict, list)) and item:
+            node.rows.append((key, [""], True))
+            node.children.append(_json_node(item))
+        else:
+            node.rows.append((key, wrap(_json_scalar(item)), False))
+    return node
+
+# Layout
+
+def _size(node):
+    if node.rows is None:
+        node.w = max(text_width(line) for line in node.lines) + 2 * PAD_X
+        node.h = len(node.lines) * LINE_HEIGHT + 2 * PAD_Y
+    else:
+        key_width = max([text_width(str(key)) for key, _, _ in node.rows if key is not None] or [0])
+        value_width = max([text_width(line) for _, lines, _ in node.rows for line in lines] + [20])
+        node.key_width = key_width + 2 * PAD_X if key_width else 0
+        node.w = node.key_width + value_width + 2 * PAD_X
+        node.row_offsets = []
+        node.link_offsets = []
+        offset = 0
+        for key, lines, links_child in node.rows:
+            node.row_offsets.append(offset)
+            row_height = len(lines) * LINE_HEIGHT + 2 * PAD_Y
+            if links_child:
+                node.link_offsets.append(offset + row_height / 2)
+            offset += row_height
+        node.h = max(offset, LINE_HEIGHT + 2 * PAD_Y)
+    for child in node.children:
+        _size(child)
+
+def _walk(node, depth=0):
+    yield node, depth
+    for child in node.children:
+        yield from _walk(child, depth + 1)
+
+def layout_horizontal(root):
+    """Left-to-right tree: one column per depth, parents centred on their children"""
+    _size(root)
+    column_widths = {}
+    for node, depth in _walk(root):
+        column_widths[depth] = max(column_widths.get(depth, 0), node.w)
+    column_x = [MARGIN]
+    for depth in range(1, len(column_widths)):
+        column_x.append(column_x[-1] + column_widths[depth - 1] + H_GAP)
+
+    def subtree_height(node):
+        children = sum(subtree_height(child) for child in node.children) + V_GAP * max(0, len(node.children) - 1)
+        node.subtree_h = max(node.h, children)
+        return node.subtree_h
+
+    def place(node, depth, top):
+        node.x = column_x[depth]
+        node.y = top + (node.subtree_h - node.h) / 2
+        children = sum(child.subtree_h for child in node.children) + V_GAP * max(0, len(node.children) - 1)
+        child_top = top + (node.subtree_h - children) / 2
+        for child in node.children:
+            place(child, depth + 1, child_top)
+            child_top += child.subtree_h + V_GAP
+
+    subtree_height(root)
+    place(root, 0, MARGIN)
+
+    edges = []
+    for node, depth in _walk(root):
+        bend_x = column_x[depth] + column_widths[depth] + H_GAP / 2
+        for index, child in enumerate(node.children):
+            offset = node.link_offsets[index] if index < len(node.link_offsets) else node.h / 2
+            start = (node.x + node.w, node.y + offset)
+            end = (child.x, child.y + child.h / 2)
+            edges.append([start, (bend_x, start[1]), (bend_x, end[1]), end])
+    return edges
+
+def layout_wbs(root):
+    """Root on top, first level in a row, deeper levels stacked and indented under their branch"""
+    _size(root)
+    edges = []
+    branches = root.children
+    row_y = MARGIN + root.h + 2 * V_GAP
+    row_h = max([branch.h for branch in branches] or [0])
+
+    x = MARGIN
+    for branch in branches:
+        items = list(_walk(branch))
+        branch.x, branch.y = x, row_y
+        y = row_y + row_h + V_GAP
+        for node, depth in items[1:]:
+            node.x = x + INDENT * depth
+            node.y = y
+            y += node.h + V_GAP
+        for node, _ in items:
+            for child in node.children:
+                trunk_x = node.x + INDENT / 2
+                edges.append([(trunk_x, node.y + node.h), (trunk_x, child.y + child.h / 2),
+                              (child.x, child.y + child.h / 2)])
+        x += max(node.w + INDENT * depth for node, depth in items) + H_GAP
+
+    row_right = x - H_GAP if branches else MARGIN + root.w
+    root.x = (MARGIN + row_right) / 2 - root.w / 2
+    root.y = MARGIN
+
+    bus_y = row_y - V_GAP
+    root_x = root.x + root.w / 2
+    for branch in branches:
+        branch_x = branch.x + branch.w / 2
+        edges.append([(root_x, root.y + root.h), (root_x, bus_y), (branch_x, bus_y), (branch_x, branch.y)])
+
+    # A root wider than the first row would start left of the margin
+    shift = MARGIN - min(node.x for node, _ in _walk(root))
+    if shift > 0:
+        for node, _ in _walk(root):
+            node.x += shift
+        edges = [[(px + shift, py) for px, py in edge] for edge in edges]
+    return edges
+
+# Drawing
+
+def build_scene(plantuml_code):
+    """Parse and lay out supported PlantUML into (width, height, shapes).
+    Raises ValueError when the source is outside the supported subset"""
+    block = extract_block(plantuml_code)
+    if block is None:
+        raise ValueError("Only @startmindmap, @startwbs and @startjson diagrams are supported locally")
+    kind, body = block
+
+    if kind == "json":
+        root = parse_json(body)
+        edges = layout_horizontal(root)
+    else:
+        root = parse_tree(body)
+        edges = layout_wbs(root) if kind == "wbs" else layout_horizontal(root)
+
+    shapes = [("line", edge) for edge in edges]
+    for node, _ in _walk(root):
+        shapes.append(("rect", node.x, node.y, node.w, node.h, node.fill))
+        if node.rows is None:
+            for index, line in enumerate(node.lines):
+                baseline = node.y + PAD_Y + (index + 1) * LINE_HEIGHT - 4
+                shapes.append(("text", node.x + PAD_X, baseline, line, text_color(node.fill), False))
+            continue
+
+        if node.key_width:
+            shapes.append(("fill", node.x, node.y, node.key_width, node.h, TABLE_KEY_FILL))
+        for (key, lines, _), offset in zip(node.rows, node.row_offsets):
+            row_y = node.y + offset
+            if offset:
+                shapes.append(("line", [(node.x, row_y), (node.x + node.w, row_y)]))
+            if key is not None:
+                shapes.append(("text", node.x + PAD_X, row_y + PAD_Y + LINE_HEIGHT - 4, str(key), "#000000", True))
+            for index, line in enumerate(lines):
+                baseline = row_y + PAD_Y + (index + 1) * LINE_HEIGHT - 4
+                shapes.append(("text", node.x + node.key_width + PAD_X, baseline, line, "#000000", False))
+        if node.key_width:
+            shapes.append(("line", [(node.x + node.key_width, node.y), (node.x + node.key_width, node.y + node.h)]))
+        # Redraw the border over the key column fill
+        shapes.append(("rect", node.x, node.y, node.w, node.h, None))
+
+    width = max(node.x + node.w for node, _ in _walk(root)) + MARGIN
+    height = max(node.y + node.h for node, _ in _walk(root)) + MARGIN
+    return int(width), int(height), shapes
+
+def to_svg(scene):
+    width, height, shapes = scene
+    parts = [f'<svg xmlns="http://www.w3.org/2000/svg" width="{width}" height="{height}" '
+             f'viewBox="0 0 {width} {height}" font-family="{FONT_FAMILY}" font-size="{FONT_SIZE}">',
+             f'<rect width="{width}" height="{height}" fill="#FFFFFF"/>']
+    for shape in shapes:
+        if shape[0] == "line":
+            points = " ".join(f"{x:.1f},{y:.1f}" for x, y in shape[1])
+            parts.append(f'<polyline points="{points}" fill="none" stroke="{LINE_COLOR}"/>')
+        elif shape[0] == "rect":
+            _, x, y, w, h, fill = shape
+            parts.append(f'<rect x="{x:.1f}" y="{y:.1f}" width="{w:.1f}" height="{h:.1f}" rx="4" '
+                         f'fill="{escape(fill) if fill else "none"}" stroke="{LINE_COLOR}"/>')
+        elif shape[0] == "fill":
+            _, x, y, w, h, fill = shape
+            parts.append(f'<rect x="{x:.1f}" y="{y:.1f}" width="{w:.1f}" height="{h:.1f}" fill="{fill}"/>')
+        else:
+            _, x, y, text, color, bold = shape
+            weight = ' font-weight="bold"' if bold else ""
+            parts.append(f'<text x="{x:.1f}" y="{y:.1f}" fill="{color}"{weight}>{escape(text)}</text>')
+    parts.append("</svg>")
+    return "\n".join(parts).encode("utf-8")
+
+def to_png(scene):
+    width, height, shapes = scene
+    image = Image.new("RGB", (width, height), "#FFFFFF")
+    draw = ImageDraw.Draw(image)
+    font = _font()
+    for shape in shapes:
+        if shape[0] == "line":
+            draw.line(shape[1], fill=LINE_COLOR, width=1)
+        elif shape[0] == "rect":
+            _, x, y, w, h, fill = shape
+            draw.rounded_rectangle([x, y, x + w, y + h], radius=4, fill=fill, outline=LINE_COLOR)
+        elif shape[0] == "fill":
+            _, x, y, w, h, fill = shape
+            draw.rectangle([x + 1, y + 1, x + w - 1, y + h - 1], fill=fill)
+        else:
+            _, x, y, text, color, _ = shape
+            draw.text((x, y), text, fill=color, font=font, anchor="ls")
+    buffer = BytesIO()
+    image.save(buffer, format="PNG", optimize=False)
+    return buffer.getvalue()
+
+# Backends
+
+class RenderBackend:
+    """Turns PlantUML source into diagram bytes. render returns None when it cannot render"""
+    name = "base"
+
+    def supports(self, plantuml_code, output_format):
+        return True
+
+    def render(self, plantuml_code, output_format):
+        raise NotImplementedError
+
+class LocalBackend(RenderBackend):
+    """Pure-Python renderer for the mindmap, WBS and JSON subsets the prompts produce"""
+    name = "local"
+
+    def supports(self, plantuml_code, output_format):
+        return output_format in ("png", "svg") and extract_block(plantuml_code) is not None
+
+    def render(self, plantuml_code, output_format):
+        try:
+            scene = build_scene(plantuml_code)
+        except ValueError as e:
+            print(f"Local renderer skipped diagram: {e}")
+            return None
+        return to_svg(scene) if output_format == "svg" else to_png(scene)
+
+class KrokiBackend(RenderBackend):
+    """Remote PlantUML rendering through kroki.io"""
+    name = "kroki"
+
+    def __init__(self, url=KROKI_URL):
+        self.url = url
+
+    def render(self, plantuml_code, output_format):
+        timeout = get_registry().render_timeout
+
+        def post():
+            # Send POST request with PlantUML code
+            headers = {'Content-Type': 'text/plain'}
+            response = get_http_session().post(f"{self.url}/{output_format}", data=plantuml_code.encode("utf-8"),
+                                               headers=headers, timeout=timeout)
+            if response.status_code in RETRYABLE_STATUS:
+                raise RetryableStatus(response)
+            return response
+
+        try:
+            response = KROKI_BREAKER.call(
+                lambda: call_with_retry(post, max_attempts=3, deadline=time.monotonic() + 2 * timeout, stage="render")
+            )
+        except CircuitOpen as e:
+            print(f"Skipping kroki.io: {e}")
+            return None
+
+        if response.status_code == 200:
+            return response.content
+        print(f"Failed to generate diagram. Status code: {response.status_code}")
+        return None
+
+BACKENDS = {
+    "local": LocalBackend,
+    "kroki": KrokiBackend,
+}
+
+def register_backend(name, factory):
+    """Make a RenderBackend factory available to RCA_RENDER_BACKENDS / get_backends"""
+    BACKENDS[name] = factory
+
+def get_backends(names=DEFAULT_BACKENDS):
+    """Instantiate backends from a comma separated list of names, in fallback order"""
+    if isinstance(names, str):
+        names = [name.strip() for name in names.split(",") if name.strip()]
+    return [BACKENDS[name]() for name in names]
@@ -0,0 +1,104 @@
+import threading
+from collections import deque
+
+import cv2
+
+# All checks run on a small grayscale copy, thresholds below are calibrated for this width
+CHECK_WIDTH = 512
+
+# (reject below/above, flag below/above) per check
+BLUR_VARIANCE = (15.0, 60.0)
+DARK_MEAN = (25.0, 50.0)
+BRIGHT_MEAN = (235.0, 215.0)
+CLIPPED_SHARE = (0.85, 0.5)
+CONTRAST_STD = (8.0, 20.0)
+# Hamming distance between 64-bit difference hashes that counts as the same scene
+DUPLICATE_DISTANCE = 4
+RECENT_HASHES = 500
+
+class ImageRejected(ValueError):
+    """The image failed the local quality gate, carrying the gate's result"""
+
+    def __init__(self, result):
+        super().__init__("Image rejected: " + "; ".join(result["reasons"]))
+        self.result = result
+
+def check_gray(img):
+    """Downscaled grayscale copy used by every check"""
+    gray = img if img.ndim == 2 else cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
+    height, width = gray.shape[:2]
+    if width > CHECK_WIDTH:
+        gray = cv2.resize(gray, (CHECK_WIDTH, max(1, int(height * CHECK_WIDTH / width))), interpolation=cv2.INTER_AREA)
+    return gray
+
+def difference_hash(gray):
+    """64-bit dHash, near-identical frames differ in only a few bits"""
+    small = cv2.resize(gray, (9, 8), interpolation=cv2.INTER_AREA)
+    bits = (small[:, 1:] > small[:, :-1]).flatten()
+    return int("".join("1" if bit else "0" for bit in bits), 2)
+
+def image_metrics(gray):
+    histogram = cv2.calcHist([gray], [0], None, [256], [0, 256]).flatten() / gray.size
+    return {
+        "blur_variance": float(cv2.Laplacian(gray, cv2.CV_64F).var()),
+        "mean_brightness": float(gray.mean()),
+        "dark_share": float(histogram[:16].sum()),
+        "bright_share": float(histogram[240:].sum()),
+        "contrast_std": float(gray.std()),
+    }
+
+class QualityGate:
+    """Fast local pre-screen run before an image takes an LLM call.
+    check() returns {"status": "ok" | "borderline" | "rejected", "reasons", "warnings", "metrics"}.
+    Near-duplicates of recently checked images are rejected when reject_duplicates is set
+    (batch runs), otherwise only flagged"""
+
+    def __init__(self, reject_duplicates=False, recent=RECENT_HASHES):
+        self.reject_duplicates = reject_duplicates
+        self._hashes = deque(maxlen=recent)
+        self._lock = threading.Lock()
+
+    def check(self, img, label=None):
+        gray = check_gray(img)
+        values = image_metrics(gray)
+        reasons, warnings = [], []
+
+        def low(value, limits, message):
+            if value < limits[0]:
+                reasons.append(message)
+            elif value < limits[1]:
+                warnings.append(message)
+
+        def high(value, limits, message):
+            if value > limits[0]:
+                reasons.append(message)
+            elif value > limits[1]:
+                warnings.append(message)
+
+        low(values["contrast_std"], CONTRAST_STD, f"very low contrast or blank image (std {values['contrast_std']:.1f})")
+        # A blank frame is also "blurry", only report blur when there is content to be sharp
+        if values["contrast_std"] >= CONTRAST_STD[0]:
+            low(values["blur_variance"], BLUR_VARIANCE, f"image is blurry (Laplacian variance {values['blur_variance']:.0f})")
+        low(values["mean_brightness"], DARK_MEAN, f"image is too dark (mean brightness {values['mean_brightness']:.0f})")
+        high(values["mean_brightness"], BRIGHT_MEAN, f"image is overexposed (mean brightness {values['mean_brightness']:.0f})")
+        high(values["dark_share"], CLIPPED_SHARE, f"{values['dark_share']:.0%} of pixels are crushed to black")
+        high(values["bright_share"], CLIPPED_SHARE, f"{values['bright_share']:.0%} of pixels are blown out to white")
+
+        image_hash = difference_hash(gray)
+        values["hash"] = f"{image_hash:016x}"
+        with self._lock:
+            duplicate = next((seen for seen in self._hashes
+                              if bin(seen[0] ^ image_hash).count("1") <= DUPLICATE_DISTANCE), None)
+            # Only usable images count as seen, a rejected blurry shot must not block the retake
+            if duplicate is None and not reasons:
+                self._hashes.append((image_hash, label))
+        if duplicate is not None:
+            message = "near-duplicate of an image checked earlier" + (f" ({duplicate[1]})" if duplicate[1] else "")
+            (reasons if self.reject_duplicates else warnings).append(message)
+
+        status = "rejected" if reasons else "borderline" if warnings else "ok"
+        return {"status": status, "reasons": reasons, "warnings": warnings, "metrics": values}
+
+    def clear(self):
+        with self._lock:
+            self._hashes.clear()
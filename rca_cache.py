@@ -0,0 +1,136 @@
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+
+# Default location for the on-disk caches, override with RCA_CACHE_DIR
+CACHE_DIR = os.getenv("RCA_CACHE_DIR", ".rca_cache")
+
+def cache_key(*parts):
+    """SHA-256 over the given parts (bytes or str), used as a content address"""
+    digest = hashlib.sha256()
+    for part in parts:
+        if isinstance(part, str):
+            part = part.encode("utf-8")
+        # Length prefix keeps ("ab", "c") and ("a", "bc") apart
+        digest.update(str(len(part)).encode() + b":")
+        digest.update(part)
+    return digest.hexdigest()
+
+def file_cache_key(path, chunk_size=1024 * 1024):
+    """cache_key of a file's content, hashed in chunks instead of read into memory whole"""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        digest.update(str(os.fstat(f.fileno()).st_size).encode() + b":")
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+class ContentCache:
+    """Content-addressed SQLite store with size/age bounded LRU eviction and hit/miss counters"""
+
+    def __init__(self, path, max_bytes=256 * 1024 * 1024, max_age=30 * 24 * 3600):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self._lock = threading.Lock()
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        with self._connect() as conn:
+            conn.execute("""CREATE TABLE IF NOT EXISTS entries (
+                key TEXT PRIMARY KEY,
+                value BLOB NOT NULL,
+                size INTEGER NOT NULL,
+                created REAL NOT NULL,
+                accessed REAL NOT NULL)""")
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_entries_accessed ON entries (accessed)")
+            conn.execute("CREATE TABLE IF NOT EXISTS counters (name TEXT PRIMARY KEY, value INTEGER NOT NULL)")
+
+    def _connect(self):
+        return sqlite3.connect(self.path, timeout=30)
+
+    def _count(self, conn, name):
+        conn.execute("INSERT INTO counters (name, value) VALUES (?, 1) "
+                     "ON CONFLICT(name) DO UPDATE SET value = value + 1", (name,))
+
+    def get(self, key):
+        """Return the cached bytes for key, or None on a miss"""
+        now = time.time()
+        with self._lock, self._connect() as conn:
+            row = conn.execute("SELECT value, created FROM entries WHERE key = ?", (key,)).fetchone()
+            if row is not None and self.max_age and now - row[1] > self.max_age:
+                conn.execute("DELETE FROM entries WHERE key = ?", (key,))
+                row = None
+
+            if row is None:
+                self._count(conn, "misses")
+                return None
+
+            conn.execute("UPDATE entries SET accessed = ? WHERE key = ?", (now, key))
+            self._count(conn, "hits")
+            return bytes(row[0])
+
+    def put(self, key, value):
+        """Store bytes under key and evict expired and least recently used entries"""
+        if isinstance(value, str):
+            value = value.encode("utf-8")
+        now = time.time()
+        with self._lock, self._connect() as conn:
+            conn.execute("INSERT OR REPLACE INTO entries (key, value, size, created, accessed) "
+                         "VALUES (?, ?, ?, ?, ?)", (key, value, len(value), now, now))
+            self._evict(conn, now)
+
+    def _evict(self, conn, now):
+        if self.max_age:
+            conn.execute("DELETE FROM entries WHERE created < ?", (now - self.max_age,))
+
+        total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+
+        evicted = []
+        for key, size in conn.execute("SELECT key, size FROM entries ORDER BY accessed"):
+            if total <= self.max_bytes:
+                break
+            evicted.append((key,))
+            total -= size
+        conn.executemany("DELETE FROM entries WHERE key = ?", evicted)
+        conn.execute("INSERT INTO counters (name, value) VALUES ('evictions', ?) "
+                     "ON CONFLICT(name) DO UPDATE SET value = value + ?", (len(evicted), len(evicted)))
+
+    def stats(self):
+        """Entry count, stored bytes and hit/miss/eviction counters"""
+        with self._lock, self._connect() as conn:
+            entries, size = conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM entries").fetchone()
+            counters = dict(conn.execute("SELECT name, value FROM counters").fetchall())
+        hits = counters.get("hits", 0)
+        misses = counters.get("misses", 0)
+        return {
+            "entries": entries,
+            "bytes": size,
+            "max_bytes": self.max_bytes,
+            "hits": hits,
+            "misses": misses,
+            "evictions": counters.get("evictions", 0),
+            "hit_rate": hits / (hits + misses) if hits + misses else 0.0,
+        }
+
+    def clear(self):
+        """Drop all entries and reset the counters"""
+        with self._lock, self._connect() as conn:
+            conn.execute("DELETE FROM entries")
+            conn.execute("DELETE FROM counters")
+
+_caches = {}
+_caches_lock = threading.Lock()
+
+def get_cache(name, **kwargs):
+    """Process-wide ContentCache stored as <CACHE_DIR>/<name>.sqlite"""
+    with _caches_lock:
+        if name not in _caches:
+            _caches[name] = ContentCache(os.path.join(CACHE_DIR, f"{name}.sqlite"), **kwargs)
+        return _caches[name]
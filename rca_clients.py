@@ -0,0 +1,106 @@
+import os
+import threading
+from collections import OrderedDict
+
+import httpx
+import requests
+from dotenv import load_dotenv
+from groq import Groq
+from requests.adapters import HTTPAdapter
+
+# Load environment variables before reading the pool settings
+load_dotenv()
+
+# Pool and timeout defaults, overridable from the environment
+POOL_SIZE = int(os.getenv("RCA_HTTP_POOL_SIZE", "16"))
+GROQ_TIMEOUT = float(os.getenv("RCA_GROQ_TIMEOUT", "120"))
+CONNECT_TIMEOUT = float(os.getenv("RCA_CONNECT_TIMEOUT", "10"))
+RENDER_TIMEOUT = float(os.getenv("RCA_RENDER_TIMEOUT", "30"))
+MAX_API_KEYS = int(os.getenv("RCA_MAX_API_KEYS", "32"))
+# Point the Groq client at another OpenAI-compatible server, e.g. a local stub in tests
+GROQ_BASE_URL = os.getenv("GROQ_BASE_URL") or None
+
+class ClientRegistry:
+    """Keep-alive Groq clients keyed by API key plus one pooled requests.Session for the renderer.
+    Each client owns a bounded httpx pool, so sockets are reused and capped under load"""
+
+    def __init__(self, pool_size=POOL_SIZE, groq_timeout=GROQ_TIMEOUT, connect_timeout=CONNECT_TIMEOUT,
+                 render_timeout=RENDER_TIMEOUT, max_api_keys=MAX_API_KEYS):
+        self.pool_size = pool_size
+        self.groq_timeout = groq_timeout
+        self.connect_timeout = connect_timeout
+        self.render_timeout = render_timeout
+        self.max_api_keys = max_api_keys
+        self._clients = OrderedDict()
+        self._session = None
+        self._lock = threading.Lock()
+
+    def groq(self, api_key):
+        """Shared Groq client for api_key, least recently used keys are dropped past max_api_keys"""
+        with self._lock:
+            client = self._clients.get(api_key)
+            if client is not None:
+                self._clients.move_to_end(api_key)
+                return client
+
+            timeout = httpx.Timeout(self.groq_timeout, connect=self.connect_timeout)
+            http_client = httpx.Client(
+                timeout=timeout,
+                limits=httpx.Limits(max_connections=self.pool_size, max_keepalive_connections=self.pool_size),
+            )
+            # Retries are handled by resilience.call_with_retry, not inside the SDK
+            client = Groq(api_key=api_key, base_url=GROQ_BASE_URL, timeout=timeout, http_client=http_client,
+                          max_retries=0)
+            self._clients[api_key] = client
+
+            while len(self._clients) > self.max_api_keys:
+                # Not closed: another thread may still be streaming through it. Its pool is
+                # released once the last caller lets go of the client
+                self._clients.popitem(last=False)
+            return client
+
+    def session(self):
+        """Pooled requests.Session used for diagram rendering"""
+        with self._lock:
+            if self._session is None:
+                session = requests.Session()
+                adapter = HTTPAdapter(pool_connections=4, pool_maxsize=self.pool_size)
+                session.mount("https://", adapter)
+                session.mount("http://", adapter)
+                self._session = session
+            return self._session
+
+    def stats(self):
+        with self._lock:
+            return {
+                "groq_clients": len(self._clients),
+                "pool_size": self.pool_size,
+                "groq_timeout": self.groq_timeout,
+                "render_timeout": self.render_timeout,
+            }
+
+    def close(self):
+        with self._lock:
+            for client in self._clients.values():
+                client.close()
+            self._clients.clear()
+            if self._session is not None:
+                self._session.close()
+                self._session = None
+
+_registry = None
+_registry_lock = threading.Lock()
+
+def get_registry():
+    """Process-wide ClientRegistry"""
+    global _registry
+    with _registry_lock:
+        if _registry is None:
+            _registry = ClientRegistry()
+        return _registry
+
+def get_groq_client(api_key):
+    return get_registry().groq(api_key)
+
+def get_http_session():
+    return get_registry().session()
@@ -0,0 +1,217 @@
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+
+import rca_trace as trace
+from rca_cache import cache_key
+
+# Jobs running at once in this process, and at once for any single API key
+JOB_WORKERS = int(os.getenv("RCA_JOB_WORKERS", "8"))
+JOBS_PER_KEY = int(os.getenv("RCA_JOBS_PER_KEY", "2"))
+# Finished jobs kept for status polling before the oldest are dropped
+MAX_FINISHED_JOBS = int(os.getenv("RCA_MAX_FINISHED_JOBS", "500"))
+# Trace spans kept per job for its progress view
+MAX_JOB_SPANS = 200
+
+FINISHED = ("done", "error", "cancelled")
+
+class Job:
+    """One unit of background work and the state a UI polls: status, stage, progress,
+    streamed text, partial results and the final result or error"""
+
+    def __init__(self, kind, fn, key=None):
+        self.id = uuid.uuid4().hex[:12]
+        self.kind = kind
+        self.fn = fn
+        self.key = key
+        self.status = "queued"
+        self.stage = None
+        self.progress = 0.0
+        self.text = ""
+        self.partial = {}
+        self.report = {}
+        self.spans = []
+        self.result = None
+        self.error = None
+        self.exception = None
+        self.submitted_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self._lock = threading.Lock()
+
+    @property
+    def finished(self):
+        return self.status in FINISHED
+
+    def update(self, **fields):
+        with self._lock:
+            for name, value in fields.items():
+                setattr(self, name, value)
+
+    def append_text(self, delta):
+        with self._lock:
+            self.text += delta
+
+    def set_partial(self, name, value):
+        with self._lock:
+            self.partial[name] = value
+
+    def on_span(self, event):
+        """Trace listener: keep the job's spans, open ones with duration None"""
+        with self._lock:
+            if event["phase"] == "begin":
+                self.spans.append(event)
+                del self.spans[:-MAX_JOB_SPANS]
+            else:
+                for number in range(len(self.spans) - 1, -1, -1):
+                    if self.spans[number]["id"] == event["id"]:
+                        self.spans[number] = event
+                        break
+
+    def snapshot(self):
+        """Consistent copy of the observable state"""
+        with self._lock:
+            return {
+                "id": self.id, "kind": self.kind, "status": self.status, "stage": self.stage,
+                "progress": self.progress, "text": self.text, "partial": dict(self.partial), "spans": list(self.spans),
+                "result": self.result, "error": self.error,
+                "submitted_at": self.submitted_at, "started_at": self.started_at, "finished_at": self.finished_at,
+            }
+
+class JobQueue:
+    """Process-wide queue running jobs on a bounded worker pool.
+    At most max_workers jobs run at once, and at most per_key for the same API key;
+    jobs over either limit wait in submission order"""
+
+    def __init__(self, max_workers=JOB_WORKERS, per_key=JOBS_PER_KEY, max_finished=MAX_FINISHED_JOBS):
+        self.max_workers = max_workers
+        self.per_key = per_key
+        self.max_finished = max_finished
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="rca-job")
+        self._jobs = OrderedDict()
+        self._pending = deque()
+        self._running = {}
+        self._active = 0
+        self._lock = threading.Lock()
+
+    def submit(self, kind, fn, api_key=None):
+        """Queue fn(job) and return the job id right away"""
+        # Only a hash of the key is kept for the per-key limit
+        job = Job(kind, fn, cache_key(api_key)[:16] if api_key else None)
+        with self._lock:
+            self._jobs[job.id] = job
+            self._pending.append(job)
+            self._prune()
+        self._dispatch()
+        return job.id
+
+    def _dispatch(self):
+        with self._lock:
+            while self._active < self.max_workers:
+                job = next((job for job in self._pending
+                            if job.key is None or self._running.get(job.key, 0) < self.per_key), None)
+                if job is None:
+                    break
+                self._pending.remove(job)
+                self._active += 1
+                if job.key is not None:
+                    self._running[job.key] = self._running.get(job.key, 0) + 1
+                job.update(status="running", started_at=time.time())
+                self._executor.submit(self._run, job)
+
+    def _run(self, job):
+        try:
+            # Spans of the job, also from the threads it fans out to, drive its progress view
+            with trace.listen(job.on_span), trace.span(f"job:{job.kind}", job_id=job.id):
+                result = job.fn(job)
+            job.update(status="done", result=result, progress=1.0)
+        except Exception as e:
+            job.update(status="error", error=str(e), exception=e)
+        finally:
+            job.update(finished_at=time.time())
+            with self._lock:
+                self._active -= 1
+                if job.key is not None:
+                    self._running[job.key] -= 1
+                    if not self._running[job.key]:
+                        del self._running[job.key]
+            self._dispatch()
+
+    def _prune(self):
+        finished = [job_id for job_id, job in self._jobs.items() if job.finished]
+        for job_id in finished[:max(0, len(finished) - self.max_finished)]:
+            del self._jobs[job_id]
+
+    def get(self, job_id):
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def position(self, job_id):
+        """1-based place of a queued job in the wait line, None once it has started"""
+        with self._lock:
+            for number, job in enumerate(self._pending, 1):
+                if job.id == job_id:
+                    return number
+        return None
+
+    def cancel(self, job_id):
+        """Cancel a job that has not started yet, running jobs finish normally"""
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None or job not in self._pending:
+                return False
+            self._pending.remove(job)
+        job.update(status="cancelled", finished_at=time.time())
+        return True
+
+    def stats(self):
+        with self._lock:
+            jobs = list(self._jobs.values())
+            return {
+                "workers": self.max_workers,
+                "per_key": self.per_key,
+                "queued": len(self._pending),
+                "running": self._active,
+                "done": sum(1 for job in jobs if job.status == "done"),
+                "errors": sum(1 for job in jobs if job.status == "error"),
+            }
+
+def stream_job(make_events):
+    """Job function consuming an analyze_*_stream event generator into the job's state.
+    make_events(report) is called in the worker with the job's report dict"""
+    def run(job):
+        for event in make_events(job.report):
+            if event["type"] == "stage":
+                job.update(stage=event["stage"])
+            elif event["type"] in ("keyframe", "tile"):
+                job.update(progress=event["completed"] / event["total"])
+            elif event["type"] == "token":
+                job.append_text(event["text"])
+            elif event["type"] == "done":
+                return event["text"]
+    return run
+
+def collect_job(make_items, total):
+    """Job function collecting the (name, result) pairs of e.g. iter_artifacts as they finish"""
+    def run(job):
+        results = {}
+        for name, result in make_items():
+            results[name] = result
+            job.set_partial(name, result)
+            job.update(progress=len(results) / total)
+        return results
+    return run
+
+_queue = None
+_queue_lock = threading.Lock()
+
+def get_job_queue():
+    """The process-wide job queue"""
+    global _queue
+    with _queue_lock:
+        if _queue is None:
+            _queue = JobQueue()
+        return _queue
@@ -0,0 +1,3 @@
+# File types the pipeline accepts. Kept free of heavy imports so the app can build its
+# upload widget without loading OpenCV
+VIDEO_EXTENSIONS = {".mp4", ".mov", ".avi", ".mkv", ".m4v", ".webm"}
@@ -0,0 +1,131 @@
+import json
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+from rca_cache import CACHE_DIR
+
+# Recent calls kept in memory for the Settings view, every call is also appended to the log
+RING_SIZE = int(os.getenv("RCA_METRICS_RING_SIZE", "2000"))
+METRICS_LOG = os.getenv("RCA_METRICS_LOG", os.path.join(CACHE_DIR, "metrics.jsonl"))
+
+# USD per million (prompt, completion) tokens, used for the cost estimate
+MODEL_PRICES = {
+    "meta-llama/llama-4-scout-17b-16e-instruct": (0.11, 0.34),
+    "llama-3.1-8b-instant": (0.05, 0.08),
+    "llama-3.3-70b-versatile": (0.59, 0.79),
+}
+
+STAGES = ["analysis", "merge", "extract", "mindmap", "wbs", "json", "render"]
+
+_ring = deque(maxlen=RING_SIZE)
+_lock = threading.Lock()
+
+def estimate_cost(model, prompt_tokens, completion_tokens):
+    prices = MODEL_PRICES.get(model)
+    if prices is None or prompt_tokens is None:
+        return None
+    return (prompt_tokens * prices[0] + (completion_tokens or 0) * prices[1]) / 1_000_000
+
+def record(stage, **fields):
+    """Store one call record in the ring buffer and append it to the metrics log"""
+    entry = {"stage": stage, "timestamp": time.time()}
+    entry.update(fields)
+    if "cost_usd" not in entry and entry.get("model"):
+        entry["cost_usd"] = estimate_cost(entry["model"], entry.get("prompt_tokens"), entry.get("completion_tokens"))
+
+    with _lock:
+        _ring.append(entry)
+        if METRICS_LOG:
+            try:
+                directory = os.path.dirname(METRICS_LOG)
+                if directory:
+                    os.makedirs(directory, exist_ok=True)
+                with open(METRICS_LOG, "a", encoding="utf-8") as f:
+                    f.write(json.dumps(entry) + "\n")
+            except OSError as e:
+                print(f"Could not write metrics log: {e}")
+    return entry
+
+@contextmanager
+def measure(stage, **fields):
+    """Time a block and record it. The yielded dict can be filled with extra fields;
+    the outcome is 'ok' unless the block raised or set one"""
+    entry = dict(fields)
+    start = time.perf_counter()
+    try:
+        yield entry
+    except BaseException as e:
+        entry.setdefault("outcome", "cancelled" if isinstance(e, GeneratorExit) else "error")
+        if not isinstance(e, GeneratorExit):
+            entry.setdefault("error", str(e))
+        raise
+    finally:
+        entry.setdefault("outcome", "ok")
+        entry["wall_seconds"] = time.perf_counter() - start
+        record(stage, **entry)
+
+def recent(stage=None):
+    """Records currently held in the ring buffer, oldest first"""
+    with _lock:
+        entries = list(_ring)
+    return [entry for entry in entries if stage is None or entry["stage"] == stage]
+
+def percentile(values, q):
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(q / 100.0 * (len(ordered) - 1))))
+    return ordered[index]
+
+def summarize(entries=None):
+    """Per-stage call counts, p50/p95 latency, time to first byte and token/cost totals"""
+    entries = recent() if entries is None else entries
+    stages = STAGES + sorted({entry["stage"] for entry in entries} - set(STAGES))
+    rows = []
+    for stage in stages:
+        stage_entries = [entry for entry in entries if entry["stage"] == stage]
+        calls = [entry for entry in stage_entries if entry.get("outcome") != "retry"]
+        if not calls:
+            continue
+        # Cache hits cost nothing and would hide the real call latency
+        walls = [entry["wall_seconds"] for entry in calls
+                 if entry.get("wall_seconds") is not None and entry.get("outcome") != "cache"]
+        firsts = [entry["ttfb_seconds"] for entry in calls if entry.get("ttfb_seconds") is not None]
+        rows.append({
+            "stage": stage,
+            "models": ", ".join(sorted({entry["model"] for entry in calls if entry.get("model")})),
+            "calls": len(calls),
+            "cache_hits": sum(1 for entry in calls if entry.get("outcome") == "cache"),
+            "retries": len(stage_entries) - len(calls),
+            "errors": sum(1 for entry in calls if entry.get("outcome") not in ("ok", "cache")),
+            "fallbacks": sum(1 for entry in calls if entry.get("fallback_from")),
+            "p50_s": round(percentile(walls, 50), 3) if walls else None,
+            "p95_s": round(percentile(walls, 95), 3) if walls else None,
+            "p50_ttfb_s": round(percentile(firsts, 50), 3) if firsts else None,
+            "prompt_tokens": sum(entry.get("prompt_tokens") or 0 for entry in calls),
+            "completion_tokens": sum(entry.get("completion_tokens") or 0 for entry in calls),
+            "payload_kb": round(sum(entry.get("payload_bytes") or 0 for entry in calls) / 1024, 1),
+            "cost_usd": round(sum(entry.get("cost_usd") or 0 for entry in calls), 5),
+        })
+    return rows
+
+def load_log(path=METRICS_LOG, limit=None):
+    """Read records back from the append-only log, newest `limit` if given"""
+    if not path or not os.path.exists(path):
+        return []
+    with open(path, encoding="utf-8") as f:
+        lines = f.readlines()
+    if limit:
+        lines = lines[-limit:]
+    entries = []
+    for line in lines:
+        try:
+            entries.append(json.loads(line))
+        except json.JSONDecodeError:
+            continue
+    return entries
+
+def clear():
+    with _lock:
+        _ring.clear()
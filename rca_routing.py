@@ -0,0 +1,82 @@
+import json
+import os
+
+import rca_metrics as metrics
+
+# The vision analysis keeps the multimodal model; text-only formatting stages default to the
+# small fast text model, which is several times cheaper per token
+VISION_MODEL = os.getenv("RCA_VISION_MODEL", "meta-llama/llama-4-scout-17b-16e-instruct")
+TEXT_MODEL = os.getenv("RCA_TEXT_MODEL", "llama-3.1-8b-instant")
+
+# Prompts larger than this go to the stage's large_model, the small model has tighter
+# context and tokens-per-minute limits
+LARGE_PROMPT_BYTES = int(os.getenv("RCA_LARGE_PROMPT_BYTES", "24000"))
+# Seconds without a first chunk before a call with a fallback switches to it. Once a stage has
+# enough recent calls on a model, the timeout follows their p95 time to first byte instead
+FIRST_CHUNK_TIMEOUT = float(os.getenv("RCA_FIRST_CHUNK_TIMEOUT", "20"))
+MIN_FIRST_CHUNK_TIMEOUT = 5.0
+TIMEOUT_P95_FACTOR = 3.0
+TIMEOUT_MIN_SAMPLES = 20
+
+FORMATTING_ROUTE = {"model": TEXT_MODEL, "large_model": VISION_MODEL, "fallback": VISION_MODEL}
+
+DEFAULT_ROUTES = {
+    "analysis": {"model": VISION_MODEL},
+    # The merged report is what users read, it stays on the analysis model
+    "merge": {"model": VISION_MODEL},
+    "extract": FORMATTING_ROUTE,
+    "mindmap": FORMATTING_ROUTE,
+    "wbs": FORMATTING_ROUTE,
+    "json": FORMATTING_ROUTE,
+}
+ROUTE_SETTINGS = {"model", "large_model", "fallback", "timeout"}
+
+def load_routes(value=None):
+    """DEFAULT_ROUTES with per-stage overrides from RCA_MODEL_ROUTES, given as a JSON object or the
+    path of a JSON file, e.g. {"mindmap": {"model": "...", "fallback": null}, "wbs": "model-name"}"""
+    value = os.getenv("RCA_MODEL_ROUTES", "") if value is None else value
+    routes = {stage: dict(route) for stage, route in DEFAULT_ROUTES.items()}
+    if not value.strip():
+        return routes
+    if not value.lstrip().startswith("{"):
+        with open(value, encoding="utf-8") as f:
+            value = f.read()
+
+    for stage, override in json.loads(value).items():
+        if isinstance(override, str):
+            override = {"model": override}
+        unknown = set(override) - ROUTE_SETTINGS
+        if unknown:
+            raise ValueError(f"Unknown route settings for {stage}: {', '.join(sorted(unknown))}")
+        routes.setdefault(stage, {"model": VISION_MODEL}).update(override)
+    return routes
+
+ROUTES = load_routes()
+
+def first_chunk_timeout(stage, model):
+    """Seconds to wait for the first chunk of stage on model before falling back"""
+    values = [entry["ttfb_seconds"] for entry in metrics.recent(stage)
+              if entry.get("model") == model and entry.get("outcome") == "ok" and entry.get("ttfb_seconds") is not None]
+    if len(values) < TIMEOUT_MIN_SAMPLES:
+        return FIRST_CHUNK_TIMEOUT
+    return max(MIN_FIRST_CHUNK_TIMEOUT, TIMEOUT_P95_FACTOR * metrics.percentile(values, 95))
+
+def route(stage, prompt_bytes=0, routes=None):
+    """Model decision for one call: {"stage", "model", "reason", "fallback", "timeout"}.
+    Stages without a route use the vision model; timeout is None when there is no fallback"""
+    config = (routes or ROUTES).get(stage) or {"model": VISION_MODEL}
+    model, reason = config["model"], "stage"
+    if config.get("large_model") and prompt_bytes > LARGE_PROMPT_BYTES:
+        model, reason = config["large_model"], "large prompt"
+
+    fallback = config.get("fallback")
+    if fallback == model:
+        fallback = None
+    timeout = (config.get("timeout") or first_chunk_timeout(stage, model)) if fallback else None
+    return {"stage": stage, "model": model, "reason": reason, "fallback": fallback, "timeout": timeout}
+
+def routing_table(routes=None):
+    """One row per configured stage, for the Settings view"""
+    return [{"stage": stage, "model": config["model"], "large_model": config.get("large_model"),
+             "fallback": config.get("fallback"), "timeout": config.get("timeout")}
+            for stage, config in (routes or ROUTES).items()]
@@ -0,0 +1,255 @@
+import json
+from dataclasses import asdict, dataclass, field, fields
+from typing import List
+
+SEVERITIES = ("critical", "high", "medium", "low")
+
+# Mind map branch colours per severity, same scheme the LLM prompt asked for
+SEVERITY_COLORS = {
+    "critical": "#FF0000",
+    "high": "#FFA500",
+    "medium": "#FFFF00",
+    "low": "#00FF00",
+}
+SEVERITY_TITLES = {
+    "critical": "Critical Issues",
+    "high": "High Priority",
+    "medium": "Medium Priority",
+    "low": "Low Priority",
+}
+ID_PREFIXES = {"critical": "CRIT", "high": "HIGH", "medium": "MED", "low": "LOW"}
+MONITORING_COLOR = "#0000FF"
+
+WBS_PHASES = [
+    ("critical", "Phase 1: Critical Issues (Immediate)"),
+    ("high", "Phase 2: High Priority Fixes (Week 1-2)"),
+    ("medium", "Phase 3: Medium Priority (Month 1-2)"),
+    ("low", "Phase 4: Low Priority (Month 3-6)"),
+]
+
+def _text(value):
+    """Coerce a model-provided value to a single-line string"""
+    if value is None:
+        return ""
+    if isinstance(value, (list, dict)):
+        value = json.dumps(value)
+    return " ".join(str(value).split())
+
+def _text_list(value):
+    if value is None:
+        return []
+    if not isinstance(value, list):
+        value = [value]
+    return [_text(item) for item in value if _text(item)]
+
+def _record(cls, data, **extra):
+    """Build a flat string dataclass from a dict, ignoring unknown keys"""
+    if not isinstance(data, dict):
+        raise ValueError(f"Expected an object for {cls.__name__}, got {type(data).__name__}")
+    values = {f.name: _text(data.get(f.name)) for f in fields(cls) if f.name not in extra}
+    return cls(**values, **extra)
+
+@dataclass
+class Issue:
+    severity: str
+    issue_id: str = ""
+    problem_description: str = ""
+    immediate_cause: str = ""
+    root_cause: str = ""
+    severity_impact: str = ""
+    recommended_action: str = ""
+    timeline: str = ""
+    resources_needed: str = ""
+    responsible_party: str = ""
+
+@dataclass
+class MonitoringArea:
+    area: str = ""
+    observation: str = ""
+    potential_risk: str = ""
+    prevention_measure: str = ""
+
+@dataclass
+class Recommendations:
+    immediate_actions: List[str] = field(default_factory=list)
+    short_term_improvements: List[str] = field(default_factory=list)
+    long_term_strategies: List[str] = field(default_factory=list)
+    prevention_measures: List[str] = field(default_factory=list)
+
+@dataclass
+class Summary:
+    total_issues_identified: int = 0
+    critical_issues: int = 0
+    high_priority_issues: int = 0
+    medium_priority_issues: int = 0
+    low_priority_issues: int = 0
+    estimated_resolution_timeframe: str = ""
+    immediate_actions_required: int = 0
+
+@dataclass
+class RootCauseAnalysis:
+    summary: Summary
+    issues: List[Issue]
+    monitoring_areas: List[MonitoringArea]
+    recommendations: Recommendations
+
+    @classmethod
+    def from_dict(cls, data):
+        """Validate the model's root_cause_analysis JSON into typed records.
+        Summary counts are recomputed from the issues so they always match"""
+        if isinstance(data, dict) and "root_cause_analysis" in data:
+            data = data["root_cause_analysis"]
+        if not isinstance(data, dict):
+            raise ValueError("Structured analysis must be a JSON object")
+
+        raw_issues = data.get("issues") or {}
+        if not isinstance(raw_issues, dict):
+            raise ValueError("'issues' must map severities to lists of issues")
+
+        issues = []
+        for severity in SEVERITIES:
+            entries = raw_issues.get(severity) or []
+            if isinstance(entries, dict):
+                entries = [entries]
+            for number, entry in enumerate(entries, 1):
+                issue = _record(Issue, entry, severity=severity)
+                if not issue.problem_description and not issue.root_cause:
+                    # Unfilled template entries carry no finding
+                    continue
+                issue.issue_id = issue.issue_id or f"{ID_PREFIXES[severity]}-{number:03d}"
+                issues.append(issue)
+
+        monitoring = data.get("monitoring_areas") or []
+        if isinstance(monitoring, dict):
+            monitoring = [monitoring]
+        monitoring_areas = [area for area in (_record(MonitoringArea, entry) for entry in monitoring)
+                            if area.area or area.observation]
+
+        raw_recommendations = data.get("recommendations") or {}
+        if not isinstance(raw_recommendations, dict):
+            raise ValueError("'recommendations' must be an object")
+        recommendations = Recommendations(**{
+            f.name: _text_list(raw_recommendations.get(f.name)) for f in fields(Recommendations)
+        })
+
+        raw_summary = data.get("summary") if isinstance(data.get("summary"), dict) else {}
+        counts = {severity: sum(1 for issue in issues if issue.severity == severity) for severity in SEVERITIES}
+        try:
+            immediate = int(raw_summary.get("immediate_actions_required") or 0)
+        except (TypeError, ValueError):
+            immediate = 0
+        summary = Summary(
+            total_issues_identified=len(issues),
+            critical_issues=counts["critical"],
+            high_priority_issues=counts["high"],
+            medium_priority_issues=counts["medium"],
+            low_priority_issues=counts["low"],
+            estimated_resolution_timeframe=_text(raw_summary.get("estimated_resolution_timeframe")),
+            immediate_actions_required=immediate or len(recommendations.immediate_actions),
+        )
+        return cls(summary, issues, monitoring_areas, recommendations)
+
+    @classmethod
+    def from_json(cls, text):
+        try:
+            data = json.loads(text)
+        except json.JSONDecodeError as e:
+            raise ValueError(f"Model did not return valid JSON: {e}")
+        return cls.from_dict(data)
+
+    @classmethod
+    def template(cls):
+        """Empty schema, one placeholder issue per severity, as shown to the model"""
+        issues = [Issue(severity=severity, issue_id=f"{ID_PREFIXES[severity]}-001") for severity in SEVERITIES]
+        return cls(Summary(), issues, [MonitoringArea()], Recommendations())
+
+    def issues_for(self, severity):
+        return [issue for issue in self.issues if issue.severity == severity]
+
+    def to_dict(self):
+        """Nested root_cause_analysis document in the schema used by generate_analysis_json"""
+        issues = {}
+        for severity in SEVERITIES:
+            issues[severity] = []
+            for issue in self.issues_for(severity):
+                entry = asdict(issue)
+                del entry["severity"]
+                issues[severity].append(entry)
+        return {"root_cause_analysis": {
+            "summary": asdict(self.summary),
+            "issues": issues,
+            "monitoring_areas": [asdict(area) for area in self.monitoring_areas],
+            "recommendations": asdict(self.recommendations),
+        }}
+
+    def to_json(self, indent=2):
+        return json.dumps(self.to_dict(), indent=indent)
+
+def _label(text, fallback=""):
+    # Node text must stay on one line and must not look like a depth marker
+    return _text(text).lstrip("*+-_ ") or fallback
+
+def to_mindmap(analysis):
+    """Severity-coded PlantUML mind map of the findings"""
+    lines = ["@startmindmap", "* Root Cause Analysis"]
+    for severity in SEVERITIES:
+        lines.append(f"**[{SEVERITY_COLORS[severity]}] {SEVERITY_TITLES[severity]}")
+        issues = analysis.issues_for(severity)
+        if not issues:
+            lines.append("*** No issues identified")
+        for issue in issues:
+            lines.append(f"*** {issue.issue_id}: {_label(issue.problem_description, 'Unspecified problem')}")
+            for title, value in (("Immediate Cause", issue.immediate_cause), ("Root Cause", issue.root_cause),
+                                 ("Action", issue.recommended_action)):
+                if value:
+                    lines.append(f"**** {title}: {_label(value)}")
+
+    lines.append(f"**[{MONITORING_COLOR}] Monitoring Areas")
+    if not analysis.monitoring_areas:
+        lines.append("*** No monitoring areas identified")
+    for area in analysis.monitoring_areas:
+        lines.append(f"*** Observation: {_label(area.observation or area.area)}")
+        if area.potential_risk:
+            lines.append(f"**** Watch For: {_label(area.potential_risk)}")
+        if area.prevention_measure:
+            lines.append(f"**** Prevention: {_label(area.prevention_measure)}")
+    lines.append("@endmindmap")
+    return "\n".join(lines)
+
+def to_wbs(analysis):
+    """PlantUML WBS of the resolution project, one phase per severity plus prevention"""
+    lines = ["@startwbs", "* Root Cause Resolution Project"]
+    for severity, phase in WBS_PHASES:
+        lines.append(f"** {phase}")
+        issues = analysis.issues_for(severity)
+        if not issues:
+            lines.append("*** No actions required")
+        for issue in issues:
+            action = issue.recommended_action or issue.problem_description
+            lines.append(f"*** {issue.issue_id}: {_label(action, 'Resolve issue')}")
+            for title, value in (("Timeline", issue.timeline), ("Owner", issue.responsible_party),
+                                 ("Resources", issue.resources_needed)):
+                if value:
+                    lines.append(f"**** {title}: {_label(value)}")
+
+    lines.append("** Phase 5: Prevention & Monitoring (Ongoing)")
+    prevention = (analysis.recommendations.prevention_measures
+                  + [area.prevention_measure for area in analysis.monitoring_areas if area.prevention_measure]
+                  + analysis.recommendations.long_term_strategies)
+    if not prevention:
+        prevention = ["Regular Inspections", "Continuous Improvement"]
+    for task in prevention:
+        lines.append(f"*** {_label(task)}")
+    lines.append("@endwbs")
+    return "\n".join(lines)
+
+def to_json_diagram(analysis):
+    """PlantUML JSON diagram of the structured analysis"""
+    return f"@startjson\n{analysis.to_json()}\n@endjson"
+
+# Deterministic PlantUML generators per artifact name
+DIAGRAM_BUILDERS = {
+    "mindmap": to_mindmap,
+    "wbs": to_wbs,
+    "json": to_json_diagram,
+}
@@ -0,0 +1,281 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+from datetime import date, datetime
+
+from rca_cache import CACHE_DIR
+from rca_schema import SEVERITIES
+
+RESULTS_DB = os.getenv("RCA_RESULTS_DB", os.path.join(CACHE_DIR, "results.sqlite"))
+PAGE_SIZE = 25
+
+SCHEMA = [
+    """CREATE TABLE IF NOT EXISTS analyses (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        created REAL NOT NULL,
+        image_hash TEXT,
+        site TEXT,
+        area TEXT,
+        source TEXT,
+        mode TEXT,
+        analysis TEXT NOT NULL,
+        structure TEXT,
+        total_issues INTEGER NOT NULL DEFAULT 0,
+        critical INTEGER NOT NULL DEFAULT 0,
+        high INTEGER NOT NULL DEFAULT 0,
+        medium INTEGER NOT NULL DEFAULT 0,
+        low INTEGER NOT NULL DEFAULT 0)""",
+    # Site, area and date are copied onto issues so issue queries never need the join to filter
+    """CREATE TABLE IF NOT EXISTS issues (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        analysis_id INTEGER NOT NULL REFERENCES analyses (id) ON DELETE CASCADE,
+        created REAL NOT NULL,
+        site TEXT,
+        area TEXT,
+        severity TEXT NOT NULL,
+        issue_id TEXT,
+        problem_description TEXT,
+        immediate_cause TEXT,
+        root_cause TEXT,
+        recommended_action TEXT,
+        responsible_party TEXT)""",
+    """CREATE TABLE IF NOT EXISTS artifacts (
+        analysis_id INTEGER NOT NULL REFERENCES analyses (id) ON DELETE CASCADE,
+        name TEXT NOT NULL,
+        format TEXT,
+        code TEXT,
+        image BLOB,
+        path TEXT,
+        PRIMARY KEY (analysis_id, name))""",
+    "CREATE INDEX IF NOT EXISTS idx_analyses_created ON analyses (created)",
+    "CREATE INDEX IF NOT EXISTS idx_analyses_location ON analyses (site, area, created)",
+    "CREATE INDEX IF NOT EXISTS idx_analyses_image ON analyses (image_hash)",
+    "CREATE INDEX IF NOT EXISTS idx_issues_severity ON issues (severity, created)",
+    "CREATE INDEX IF NOT EXISTS idx_issues_location ON issues (site, area, severity, created)",
+    "CREATE INDEX IF NOT EXISTS idx_issues_analysis ON issues (analysis_id)",
+]
+
+def timestamp(value):
+    """Epoch seconds from an epoch number, a date/datetime or an ISO date string"""
+    if value is None or isinstance(value, (int, float)):
+        return value
+    if isinstance(value, str):
+        value = datetime.fromisoformat(value)
+    if not isinstance(value, datetime):
+        value = datetime(value.year, value.month, value.day)
+    return value.timestamp()
+
+def end_of_day(value):
+    """Inclusive upper bound: a plain date, or a date-only ISO string, covers the whole day"""
+    if isinstance(value, str):
+        try:
+            value = date.fromisoformat(value)
+        except ValueError:
+            pass
+    if isinstance(value, date) and not isinstance(value, datetime):
+        return timestamp(value) + 24 * 3600
+    return timestamp(value)
+
+def _filters(severity=None, since=None, until=None, site=None, area=None):
+    clauses, params = [], []
+    if severity:
+        severities = [severity] if isinstance(severity, str) else list(severity)
+        clauses.append(f"severity IN ({', '.join('?' * len(severities))})")
+        params += severities
+    if since is not None:
+        clauses.append("created >= ?")
+        params.append(timestamp(since))
+    if until is not None:
+        clauses.append("created < ?")
+        params.append(end_of_day(until))
+    if site:
+        clauses.append("site = ?")
+        params.append(site)
+    if area:
+        clauses.append("area = ?")
+        params.append(area)
+    return (" WHERE " + " AND ".join(clauses) if clauses else ""), params
+
+class ResultsStore:
+    """Persistent, indexed history of analyses with their parsed issues and rendered artifacts"""
+
+    def __init__(self, path=RESULTS_DB):
+        self.path = path
+        self._lock = threading.Lock()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            for statement in SCHEMA:
+                conn.execute(statement)
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=30)
+        conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA foreign_keys = ON")
+        return conn
+
+    def save_analysis(self, analysis_text, structure=None, image_hash=None, site=None, area=None,
+                      source=None, mode="image", artifacts=None, created=None):
+        """Store one analysis, its issues (from a RootCauseAnalysis) and artifacts; returns its id"""
+        created = timestamp(created) if created is not None else time.time()
+        with self._lock, self._connect() as conn:
+            cursor = conn.execute(
+                "INSERT INTO analyses (created, image_hash, site, area, source, mode, analysis) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (created, image_hash, site or None, area or None, source, mode, analysis_text)
+            )
+            analysis_id = cursor.lastrowid
+            if structure is not None:
+                self._write_structure(conn, analysis_id, structure)
+            for name, artifact in (artifacts or {}).items():
+                self._write_artifact(conn, analysis_id, name, artifact)
+        return analysis_id
+
+    def set_structure(self, analysis_id, structure):
+        """Replace the parsed issues of an analysis, e.g. once artifacts were extracted later"""
+        with self._lock, self._connect() as conn:
+            self._write_structure(conn, analysis_id, structure)
+
+    def add_artifacts(self, analysis_id, artifacts):
+        """Store {name: {"code", "image", "format", "path"}} artifacts of an analysis"""
+        with self._lock, self._connect() as conn:
+            for name, artifact in artifacts.items():
+                self._write_artifact(conn, analysis_id, name, artifact)
+
+    def _write_structure(self, conn, analysis_id, structure):
+        created, site, area = conn.execute("SELECT created, site, area FROM analyses WHERE id = ?",
+                                           (analysis_id,)).fetchone()
+        counts = {severity: len(structure.issues_for(severity)) for severity in SEVERITIES}
+        conn.execute(
+            "UPDATE analyses SET structure = ?, total_issues = ?, critical = ?, high = ?, medium = ?, low = ? "
+            "WHERE id = ?",
+            (structure.to_json(), len(structure.issues), counts["critical"], counts["high"],
+             counts["medium"], counts["low"], analysis_id)
+        )
+        conn.execute("DELETE FROM issues WHERE analysis_id = ?", (analysis_id,))
+        conn.executemany(
+            "INSERT INTO issues (analysis_id, created, site, area, severity, issue_id, problem_description, "
+            "immediate_cause, root_cause, recommended_action, responsible_party) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            [(analysis_id, created, site, area, issue.severity, issue.issue_id, issue.problem_description,
+              issue.immediate_cause, issue.root_cause, issue.recommended_action, issue.responsible_party)
+             for issue in structure.issues]
+        )
+
+    def _write_artifact(self, conn, analysis_id, name, artifact):
+        conn.execute(
+            "INSERT OR REPLACE INTO artifacts (analysis_id, name, format, code, image, path) VALUES (?, ?, ?, ?, ?, ?)",
+            (analysis_id, name, artifact.get("format", "png"), artifact.get("code"),
+             artifact.get("image"), artifact.get("path"))
+        )
+
+    def get(self, analysis_id):
+        """Full analysis record with parsed structure and artifact names, None if unknown"""
+        with self._lock, self._connect() as conn:
+            row = conn.execute("SELECT * FROM analyses WHERE id = ?", (analysis_id,)).fetchone()
+            if row is None:
+                return None
+            names = [r["name"] for r in conn.execute(
+                "SELECT name FROM artifacts WHERE analysis_id = ? AND (image IS NOT NULL OR path IS NOT NULL) "
+                "ORDER BY name", (analysis_id,))]
+        record = dict(row)
+        record["structure"] = json.loads(record["structure"]) if record["structure"] else None
+        record["artifacts"] = names
+        return record
+
+    def artifact(self, analysis_id, name):
+        """{"code", "image", "format", "path"} of one artifact; image bytes are read from path if needed"""
+        with self._lock, self._connect() as conn:
+            row = conn.execute("SELECT format, code, image, path FROM artifacts WHERE analysis_id = ? AND name = ?",
+                               (analysis_id, name)).fetchone()
+        if row is None:
+            return None
+        artifact = dict(row)
+        if artifact["image"] is None and artifact["path"] and os.path.exists(artifact["path"]):
+            with open(artifact["path"], "rb") as f:
+                artifact["image"] = f.read()
+        elif artifact["image"] is not None:
+            artifact["image"] = bytes(artifact["image"])
+        return artifact
+
+    def find_by_image(self, image_hash):
+        """Most recent analysis of an identical image, None if it was never analysed"""
+        with self._lock, self._connect() as conn:
+            row = conn.execute("SELECT id FROM analyses WHERE image_hash = ? ORDER BY created DESC LIMIT 1",
+                               (image_hash,)).fetchone()
+        return self.get(row["id"]) if row else None
+
+    def search(self, severity=None, since=None, until=None, site=None, area=None, limit=PAGE_SIZE, offset=0):
+        """One page of analyses, newest first, as {"items", "total", "offset", "limit"}.
+        severity keeps analyses with at least one issue of that severity (or any of several)"""
+        if severity:
+            severities = [severity] if isinstance(severity, str) else list(severity)
+            unknown = set(severities) - set(SEVERITIES)
+            if unknown:
+                raise ValueError(f"Unknown severity: {', '.join(sorted(unknown))}")
+            # Issues carry the analysis' date, site and area, so the whole filter runs on their indexes
+            issue_where, params = _filters(severities, since, until, site, area)
+            where = f" WHERE id IN (SELECT analysis_id FROM issues{issue_where})"
+        else:
+            where, params = _filters(None, since, until, site, area)
+        columns = ("id, created, image_hash, site, area, source, mode, total_issues, critical, high, medium, low, "
+                   "substr(analysis, 1, 200) AS preview")
+        with self._lock, self._connect() as conn:
+            total = conn.execute(f"SELECT COUNT(*) FROM analyses{where}", params).fetchone()[0]
+            rows = conn.execute(f"SELECT {columns} FROM analyses{where} ORDER BY created DESC, id DESC LIMIT ? OFFSET ?",
+                                params + [limit, offset]).fetchall()
+        return {"items": [dict(row) for row in rows], "total": total, "offset": offset, "limit": limit}
+
+    def issues(self, severity=None, since=None, until=None, site=None, area=None, limit=PAGE_SIZE, offset=0):
+        """One page of individual issues across analyses, newest first"""
+        where, params = _filters(severity, since, until, site, area)
+        with self._lock, self._connect() as conn:
+            total = conn.execute(f"SELECT COUNT(*) FROM issues{where}", params).fetchone()[0]
+            rows = conn.execute(f"SELECT * FROM issues{where} ORDER BY created DESC, id DESC LIMIT ? OFFSET ?",
+                                params + [limit, offset]).fetchall()
+        return {"items": [dict(row) for row in rows], "total": total, "offset": offset, "limit": limit}
+
+    def issue_rows(self, since=None, until=None, site=None, area=None):
+        """(analysis_id, created, site, area, severity, root_cause) tuples of every matching issue, for bulk loading"""
+        where, params = _filters(None, since, until, site, area)
+        with self._lock, self._connect() as conn:
+            conn.row_factory = None
+            return conn.execute(f"SELECT analysis_id, created, site, area, severity, root_cause FROM issues{where}",
+                                params).fetchall()
+
+    def analysis_rows(self, since=None, until=None, site=None, area=None):
+        """(id, created) tuples of every matching analysis, including those without issues"""
+        where, params = _filters(None, since, until, site, area)
+        with self._lock, self._connect() as conn:
+            conn.row_factory = None
+            return conn.execute(f"SELECT id, created FROM analyses{where}", params).fetchall()
+
+    def version(self):
+        """Changes whenever analyses are added, restructured or deleted, for caching derived views"""
+        with self._lock, self._connect() as conn:
+            return tuple(conn.execute("SELECT COUNT(*), MAX(id), (SELECT COUNT(*) FROM issues), "
+                                      "(SELECT MAX(id) FROM issues) FROM analyses").fetchone())
+
+    def locations(self):
+        """Known (site, area) pairs with their analysis counts, for filter menus"""
+        with self._lock, self._connect() as conn:
+            rows = conn.execute("SELECT site, area, COUNT(*) AS analyses FROM analyses "
+                                "GROUP BY site, area ORDER BY site, area").fetchall()
+        return [dict(row) for row in rows]
+
+    def delete(self, analysis_id):
+        with self._lock, self._connect() as conn:
+            conn.execute("DELETE FROM analyses WHERE id = ?", (analysis_id,))
+
+_stores = {}
+_stores_lock = threading.Lock()
+
+def get_results_store(path=RESULTS_DB):
+    """Process-wide store per database path"""
+    with _stores_lock:
+        if path not in _stores:
+            _stores[path] = ResultsStore(path)
+        return _stores[path]
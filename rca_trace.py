@@ -0,0 +1,162 @@
+import contextvars
+import itertools
+import json
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+from rca_metrics import percentile
+
+# Finished spans kept in memory for the Settings view and trace downloads
+RING_SIZE = int(os.getenv("RCA_TRACE_RING_SIZE", "5000"))
+# When set, every finished span is also appended to this Chrome trace file (JSON array format,
+# open it in chrome://tracing or ui.perfetto.dev)
+TRACE_FILE = os.getenv("RCA_TRACE_FILE") or None
+
+_ring = deque(maxlen=RING_SIZE)
+_lock = threading.Lock()
+_ids = itertools.count(1)
+_trace_file = TRACE_FILE
+
+_current = contextvars.ContextVar("rca_trace_span", default=None)
+_listeners = contextvars.ContextVar("rca_trace_listeners", default=())
+
+class Span:
+    """One timed operation with attributes such as bytes, dimensions or model"""
+
+    def __init__(self, name, parent=None, **attributes):
+        self.name = name
+        self.id = next(_ids)
+        self.parent_id = parent.id if parent is not None else None
+        self.trace_id = parent.trace_id if parent is not None else self.id
+        self.depth = parent.depth + 1 if parent is not None else 0
+        self.attributes = attributes
+        self.start = time.time()
+        self._start = time.perf_counter()
+        self.duration = None
+        self.error = None
+        self.pid = os.getpid()
+        self.tid = threading.get_ident()
+        self._listeners = _listeners.get()
+        self._notify("begin")
+
+    def set(self, **attributes):
+        self.attributes.update(attributes)
+
+    def end(self, error=None, **attributes):
+        if self.duration is not None:
+            return
+        self.attributes.update(attributes)
+        self.duration = time.perf_counter() - self._start
+        self.error = error
+        _finish(self)
+        self._notify("end")
+
+    def event(self, phase):
+        return {"type": "span", "phase": phase, "name": self.name, "id": self.id, "parent": self.parent_id,
+                "depth": self.depth, "start": self.start, "duration": self.duration, "error": self.error,
+                "attributes": dict(self.attributes)}
+
+    def _notify(self, phase):
+        for listener in self._listeners:
+            try:
+                listener(self.event(phase))
+            except Exception as e:
+                print(f"Trace listener failed: {e}")
+
+def start_span(name, **attributes):
+    """Begin a span under the current one without making it current; call .end() when done.
+    Use this for work that spans generator yields, use span() for plain blocks"""
+    return Span(name, _current.get(), **attributes)
+
+@contextmanager
+def span(name, **attributes):
+    """Time a block as a span nested under the current one; the yielded span takes more attributes"""
+    current = Span(name, _current.get(), **attributes)
+    token = _current.set(current)
+    try:
+        yield current
+    except BaseException as e:
+        current.end(error="cancelled" if isinstance(e, GeneratorExit) else str(e) or type(e).__name__)
+        raise
+    finally:
+        current.end()
+        try:
+            _current.reset(token)
+        except ValueError:
+            # Closed from another context (an abandoned generator), nothing left to restore here
+            pass
+
+@contextmanager
+def listen(callback):
+    """Call callback(event) for every span begin and end in this context and the threads it wraps"""
+    token = _listeners.set(_listeners.get() + (callback,))
+    try:
+        yield
+    finally:
+        _listeners.reset(token)
+
+def wrap(fn):
+    """fn bound to the caller's span and listeners, for work handed to a thread pool"""
+    context = contextvars.copy_context()
+
+    def run(*args, **kwargs):
+        # A context can only be entered by one thread at a time, each call gets its own copy
+        return context.copy().run(fn, *args, **kwargs)
+    return run
+
+def chrome_event(current):
+    args = dict(current.attributes, span_id=current.id, parent_id=current.parent_id, trace_id=current.trace_id)
+    if current.error:
+        args["error"] = current.error
+    return {"name": current.name, "cat": "rca", "ph": "X", "ts": int(current.start * 1e6),
+            "dur": int(current.duration * 1e6), "pid": current.pid, "tid": current.tid, "args": args}
+
+def _finish(current):
+    with _lock:
+        _ring.append(current)
+        if _trace_file:
+            try:
+                new_file = not os.path.exists(_trace_file) or not os.path.getsize(_trace_file)
+                with open(_trace_file, "a", encoding="utf-8") as f:
+                    # The array is never closed, trace viewers accept that so runs can keep appending
+                    f.write(("[\n" if new_file else "") + json.dumps(chrome_event(current), default=str) + ",\n")
+            except OSError as e:
+                print(f"Could not write trace file: {e}")
+
+def set_trace_file(path):
+    """Append finished spans to path from now on, None stops writing"""
+    global _trace_file
+    with _lock:
+        if path:
+            directory = os.path.dirname(path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+        _trace_file = path
+
+def recent(name=None):
+    """Finished spans held in the ring buffer, oldest first"""
+    with _lock:
+        spans = list(_ring)
+    return [current for current in spans if name is None or current.name == name]
+
+def export_chrome_trace(spans=None, path=None):
+    """Spans (default: the ring buffer) as Chrome trace JSON, written to path if given"""
+    data = json.dumps({"traceEvents": [chrome_event(current) for current in (spans if spans is not None else recent())],
+                       "displayTimeUnit": "ms"}, default=str)
+    if path:
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(data)
+    return data
+
+def summary(spans=None):
+    """Per span name: count, total, mean, p50 and p95 seconds, slowest total first"""
+    durations = {}
+    for current in (spans if spans is not None else recent()):
+        durations.setdefault(current.name, []).append(current.duration)
+    rows = [{"span": name, "count": len(values), "total_seconds": sum(values), "mean_seconds": sum(values) / len(values),
+             "p50_seconds": percentile(values, 50), "p95_seconds": percentile(values, 95)}
+            for name, values in durations.items()]
+    return sorted(rows, key=lambda row: row["total_seconds"], reverse=True)
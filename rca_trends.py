@@ -0,0 +1,159 @@
+import re
+import time
+from datetime import date, timedelta
+
+import numpy as np
+
+from rca_schema import SEVERITIES
+
+WEEK_SECONDS = 7 * 24 * 3600
+# 1970-01-05 was a Monday, weeks are counted from there so they start on Mondays (UTC)
+WEEK_ORIGIN = 4 * 24 * 3600
+WEEK_ORIGIN_DATE = date(1970, 1, 5)
+MOVING_AVERAGE_WEEKS = 4
+TOP_ROOT_CAUSES = 10
+
+def normalize_cause(text):
+    """Grouping key for a root cause: case, spacing and trailing punctuation do not matter"""
+    return re.sub(r"\s+", " ", (text or "").lower()).strip(" .;:,!")
+
+def encode(values):
+    """Dictionary-encode values into (int32 codes, labels) in order of first appearance"""
+    index = {}
+    codes = np.fromiter((index.setdefault(value, len(index)) for value in values), dtype=np.int32, count=len(values))
+    return codes, list(index)
+
+class IssueTable:
+    """Issues of many analyses as parallel NumPy columns: epoch seconds, severity index into
+    SEVERITIES and dictionary-encoded site, area and root cause"""
+
+    def __init__(self, analysis_id, created, severity, site, area, cause, sites, areas, causes, cause_labels,
+                 analysis_created):
+        self.analysis_id = analysis_id
+        self.created = created
+        self.severity = severity
+        self.site = site
+        self.area = area
+        self.cause = cause
+        self.sites = sites
+        self.areas = areas
+        self.causes = causes
+        self.cause_labels = cause_labels
+        # Every analysis, also those without issues, so weekly rates count clean audits too
+        self.analysis_created = analysis_created
+
+    def __len__(self):
+        return len(self.created)
+
+    @classmethod
+    def from_rows(cls, issue_rows, analysis_rows=()):
+        """Build from (analysis_id, created, site, area, severity, root_cause) and (id, created) tuples"""
+        severity_index = {severity: index for index, severity in enumerate(SEVERITIES)}
+        count = len(issue_rows)
+        analysis_id, created, site, area, severity, cause = zip(*issue_rows) if count else ((),) * 6
+
+        # Causes repeat a lot, so only each distinct text is normalized; a grouped cause is
+        # shown as written in its first occurrence
+        raw_codes, raw_causes = encode(cause)
+        group_codes, causes = encode([normalize_cause(text) for text in raw_causes])
+        cause_codes = group_codes[raw_codes] if count else raw_codes
+        cause_labels = [None] * len(causes)
+        for text, code in zip(raw_causes, group_codes.tolist()):
+            if cause_labels[code] is None:
+                cause_labels[code] = text
+
+        site_codes, sites = encode(site)
+        area_codes, areas = encode(area)
+        return cls(
+            np.fromiter(analysis_id, dtype=np.int64, count=count),
+            np.fromiter(created, dtype=np.float64, count=count),
+            np.fromiter((severity_index.get(value, len(SEVERITIES) - 1) for value in severity), dtype=np.int8, count=count),
+            site_codes, area_codes, cause_codes, sites, areas, causes, cause_labels,
+            np.fromiter((row[1] for row in analysis_rows), dtype=np.float64, count=len(analysis_rows)),
+        )
+
+    @classmethod
+    def load(cls, store, since=None, until=None, site=None, area=None):
+        """Load the matching issues of a ResultsStore in one query per table"""
+        return cls.from_rows(store.issue_rows(since, until, site, area), store.analysis_rows(since, until, site, area))
+
+def severity_counts(table):
+    """{severity: issue count}"""
+    counts = np.bincount(table.severity, minlength=len(SEVERITIES))
+    return dict(zip(SEVERITIES, counts.tolist()))
+
+def counts_by_area(table):
+    """{"areas": labels, "counts": areas x severities array}, busiest areas first"""
+    counts = np.bincount(table.area.astype(np.int64) * len(SEVERITIES) + table.severity,
+                         minlength=len(table.areas) * len(SEVERITIES)).reshape(len(table.areas), len(SEVERITIES))
+    order = np.argsort(-counts.sum(axis=1), kind="stable")
+    return {"areas": [table.areas[index] for index in order], "counts": counts[order]}
+
+def week_index(created):
+    return ((created - WEEK_ORIGIN) // WEEK_SECONDS).astype(np.int64)
+
+def weekly_counts(table):
+    """{"weeks": Monday dates, "counts": weeks x severities array, "analyses": analyses per week}.
+    Weeks without any analysis are included as zeros so series stay evenly spaced"""
+    issue_weeks = week_index(table.created)
+    analysis_weeks = week_index(table.analysis_created)
+    known = np.concatenate([issue_weeks, analysis_weeks])
+    if not len(known):
+        return {"weeks": [], "counts": np.zeros((0, len(SEVERITIES)), dtype=np.int64),
+                "analyses": np.zeros(0, dtype=np.int64)}
+
+    first, last = int(known.min()), int(known.max())
+    span = last - first + 1
+    counts = np.bincount((issue_weeks - first) * len(SEVERITIES) + table.severity,
+                         minlength=span * len(SEVERITIES)).reshape(span, len(SEVERITIES))
+    analyses = np.bincount(analysis_weeks - first, minlength=span)
+    weeks = [WEEK_ORIGIN_DATE + timedelta(weeks=first + offset) for offset in range(span)]
+    return {"weeks": weeks, "counts": counts, "analyses": analyses}
+
+def moving_average(values, window=MOVING_AVERAGE_WEEKS):
+    """Trailing mean over window points; the first points average what is available"""
+    values = np.asarray(values, dtype=np.float64)
+    if not len(values):
+        return values
+    sums = np.cumsum(values, axis=0)
+    sums[window:] = sums[window:] - sums[:-window]
+    sizes = np.minimum(np.arange(1, len(values) + 1), window)
+    return sums / (sizes if values.ndim == 1 else sizes[:, None])
+
+def top_root_causes(table, limit=TOP_ROOT_CAUSES):
+    """Most frequent root causes with their counts per severity and number of affected areas"""
+    if not len(table):
+        return []
+    named = np.array([bool(label) for label in table.causes])[table.cause]
+    codes, severities, areas = table.cause[named], table.severity[named], table.area[named]
+    totals = np.bincount(codes, minlength=len(table.causes))
+    top = np.argsort(-totals, kind="stable")[:limit]
+    top = top[totals[top] > 0]
+
+    by_severity = np.bincount(codes.astype(np.int64) * len(SEVERITIES) + severities,
+                              minlength=len(table.causes) * len(SEVERITIES)).reshape(-1, len(SEVERITIES))
+    # Distinct (cause, area) pairs, counted per cause
+    pairs = np.unique(codes.astype(np.int64) * max(1, len(table.areas)) + areas)
+    area_counts = np.bincount(pairs // max(1, len(table.areas)), minlength=len(table.causes))
+    return [{"root_cause": table.cause_labels[code], "count": int(totals[code]), "areas": int(area_counts[code]),
+             **dict(zip(SEVERITIES, by_severity[code].tolist()))} for code in top]
+
+def trend_report(table, window=MOVING_AVERAGE_WEEKS, limit=TOP_ROOT_CAUSES):
+    """Everything the Trends page shows, with the time the aggregation took"""
+    start = time.perf_counter()
+    weekly = weekly_counts(table)
+    totals = weekly["counts"].sum(axis=1)
+    per_analysis = totals / np.maximum(weekly["analyses"], 1)
+    report = {
+        "issues": len(table),
+        "analyses": len(table.analysis_created),
+        "severity": severity_counts(table),
+        "areas": counts_by_area(table),
+        "weekly": weekly,
+        "weekly_total_average": moving_average(totals, window),
+        "weekly_severity_average": moving_average(weekly["counts"], window),
+        "issues_per_analysis_average": moving_average(per_analysis, window),
+        "root_causes": top_root_causes(table, limit),
+    }
+    report["seconds"] = time.perf_counter() - start
+    return report
@@ -0,0 +1,212 @@
+import os
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from email.utils import parsedate_to_datetime
+
+import groq
+import httpx
+import requests
+
+import rca_metrics as metrics
+
+MAX_ATTEMPTS = int(os.getenv("RCA_MAX_ATTEMPTS", "4"))
+BASE_DELAY = float(os.getenv("RCA_RETRY_BASE_DELAY", "0.5"))
+MAX_DELAY = float(os.getenv("RCA_RETRY_MAX_DELAY", "30"))
+# Hedged duplicates are off by default since each one can cost a second LLM call
+HEDGE_REQUESTS = os.getenv("RCA_HEDGE_REQUESTS", "0") == "1"
+HEDGE_MIN_SAMPLES = int(os.getenv("RCA_HEDGE_MIN_SAMPLES", "20"))
+
+RETRYABLE_STATUS = {408, 409, 425, 429, 500, 502, 503, 504}
+
+class DeadlineExceeded(TimeoutError):
+    """The call's deadline passed before it could succeed"""
+
+class FirstChunkTimeout(TimeoutError):
+    """No first chunk arrived within the first-chunk timeout, see call_with_timeout"""
+
+class CircuitOpen(RuntimeError):
+    """The circuit breaker is rejecting calls until its reset timeout passes"""
+
+class RetryableStatus(Exception):
+    """Raised for an HTTP response that should be retried, carrying the response for Retry-After"""
+
+    def __init__(self, response):
+        super().__init__(f"HTTP {response.status_code}")
+        self.response = response
+
+def retry_after_seconds(error):
+    """Seconds requested by a Retry-After header on the error's response, if any"""
+    response = getattr(error, "response", None)
+    headers = getattr(response, "headers", None) or {}
+    value = headers.get("retry-after") or headers.get("Retry-After")
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+def is_retryable(error):
+    # A stream that stalls or drops before its first chunk surfaces as a raw httpx error,
+    # the SDK only wraps errors raised while the response headers are awaited
+    if isinstance(error, (RetryableStatus, groq.APITimeoutError, groq.APIConnectionError,
+                          httpx.TimeoutException, httpx.TransportError,
+                          requests.ConnectionError, requests.Timeout)):
+        return True
+    if isinstance(error, groq.APIStatusError):
+        return error.status_code in RETRYABLE_STATUS
+    return False
+
+def is_timeout(error):
+    # A late first chunk after the headers arrive is a raw httpx.ReadTimeout, not APITimeoutError
+    return isinstance(error, (FirstChunkTimeout, groq.APITimeoutError, httpx.TimeoutException, requests.Timeout))
+
+def backoff_delay(attempt, base_delay=BASE_DELAY, max_delay=MAX_DELAY):
+    """Full-jitter exponential backoff for the given 0-based retry attempt"""
+    return random.uniform(0, min(max_delay, base_delay * 2 ** attempt))
+
+def remaining(deadline):
+    """Seconds left until a time.monotonic() deadline, None when there is no deadline"""
+    return None if deadline is None else deadline - time.monotonic()
+
+def call_with_retry(fn, max_attempts=MAX_ATTEMPTS, deadline=None, stage=None, give_up=None):
+    """Call fn() until it succeeds, retrying transient errors with jittered exponential
+    backoff that honours Retry-After. deadline is an absolute time.monotonic() value.
+    Errors for which give_up(error) is true are raised at once, e.g. to switch to a fallback"""
+    attempt = 0
+    while True:
+        if deadline is not None and remaining(deadline) <= 0:
+            raise DeadlineExceeded("Deadline exceeded before the call could be made")
+        try:
+            return fn()
+        except Exception as e:
+            attempt += 1
+            if deadline is not None and remaining(deadline) <= 0 and is_retryable(e):
+                raise DeadlineExceeded(f"Deadline exceeded: {e}") from e
+            if not is_retryable(e) or attempt >= max_attempts or (give_up is not None and give_up(e)):
+                raise
+
+            delay = max(backoff_delay(attempt - 1), retry_after_seconds(e) or 0)
+            if deadline is not None and delay >= remaining(deadline):
+                raise DeadlineExceeded(f"Deadline exceeded while retrying: {e}") from e
+            if stage:
+                metrics.record(stage, outcome="retry", error=str(e), attempt=attempt, wait_seconds=delay)
+            time.sleep(delay)
+
+_hedge_pool = ThreadPoolExecutor(max_workers=16, thread_name_prefix="hedge")
+
+def hedge_threshold(stage, field="ttfb_seconds"):
+    """p95 of recent successful calls for a stage, or None without enough samples"""
+    values = [entry[field] for entry in metrics.recent(stage)
+              if entry.get("outcome") == "ok" and entry.get(field) is not None]
+    if len(values) < HEDGE_MIN_SAMPLES:
+        return None
+    return metrics.percentile(values, 95)
+
+def hedged_call(fn, hedge_after, discard=None):
+    """Run fn(); if it has not finished after hedge_after seconds, start one duplicate and
+    return whichever succeeds first. discard(result) is called on the losing result"""
+    if hedge_after is None:
+        return fn()
+
+    primary = _hedge_pool.submit(fn)
+    done, _ = wait([primary], timeout=hedge_after)
+    if done:
+        return primary.result()
+
+    pending = {primary, _hedge_pool.submit(fn)}
+    error = None
+    while pending:
+        done, pending = wait(pending, return_when=FIRST_COMPLETED)
+        for future in done:
+            if future.exception() is not None:
+                error = future.exception()
+                continue
+            for loser in pending:
+                if discard is not None:
+                    loser.add_done_callback(lambda f: f.exception() is None and discard(f.result()))
+                else:
+                    loser.cancel()
+            return future.result()
+    raise error
+
+# Separate from the hedge pool: a watched call may itself be hedged
+_watchdog_pool = ThreadPoolExecutor(max_workers=16, thread_name_prefix="first-chunk")
+
+def call_with_timeout(fn, timeout, discard=None):
+    """Run fn() and raise FirstChunkTimeout if it has not finished after timeout seconds.
+    Only this wait is bounded: the call keeps its own timeouts, and when it finishes late
+    discard(result) is called on its result"""
+    if timeout is None:
+        return fn()
+
+    future = _watchdog_pool.submit(fn)
+    done, _ = wait([future], timeout=timeout)
+    if done:
+        return future.result()
+    if discard is not None:
+        future.add_done_callback(lambda f: f.exception() is None and discard(f.result()))
+    raise FirstChunkTimeout(f"No first chunk within {timeout:.1f}s")
+
+class CircuitBreaker:
+    """Stops calling a failing dependency: opens after failure_threshold consecutive failures,
+    then lets a single trial call through once reset_timeout has passed"""
+
+    def __init__(self, name, failure_threshold=5, reset_timeout=60.0):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = None
+        self._trial_running = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        with self._lock:
+            if self.opened_at is None:
+                return "closed"
+            if time.monotonic() - self.opened_at >= self.reset_timeout:
+                return "half-open"
+            return "open"
+
+    def allow(self):
+        """Whether a call may go through now"""
+        with self._lock:
+            if self.opened_at is None:
+                return True
+            if time.monotonic() - self.opened_at < self.reset_timeout or self._trial_running:
+                return False
+            self._trial_running = True
+            return True
+
+    def success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+            self._trial_running = False
+
+    def failure(self):
+        with self._lock:
+            self.failures += 1
+            self._trial_running = False
+            if self.failures >= self.failure_threshold or self.opened_at is not None:
+                self.opened_at = time.monotonic()
+
+    def call(self, fn):
+        """Run fn() through the breaker, raising CircuitOpen while it is open"""
+        if not self.allow():
+            raise CircuitOpen(f"{self.name} circuit is open after {self.failures} failures")
+        try:
+            result = fn()
+        except Exception:
+            self.failure()
+            raise
+        self.success()
+        return result
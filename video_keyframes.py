@@ -0,0 +1,93 @@
+import heapq
+
+import cv2
+import numpy as np
+
+from rca_media import VIDEO_EXTENSIONS
+
+MAX_KEYFRAMES = 10
+SAMPLE_FPS = 2.0
+# Share of changed pixels / histogram distance from the last kept frame needed for a new keyframe
+CHANGE_THRESHOLD = 0.2
+PIXEL_DELTA = 25
+COMPARE_SIZE = (160, 90)
+# Keyframes are kept as JPEG bytes at this size at most, well above the vision payload budget
+KEYFRAME_MAX_PIXELS = 1920 * 1080
+
+def frame_signature(frame):
+    """Downscaled grayscale copy and normalized histogram used to compare frames cheaply"""
+    gray = cv2.cvtColor(cv2.resize(frame, COMPARE_SIZE, interpolation=cv2.INTER_AREA), cv2.COLOR_BGR2GRAY)
+    hist = cv2.calcHist([gray], [0], None, [64], [0, 256])
+    cv2.normalize(hist, hist)
+    return gray, hist
+
+def change_score(previous, current):
+    """0 for identical frames up to 1 for completely different ones: the larger of the
+    histogram (Bhattacharyya) distance and the share of pixels that changed noticeably"""
+    previous_gray, previous_hist = previous
+    gray, hist = current
+    hist_distance = cv2.compareHist(previous_hist, hist, cv2.HISTCMP_BHATTACHARYYA)
+    changed = np.count_nonzero(cv2.absdiff(previous_gray, gray) > PIXEL_DELTA) / gray.size
+    return float(max(hist_distance, changed))
+
+def encode_keyframe(frame, max_pixels=KEYFRAME_MAX_PIXELS):
+    height, width = frame.shape[:2]
+    scale = min(1.0, (max_pixels / float(width * height)) ** 0.5)
+    if scale < 1.0:
+        frame = cv2.resize(frame, (int(width * scale), int(height * scale)), interpolation=cv2.INTER_AREA)
+    _, buffer = cv2.imencode(".jpg", frame, [cv2.IMWRITE_JPEG_QUALITY, 90])
+    return buffer.tobytes()
+
+def select_keyframes(video_path, max_keyframes=MAX_KEYFRAMES, sample_fps=SAMPLE_FPS,
+                     threshold=CHANGE_THRESHOLD, stats=None):
+    """Pick up to max_keyframes representative frames from a video.
+    Frames are sampled at sample_fps (skipped frames are grabbed but never decoded), compared to
+    the last kept frame on a downscaled grayscale copy, and near-identical ones are dropped.
+    Only the max_keyframes biggest scene changes are kept, returned in time order as
+    dicts with index, timestamp, score and JPEG image bytes"""
+    capture = cv2.VideoCapture(video_path)
+    if not capture.isOpened():
+        raise ValueError("Could not open the video file. Please provide a valid video.")
+
+    fps = capture.get(cv2.CAP_PROP_FPS) or 25.0
+    stride = max(1, int(round(fps / sample_fps)))
+    kept = []
+    previous = None
+    index = -1
+    sampled = 0
+    try:
+        while capture.grab():
+            index += 1
+            if index % stride:
+                continue
+            ok, frame = capture.retrieve()
+            if not ok:
+                break
+            sampled += 1
+
+            signature = frame_signature(frame)
+            # The first frame always opens the first scene
+            score = 1.0 if previous is None else change_score(previous, signature)
+            if score < threshold:
+                continue
+            previous = signature
+
+            # Min-heap on score keeps memory bounded to max_keyframes encoded frames,
+            # a frame is only JPEG-encoded once it wins a slot
+            if len(kept) >= max_keyframes and score <= kept[0][0]:
+                continue
+            keyframe = {"index": index, "timestamp": index / fps, "score": score, "image": encode_keyframe(frame)}
+            if len(kept) < max_keyframes:
+                heapq.heappush(kept, (score, index, keyframe))
+            else:
+                heapq.heapreplace(kept, (score, index, keyframe))
+    finally:
+        capture.release()
+
+    if stats is not None:
+        stats.update({"frames": index + 1, "sampled": sampled, "fps": fps, "keyframes": len(kept)})
+    return [keyframe for _, _, keyframe in sorted(kept, key=lambda item: item[1])]
+
+def format_timestamp(seconds):
+    minutes, seconds = divmod(int(seconds), 60)
+    return f"{minutes:02d}:{seconds:02d}"